@@ -6,8 +6,11 @@
   not just characters as in regex.
   This code is based on Mark-Jason Dominus's article «How Regexes Work»,
   you can find it here: https://perl.plover.com/Regex/article.html
+  An Automata given MatchCounters counts the work done while matching (see MatchCounters and MatcherStats).
 """
 
+import threading
+
 # NFA - Nondeterministic Finite Automata (machine).
 
 # Used for defining custom operators.
@@ -36,13 +39,22 @@ class Cases:
 # Operator for joining cases, used like this: a |OR| b |OR| c.
 OR = Infix(lambda x, y: x.add(y) if isinstance(x, Cases) else Cases([x, y]))
 
+# All the primitives and patterns in the order of their definition,
+# their indexes (IDs) are used in the precompiled machines (see compiledPatterns.py).
+definedPrimitives = []
+definedPatterns = []
+
 # Primitives are used to test one token for some predicate.
 # In regex there's only one primitive — whether a token is equal to some character or not.
 # Examples of primitives: «is token a table column?», «is token's type — string» etc.
+# The vocabulary (if known) lists the words accepted by the primitive, it's used for suggestions.
 class Primitive:
-  def __init__(self, name, predicate):
+  def __init__(self, name, predicate, vocabulary=None):
     self.predicate = predicate
     self.name = name
+    self.vocabulary = vocabulary
+    self.ID = len(definedPrimitives)
+    definedPrimitives.append(self)
   def test(self, *args):
     return self.predicate(*args)
   def __str__(self):
@@ -130,12 +142,21 @@ def combineMachines(machines):
 # Example: p = Pattern('name', [a, b, c, (d, '+') |OR| e])
 # which gives you a regex «abc(d+|e)»,
 # where a, b, c, d and e are another patterns or primitives.
+# The machine is built on the first use, unless it's loaded from the precompiled machines.
 class Pattern:
   def __init__(self, name, pattern):
-    global stateID
-    stateID = 0
     self.name = name
-    self.machine = makeMachine(pattern)
+    self.definition = pattern
+    self.compiledMachine = None
+    self.ID = len(definedPatterns)
+    definedPatterns.append(self)
+  @property
+  def machine(self):
+    if (self.compiledMachine == None):
+      global stateID
+      stateID = 0
+      self.compiledMachine = makeMachine(self.definition)
+    return self.compiledMachine
   def __str__(self):
     return self.name
 
@@ -155,13 +176,23 @@ class PatternToken:
   def __str__(self):
     return f'{self.pattern}: {self.token.text}'
 
-# Used for storing linked matched tokens.
+# Used for storing linked matched tokens,
+# startIndex and endIndex are the indexes of the first and the last matched tokens (None before the first one).
 class CurrentState:
   def __init__(self, token, transition=None, previousState=None, patternsStack=[]):
     self.transition = transition
     self.token = token
     self.previousState = previousState
     self.patternsStack = patternsStack
+    self.startIndex = previousState.startIndex if previousState != None else None
+    self.endIndex = previousState.endIndex if previousState != None else None
+    if (token != None):
+      if (self.startIndex == None): self.startIndex = token.index
+      self.endIndex = token.index
+  # States with the same signature (the machine state to continue from and the states to return to
+  # after the subpatterns) match the same tokens from now on.
+  def signature(self):
+    return (self.transition.nextState, tuple(s.transition.nextState for s in self.patternsStack))
   def __str__(self):
     t = self.token.text if self.token != None else ''
     return f'== [{self.transition.pattern.name} ({len(self.patternsStack)}): {t}]\n{self.previousState}'
@@ -196,71 +227,252 @@ class CurrentState:
       if (state == None): break
     return ((min(indexes), max(indexes)), Structure(name, result[::-1]))
 
+# Counts of the work done by the automatas of one query (an Automata counts only when it's given the counters):
+# calls and matches of every primitive's test, the CurrentStates created by every automata (by it's pattern),
+# the peak and the total (over the tokens) number of it's current states, the epsilon-transitions followed
+# in the machine of every pattern and the number of the final states passed to the overlap resolution.
+class MatchCounters:
+  def __init__(self):
+    self.tests = {} # primitive -> [calls, matches]
+    self.states = {} # pattern of the automata -> [created, peak, total]
+    self.epsilons = {} # pattern -> expansions
+    self.finalStates = 0
+
+  # Counts a test of the primitive.
+  def countTest(self, primitive, matched):
+    counts = self.tests.get(primitive.name)
+    if (counts == None): counts = self.tests[primitive.name] = [0, 0]
+    counts[0] += 1
+    if (matched): counts[1] += 1
+
+  # Counts a CurrentState created by the automata of the pattern.
+  def countState(self, pattern):
+    counts = self.states.get(pattern.name)
+    if (counts == None): counts = self.states[pattern.name] = [0, 0, 0]
+    counts[0] += 1
+
+  # Counts the current states of the automata of the pattern after a token.
+  def countActive(self, pattern, active):
+    counts = self.states.get(pattern.name)
+    if (counts == None): counts = self.states[pattern.name] = [0, 0, 0]
+    counts[1] = max(counts[1], active)
+    counts[2] += active
+
+  # Counts an epsilon-transition of the pattern's machine.
+  def countEpsilon(self, pattern):
+    self.epsilons[pattern.name] = self.epsilons.get(pattern.name, 0) + 1
+
+  def toDict(self):
+    return {
+      'tests': { name: { 'calls': calls, 'matches': matches } for (name, (calls, matches)) in self.tests.items() },
+      'states': {
+        name: { 'created': created, 'peak': peak, 'total': total }
+        for (name, (created, peak, total)) in self.states.items()
+      },
+      'epsilons': dict(self.epsilons),
+      'finalStates': self.finalStates
+    }
+
+# Aggregated counts of the queries (see MatchCounters): the sums, the maximums of the peaks
+# and of the final states, and the number of the queries.
+class MatcherStats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.reset()
+
+  # Adds the counts of a query.
+  def add(self, counters):
+    with self.lock:
+      self.queries += 1
+      for (name, (calls, matches)) in counters.tests.items():
+        counts = self.tests.setdefault(name, [0, 0])
+        counts[0] += calls
+        counts[1] += matches
+      for (name, (created, peak, total)) in counters.states.items():
+        counts = self.states.setdefault(name, [0, 0, 0])
+        counts[0] += created
+        counts[1] = max(counts[1], peak)
+        counts[2] += total
+      for (name, expansions) in counters.epsilons.items():
+        self.epsilons[name] = self.epsilons.get(name, 0) + expansions
+      self.finalStates += counters.finalStates
+      self.maxFinalStates = max(self.maxFinalStates, counters.finalStates)
+
+  # Forgets the counts.
+  def reset(self):
+    with self.lock:
+      self.queries = 0
+      self.tests = {}
+      self.states = {}
+      self.epsilons = {}
+      self.finalStates = 0
+      self.maxFinalStates = 0
+
+  # The counts (with the averages per query), the costliest first, limit is the number of the primitives shown.
+  def stats(self, limit=None):
+    with self.lock:
+      perQuery = lambda value: value / self.queries if self.queries > 0 else None
+      tests = sorted(self.tests.items(), key = lambda item: -item[1][0])[:limit]
+      return {
+        'queries': self.queries,
+        'tests': [
+          { 'primitive': name, 'calls': calls, 'matches': matches, 'callsPerQuery': perQuery(calls) }
+          for (name, (calls, matches)) in tests
+        ],
+        'states': [
+          { 'pattern': name, 'created': created, 'peak': peak, 'total': total, 'createdPerQuery': perQuery(created) }
+          for (name, (created, peak, total)) in sorted(self.states.items(), key = lambda item: -item[1][0])
+        ],
+        'epsilons': [
+          { 'pattern': name, 'expansions': expansions, 'perQuery': perQuery(expansions) }
+          for (name, expansions) in sorted(self.epsilons.items(), key = lambda item: -item[1])
+        ],
+        'finalStates': { 'total': self.finalStates, 'max': self.maxFinalStates, 'perQuery': perQuery(self.finalStates) }
+      }
+
 # Used for running a pattern on a list of tokens.
+# In the «all» mode every path is kept and every match ends up in finalStates.
+# In the «longest» mode (leftmost-longest, as in POSIX) the states with the same signature are merged
+# keeping the one which started leftmost, and the matches overlapping a longer match are dropped,
+# so the number of the current states is bounded by the size of the pattern.
+# The work is counted in counters (MatchCounters) if they are given.
 class Automata:
-  def __init__(self, pattern):
+  def __init__(self, pattern, mode='all', counters=None):
     self.pattern = pattern
+    self.mode = mode
+    self.counters = counters
     self.finalStates = set()
-    self.currentStates = set()
+    self.currentStates = {} # signature (the state itself in the «all» mode) -> state
   def feedToken(self, token):
-    currentStates = set(self.currentStates)
-    self.currentStates = set()
+    currentStates = list(self.currentStates.values())
+    self.currentStates = {}
     for state in currentStates:
       for transition in state.transition.nextState.transitions:
         self.processTransition(transition, token, state)
     for transition in self.pattern.machine.transitions:
       self.processTransition(transition, token)
+    if (self.counters != None): self.counters.countActive(self.pattern, len(self.currentStates))
+  # Makes a CurrentState (counting it).
+  def makeState(self, token, transition, previousState, patternsStack):
+    if (self.counters != None): self.counters.countState(self.pattern)
+    return CurrentState(token, transition, previousState, patternsStack)
   def __str__(self):
     return "\n\n".join([str(state) for state in self.finalStates])
+  # Adds a state waiting for the next token.
+  def addCurrent(self, state):
+    if (self.mode == 'all'):
+      self.currentStates[state] = state
+      return
+    key = state.signature()
+    other = self.currentStates.get(key)
+    if (other == None or state.startIndex < other.startIndex):
+      self.currentStates[key] = state
+  # Adds a finished match.
+  def addFinal(self, state):
+    if (self.mode == 'all'):
+      self.finalStates.add(state)
+      return
+    overlapping = [
+      final for final in self.finalStates
+      if final.startIndex <= state.endIndex and state.startIndex <= final.endIndex
+    ]
+    # Longer matches win, of the equally long ones — the leftmost.
+    rank = lambda s: (s.endIndex - s.startIndex, -s.startIndex)
+    if (any(rank(final) >= rank(state) for final in overlapping)): return
+    self.finalStates -= set(overlapping)
+    self.finalStates.add(state)
+  # Primitives which can match the next token and continue one of the current states.
+  def expectedPrimitives(self):
+    result = set()
+    visited = set()
+    for state in self.currentStates.values():
+      returns = tuple(s.transition.nextState for s in state.patternsStack)
+      firstPrimitives(state.transition.nextState.transitions, returns, result, visited)
+    return result
+  # Primitives which can match the first token of the pattern.
+  def startPrimitives(self):
+    result = set()
+    firstPrimitives(self.pattern.machine.transitions, (), result, set())
+    return result
   def processTransition(self, transition, token, previousState=None):
     # Epsilon
     if (transition.pattern == None):
+      if (self.counters != None):
+        # The transition is in the machine of the innermost subpattern (or of the automata's pattern).
+        stack = previousState.patternsStack if previousState != None else []
+        self.counters.countEpsilon(stack[-1].transition.pattern if len(stack) > 0 else self.pattern)
       if (transition.nextState != None):
         for t in transition.nextState.transitions:
           self.processTransition(t, token, previousState)
       elif (len(previousState.patternsStack) == 0):
-        self.finalStates.add(previousState)
+        self.addFinal(previousState)
       else:
         newState = previousState
         while True:
           patternsStack = list(newState.patternsStack)
           patternState = patternsStack.pop()
-          newState = CurrentState(None, patternState.transition, newState, patternsStack)
+          newState = self.makeState(None, patternState.transition, newState, patternsStack)
           if (newState.transition.nextState != None):
             for t in newState.transition.nextState.transitions:
               self.processTransition(t, token, newState)
             break
           if (len(newState.patternsStack) == 0):
-            self.finalStates.add(newState)
+            self.addFinal(newState)
             break
     # Primitive
     elif (isinstance(transition.pattern, Primitive)):
-      if (transition.pattern.test(token)):
+      matched = transition.pattern.test(token)
+      if (self.counters != None): self.counters.countTest(transition.pattern, matched)
+      if (matched):
         patternsStack = previousState.patternsStack if previousState != None else []
-        newState = CurrentState(token, transition, previousState, list(patternsStack))
+        newState = self.makeState(token, transition, previousState, list(patternsStack))
         if (newState.transition.nextState != None):
-          self.currentStates.add(newState)
+          self.addCurrent(newState)
         elif (len(newState.patternsStack) == 0):
-          self.finalStates.add(newState)
+          self.addFinal(newState)
         else:
           while True:
             patternsStack = list(newState.patternsStack)
             patternState = patternsStack.pop()
-            newState = CurrentState(None, patternState.transition, newState, patternsStack)
+            newState = self.makeState(None, patternState.transition, newState, patternsStack)
             if (newState.transition.nextState != None):
-              self.currentStates.add(newState)
+              self.addCurrent(newState)
               break
             if (len(newState.patternsStack) == 0):
-              self.finalStates.add(newState)
+              self.addFinal(newState)
               break
     # Pattern
     elif (isinstance(transition.pattern, Pattern)):
       patternsStack = previousState.patternsStack if previousState != None else []
-      newState = CurrentState(None, transition, previousState, list(patternsStack))
+      newState = self.makeState(None, transition, previousState, list(patternsStack))
       newState.patternsStack.append(newState)
       for t in transition.pattern.machine.transitions:
         self.processTransition(t, token, newState)
 
+# Collects the primitives which can be reached from the transitions without consuming a token,
+# returns are the states to go to after the current subpattern is finished (as in patternsStack).
+def firstPrimitives(transitions, returns, result, visited):
+  for transition in transitions:
+    if ((transition, returns) in visited): continue
+    visited.add((transition, returns))
+    # Epsilon
+    if (transition.pattern == None):
+      if (transition.nextState != None):
+        firstPrimitives(transition.nextState.transitions, returns, result, visited)
+      else:
+        # Finishing the subpatterns (the whole pattern is finished when there are no returns).
+        while (len(returns) > 0):
+          (nextState, returns) = (returns[-1], returns[:-1])
+          if (nextState != None):
+            firstPrimitives(nextState.transitions, returns, result, visited)
+            break
+    # Primitive
+    elif (isinstance(transition.pattern, Primitive)):
+      result.add(transition.pattern)
+    # Pattern
+    elif (isinstance(transition.pattern, Pattern)):
+      firstPrimitives(transition.pattern.machine.transitions, returns + (transition.nextState,), result, visited)
+
 # Pretty-print a machine.
 def printMachine(machine):
   padding = 0
@@ -1,16 +1,25 @@
 """
   OracleTranslator.py
 
-  Module for translating parsed query to SQL-code.
+  Module for translating parsed query (see QueryIR.py) to SQL-code.
+  The joins are chosen first, then (if the NOT NULL columns are known) rewritten by the optimizer (see optimizer.py).
 """
 
+from QueryIR import TableRef, ColumnRef, Literal, Operation
+from optimizer import QueryOptimizer
+
 class OracleTranslator:
-  def __init__(self, primaryKeys, references, paths):
+  # notNull are the (table, column) pairs of the NOT NULL columns, the query is not optimized without them.
+  def __init__(self, primaryKeys, references, paths, notNull=None):
     self.primaryKeys = primaryKeys
     self.references = references
     self.paths = paths
+    self.notNull = notNull
+    # Descriptions of the optimizer's rewrites of the last translated query.
+    self.rewrites = []
 
-  # Translates a query in JSON format to SQL-code.
+  # Translates a query (QueryIR.Query) to SQL-code with bind variables,
+  # returns the code and the dictionary of bind values.
   def translate(self, parsed):
     self.result = {
       'SELECT': [],
@@ -24,32 +33,48 @@ class OracleTranslator:
     self.prefixes = {}
     # Counter for creating prefixes ("t-1", "t-2", "t-3", ...)
     self.counter = 0 
-    tables = [t['name'] for t in parsed['tablesUsed']]
+    # Values of the bind variables (":b1", ":b2", ":b3", ...)
+    self.binds = {}
+    # Joined tables: (mainTable, refTable, [(colA, colB), ...]), and the ones moved into EXISTS.
+    self.joins = []
+    semiJoins = []
+    # Original names of the selected columns replaced by the optimizer ({ index in SELECT: name }).
+    aliases = {}
+    self.rewrites = []
+    tables = [t.name for t in parsed.tables]
     if (len(tables) == 0): # If there are no tables in the query.
       raise ValueError(f'Запрос не содержит ни столбцов, ни таблиц!')
+    if (len(parsed.select) == 0): # If there is nothing to select.
+      raise ValueError(f'Запрос не содержит выбираемых столбцов или таблиц!')
     if (len(tables) == 1): # If there's only one table in the query.
       self.result['FROM'].append(tables[0])
       self.prefixes[tables[0]] = ''
     else: # If there are multiple tables in the query.
       self.connectMultipleTables(tables)
+    if (self.notNull != None):
+      optimizer = QueryOptimizer(self.primaryKeys, self.notNull)
+      (parsed, self.joins, semiJoins, aliases, self.rewrites) = optimizer.optimize(parsed, self.joins)
+    for join in self.joins:
+      self.result['FROM'].append(self.parseJoin(join))
 
     # SELECT
-    for obj in parsed['selectExpr']['selectObjects']:
-      self.result['SELECT'].append(self.parseObject(obj))
+    for (i, obj) in enumerate(parsed.select):
+      alias = f' AS {aliases[i]}' if i in aliases else ''
+      self.result['SELECT'].append(f'{self.parseObject(obj)}{alias}')
     # WHERE and HAVING
-    if ('whereExpr' in parsed):
-      for conditionSection in parsed['whereExpr']:
-        self.parseConditionSection(conditionSection.upper(), parsed['whereExpr'][conditionSection])
+    self.parseConditionSection('WHERE', parsed.where)
+    for (joins, conditions) in semiJoins:
+      connector = 'AND ' if len(self.result['WHERE']) > 0 else ''
+      self.result['WHERE'].append(f'{connector}{self.parseSemiJoin(joins, conditions)}')
+    self.parseConditionSection('HAVING', parsed.having)
     # GROUP BY
-    if ('groupByExpr' in parsed):
-      for obj in parsed['groupByExpr']['groupObjects']:
-        self.result['GROUP BY'].append(self.parseObject(obj))
+    for obj in parsed.groupBy:
+      self.result['GROUP BY'].append(self.parseObject(obj))
     # ORDER BY
-    if ('orderByExpr' in parsed):
-      for obj in parsed['orderByExpr']['orderObjects']:
-        self.result['ORDER BY'].append(self.parseOrderObject(obj))
+    for obj in parsed.orderBy:
+      self.result['ORDER BY'].append(self.parseOrderObject(obj))
     
-    return self.stringifyResult()
+    return (self.stringifyResult(), self.binds)
 
   # Convert the result to string (SQL-code).
   def stringifyResult(self):
@@ -85,20 +110,16 @@ class OracleTranslator:
     condition = objects[0]
     self.result[section].append(self.parseCondition(condition))
     for i in range(2, len(objects), 2):
-      connector = {
-        'или': 'OR ',
-        'и': 'AND ',
-        ',': 'AND '
-      }[objects[i - 1]]
+      connector = f'{objects[i - 1]} '
       condition = objects[i]
       self.result[section].append(self.parseCondition(condition, connector))
 
   # Parses one condition.
   def parseCondition(self, condition, connector=''):
-    prefix = 'NOT ' if condition['not'] else ''
-    if ('NULL' in condition['operator']):
-      operator = condition['operator']
-      target = condition['target']
+    prefix = 'NOT ' if condition.negated else ''
+    if ('NULL' in condition.operator):
+      operator = condition.operator
+      target = condition.targets[0]
       return f'{connector}{prefix}{self.parseObject(target)} {operator}'
     else:
       operator = {
@@ -107,38 +128,52 @@ class OracleTranslator:
         'eq': '=',
         'ge': '>=',
         'le': '<='
-      }[condition['operator']]
-      targetA = condition['target'][0]
-      targetB = condition['target'][1]
+      }[condition.operator]
+      (targetA, targetB) = condition.targets
       return f'{connector}{prefix}{self.parseObject(targetA)} {operator} {self.parseObject(targetB)}'
 
   # Parses a column in the ORDER BY clause.
   def parseOrderObject(self, obj):
-    suffix = ' DESC' if obj['desc'] else ''
-    column = obj['column']
-    return f'{self.parseObject(column)}{suffix}'
+    suffix = ' DESC' if obj.desc else ''
+    return f'{self.parseObject(obj.target)}{suffix}'
 
-  # Parses a column or literal.
+  # Parses a column, table, literal or operation.
   def parseObject(self, obj):
-    if (checkField(obj, 'type', 'column')):
-      table = obj['table']
-      prefix = self.prefixes[table] if table in self.prefixes else ''
-      column = obj['name']
-      return f'{prefix}{column}'
-    elif (checkField(obj, 'type', 'table')):
-      table = obj['name']
-      prefix = self.prefixes[table] if table in self.prefixes else f'{table}.'
-      return f'{prefix}*'
-    elif (checkField(obj, 'type', 'number')):
-      value = obj['value']
-      return value
-    elif (checkField(obj, 'type', 'string')):
-      value = obj['value']
-      return f'\'{value}\''
-    elif ('operator' in obj):
-      operator = obj['operator']
-      target = obj['target']
-      return f'{operator}({self.parseObject(target)})'
+    return {
+      ColumnRef: self.parseColumn,
+      TableRef: self.parseTable,
+      Literal: self.parseLiteral,
+      Operation: self.parseOperation
+    }[type(obj)](obj)
+
+  # Column with it's table's prefix.
+  def parseColumn(self, obj):
+    prefix = self.prefixes[obj.table] if obj.table in self.prefixes else ''
+    return f'{prefix}{obj.name}'
+
+  # All the columns of a table.
+  def parseTable(self, obj):
+    prefix = self.prefixes[obj.name] if obj.name in self.prefixes else f'{obj.name}.'
+    return f'{prefix}*'
+
+  # Number or string, passed as a bind variable.
+  def parseLiteral(self, obj):
+    if (obj.type == 'number'):
+      return self.addBind(int(obj.value) if obj.value.isdecimal() else obj.value)
+    return self.addBind(obj.value)
+
+  # Function or aggregate function.
+  def parseOperation(self, obj):
+    return f'{obj.operator}({self.parseObject(obj.target)})'
+
+  # Adds a bind variable for the literal value (the same values share one variable).
+  def addBind(self, value):
+    for (name, bindValue) in self.binds.items():
+      if (type(bindValue) == type(value) and bindValue == value):
+        return f':{name}'
+    name = f'b{len(self.binds) + 1}'
+    self.binds[name] = value
+    return f':{name}'
 
   # The case when we need to JOIN multiple tables.
   def connectMultipleTables(self, tables):
@@ -186,17 +221,35 @@ class OracleTranslator:
         self.addJoin(mainTable, table)
       mainTable = table
 
-  # Adds JOIN to the result dictionary.
+  # Adds the JOIN of the table referenced by mainTable.
   def addJoin(self, mainTable, refTable):
     self.addPrefix(refTable)
     fk = [fk for fk in self.references[mainTable][refTable]][0]
     cols = self.references[mainTable][refTable][fk]
+    self.joins.append((mainTable, refTable, cols))
+
+  # Equality of the columns the tables are joined by.
+  def parseJoinColumns(self, join):
+    (mainTable, refTable, cols) = join
     onClause = []
     for (colA, colB) in cols:
       onClause.append(f'{self.prefixes[mainTable]}{colA} = {self.prefixes[refTable]}{colB}')
-    onClause = ' AND '.join(onClause)
+    return ' AND '.join(onClause)
+
+  # JOIN clause of the FROM section.
+  def parseJoin(self, join):
+    refTable = join[1]
     synonim = self.prefixes[refTable][0:-1]
-    self.result['FROM'].append(f'JOIN {refTable} {synonim} ON {onClause}')  
+    return f'JOIN {refTable} {synonim} ON {self.parseJoinColumns(join)}'
+
+  # EXISTS subquery of the tables joined by the joins (the first one is joined to the outer query) with the conditions.
+  def parseSemiJoin(self, joins, conditions):
+    refTable = joins[0][1]
+    fromTables = ' '.join([f'{refTable} {self.prefixes[refTable][0:-1]}'] + [self.parseJoin(j) for j in joins[1:]])
+    whereConditions = ' AND '.join(
+      [self.parseJoinColumns(joins[0])] + [self.parseCondition(condition) for condition in conditions]
+    )
+    return f'EXISTS (SELECT 1 FROM {fromTables} WHERE {whereConditions})'
 
   # Adds table name with it's index to the result dictionary.
   def addTable(self, table):
@@ -210,6 +263,3 @@ class OracleTranslator:
       self.counter += 1
       self.prefixes[table] = f'"t-{self.counter}".'
 
-# Checks if the field is present int the dictionary and it's euqal to the value.
-def checkField(dictionary, field, value):
-  return field in dictionary and dictionary[field] == value
@@ -0,0 +1,101 @@
+"""
+  QueryIR.py
+
+  Intermediate representation of a parsed query,
+  StructureParser produces it and OracleTranslator translates it to SQL-code.
+  The nodes are immutable and hashable: they are deduplicated with sets,
+  can be used as cache keys and are cheap to pickle.
+"""
+
+# Base class of the nodes, the fields of a node are it's __slots__.
+class Node:
+  __slots__ = ()
+  def __init__(self, *values):
+    if (len(values) != len(self.__slots__)):
+      raise TypeError(f'{type(self).__name__} takes {len(self.__slots__)} values')
+    for (field, value) in zip(self.__slots__, values):
+      object.__setattr__(self, field, value)
+  def __setattr__(self, field, value):
+    raise AttributeError(f'{type(self).__name__} is immutable')
+  def values(self):
+    return tuple(getattr(self, field) for field in self.__slots__)
+  def __eq__(self, other):
+    return type(self) == type(other) and self.values() == other.values()
+  def __hash__(self):
+    return hash((type(self).__name__,) + self.values())
+  def __reduce__(self):
+    return (type(self), self.values())
+  def __repr__(self):
+    values = ', '.join([repr(v) for v in self.values()])
+    return f'{type(self).__name__}({values})'
+
+# A table (all of it's columns when selected).
+class TableRef(Node):
+  __slots__ = ('name',)
+  def toDict(self):
+    return { 'type': 'table', 'name': self.name }
+
+# A column of a table.
+class ColumnRef(Node):
+  __slots__ = ('table', 'name')
+  def toDict(self):
+    return { 'type': 'column', 'table': self.table, 'name': self.name }
+
+# A number or a string.
+class Literal(Node):
+  __slots__ = ('type', 'value')
+  def toDict(self):
+    return { 'type': self.type, 'value': self.value }
+
+# An operator (function or aggregate function) applied to a column, literal or another operation.
+class Operation(Node):
+  __slots__ = ('operator', 'target')
+  def toDict(self):
+    return { 'operator': self.operator, 'target': self.target.toDict() }
+
+# A WHERE/HAVING condition: comparison (gt, lt, eq, ge, le) of two targets
+# or a check (IS NULL, IS NOT NULL) of one target.
+class Condition(Node):
+  __slots__ = ('negated', 'operator', 'targets')
+  def toDict(self):
+    return { 'not': self.negated, 'operator': self.operator, 'target': [t.toDict() for t in self.targets] }
+
+# An ORDER BY element.
+class SortKey(Node):
+  __slots__ = ('target', 'desc')
+  def toDict(self):
+    return { 'column': self.target.toDict(), 'desc': self.desc }
+
+# The whole query. where and having are sequences of conditions with connectors between them:
+# (condition, 'AND' | 'OR', condition, ...).
+class Query(Node):
+  __slots__ = ('tables', 'select', 'where', 'having', 'groupBy', 'orderBy')
+  def toDict(self):
+    return {
+      'tablesUsed': [t.toDict() for t in self.tables],
+      'select': [o.toDict() for o in self.select],
+      'where': [c if isinstance(c, str) else c.toDict() for c in self.where],
+      'having': [c if isinstance(c, str) else c.toDict() for c in self.having],
+      'groupBy': [o.toDict() for o in self.groupBy],
+      'orderBy': [o.toDict() for o in self.orderBy]
+    }
+
+# Mutable query used while parsing, dictionaries serve as ordered sets.
+class QueryBuilder:
+  def __init__(self):
+    self.tables = {}
+    self.select = {}
+    self.where = []
+    self.having = []
+    self.groupBy = {}
+    self.orderBy = {}
+  def build(self):
+    return Query(
+      tuple(self.tables),
+      tuple(self.select),
+      tuple(self.where),
+      tuple(self.having),
+      tuple(self.groupBy),
+      tuple(self.orderBy)
+    )
+
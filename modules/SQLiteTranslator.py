@@ -0,0 +1,17 @@
+"""
+  SQLiteTranslator.py
+
+  Module for translating parsed query to SQLite SQL-code (used for the local snapshot, see snapshot.py).
+  The generated code is the same as for Oracle except for the functions which behave differently.
+"""
+
+from OracleTranslator import OracleTranslator
+
+class SQLiteTranslator(OracleTranslator):
+  # Function or aggregate function.
+  def parseOperation(self, obj):
+    target = self.parseObject(obj.target)
+    # Oracle's ROUND of a number gives an integer, SQLite's — a real number.
+    if (obj.operator == 'ROUND'):
+      return f'CAST(ROUND({target}) AS INTEGER)'
+    return f'{obj.operator}({target})'
@@ -1,65 +1,62 @@
 """
   StructureParser.py
 
-  Module for parsing found patterns to JSON format.
+  Module for parsing found patterns to the query's intermediate representation (see QueryIR.py).
 """
 
 from AbstractRegularExpressions import Structure, PatternToken
+from QueryIR import TableRef, ColumnRef, Literal, Operation, Condition, SortKey
+
+# Logical connectors of conditions.
+connectors = {
+  'или': 'OR',
+  'и': 'AND',
+  ',': 'AND'
+}
 
 class StructureParser:
   def __init__(self, dbObjects, dbObjectsLemmas):
     self.dbObjects = dbObjects
     self.dbObjectsLemmas = dbObjectsLemmas
-  # Parses the highest level structures (SELECT, WHERE, GROUP BY, ORDER BY).
+  # Parses the highest level structures (SELECT, WHERE, GROUP BY, ORDER BY),
+  # parsed is the QueryBuilder of the final result.
   def parse(self, parsed, structure):
-    if (structure.name not in parsed):
-      # parsed is the final result.
-      parsed[structure.name] = {}
     # Calling the right parsing function depending on the structure.
     {
       'selectExpr': self.parseSelect,
       'whereExpr': self.parseWhere,
       'groupByExpr': self.parseGroupBy,
       'orderByExpr': self.parseOrderBy
-    }[structure.name](parsed, parsed[structure.name], structure.elements)
+    }[structure.name](parsed, structure.elements)
 
   # SELECT
-  def parseSelect(self, parsed, struct, elements):
-    if ('selectObjects' not in struct):
-      struct['selectObjects'] = []
+  def parseSelect(self, parsed, elements):
     for el in elements:
       if (isinstance(el, Structure)):
         if (el.name == 'listOfTables'):
           for maybeTable in el.elements:
-            self.tryToAddTable(parsed, struct, maybeTable)
+            self.tryToAddTable(parsed, maybeTable)
         elif (el.name == 'listOfColumns'):
-          self.parseColumns(parsed, struct, el.elements)
+          self.parseColumns(parsed, el.elements)
 
   # WHERE and HAVING
-  def parseWhere(self, parsed, struct, elements):
-    if ('where' not in struct):
-      struct['where'] = []
-      struct['having'] = []
-    self.parseCondition(parsed, struct, 'и', elements[0])
+  def parseWhere(self, parsed, elements):
+    self.parseCondition(parsed, 'и', elements[0])
     for i in range(2, len(elements), 2):
-      self.parseCondition(parsed, struct, elements[i - 1].token.text, elements[i])
+      self.parseCondition(parsed, elements[i - 1].token.text, elements[i])
 
   # GROUP BY
-  def parseGroupBy(self, parsed, struct, elements):
-    if ('groupObjects' not in struct):
-      struct['groupObjects'] = []
+  def parseGroupBy(self, parsed, elements):
     table = self.tryToGetTable(elements[-1])
     for el in elements:
       if (isStruct(el, 'columnExpr')):
-        self.addObject(struct['groupObjects'], self.parseColumnExpr(parsed, table, el.elements))
+        self.addObject(parsed.groupBy, self.parseColumnExpr(parsed, table, el.elements))
 
   # ORDER BY
-  def parseOrderBy(self, parsed, struct, elements):
-    if ('orderObjects' not in struct):
-      struct['orderObjects'] = []
+  def parseOrderBy(self, parsed, elements):
     for el in elements:
       if (isStruct(el, 'sortColumn')):
-        self.parseSortColumn(parsed, struct, el.elements)
+        self.parseSortColumn(parsed, el.elements)
 
   # Tries to get table from token and returns None when fails.
   def tryToGetTable(self, maybeTable):
@@ -68,11 +65,11 @@ class StructureParser:
     else: return None
 
   # Parse the columns pattern.
-  def parseColumns(self, parsed, struct, elements):
+  def parseColumns(self, parsed, elements):
     table = self.tryToGetTable(elements[-1])
     for el in elements:
       if (isStruct(el, 'columnExpr')):
-        self.addObject(struct['selectObjects'], self.parseColumnExpr(parsed, table, el.elements))
+        self.addObject(parsed.select, self.parseColumnExpr(parsed, table, el.elements))
 
   # Parses cokumn or literal with operators.
   def parseColumnExpr(self, parsed, table, columnExpr):
@@ -85,16 +82,10 @@ class StructureParser:
       if (isStruct(literal, 'string')):
         for el in literal.elements:
           if (isStruct(el, 'stringQuoteContent') or isStruct(el, 'stringDoubleQuoteContent')):
-            column = {
-              'type': 'string',
-              'value': ' '.join([t.token.text for t in el.elements])
-            }
+            column = Literal('string', ' '.join([t.token.text for t in el.elements]))
       # Number
       elif (isPrimitive(literal, 'number')):
-        column = {
-          'type': 'number',
-          'value': literal.token.text
-        }
+        column = Literal('number', literal.token.text)
     # Column
     else:
       colName = expr.token.lemma
@@ -102,7 +93,7 @@ class StructureParser:
       if (isinstance(maybeColumn, list)):
         if (not table):
           for col in maybeColumn:
-            if (col['table'] in [t['name'] for t in parsed['tablesUsed']]):
+            if (TableRef(col['table']) in parsed.tables):
               column = col
           if (not column):
             raise ValueError(f'Не указана таблица, которой принадлежит столбец «{colName}»!')
@@ -116,6 +107,7 @@ class StructureParser:
       else:
         column = maybeColumn
       self.addTable(parsed, self.getTableByName(column['table']))
+      column = ColumnRef(column['table'], column['name'])
     if (len(columnExpr) > 1):
       return self.applyOperators(columnExpr[0:-1][::-1], column)
     else: return column
@@ -125,18 +117,15 @@ class StructureParser:
     result = target
     for o in operators:
       operator = o.elements[0].elements[0].pattern.name.upper()
-      result = {
-        'operator': operator,
-        'target': result
-      }
+      result = Operation(operator, result)
     return result
 
   # If maybeTable is found to be a table, add it to parsed.
-  def tryToAddTable(self, parsed, struct, maybeTable):
+  def tryToAddTable(self, parsed, maybeTable):
     table = self.tryToGetTable(maybeTable)
     if (table):
       self.addTable(parsed, table)
-      self.addObject(struct['selectObjects'], table)
+      self.addObject(parsed.select, TableRef(table['name']))
 
   # Returns the db object from table name.
   def getTableByName(self, name):
@@ -144,47 +133,43 @@ class StructureParser:
 
   # Adds the table to parsed.
   def addTable(self, parsed, table):
-    if (table not in parsed['tablesUsed']):
-      parsed['tablesUsed'].append(table)
+    self.addObject(parsed.tables, TableRef(table['name']))
 
-  # Adds the objects if not already present in elements.
+  # Adds the objects if not already present in elements (an ordered set).
   def addObject(self, elements, obj):
     if (obj not in elements):
-      elements.append(obj)
+      elements[obj] = None
 
   # Parses a WHERE/HAVING condition with it's corresponding connector (AND/OR).
-  def parseCondition(self, parsed, struct, connector, condition):
+  def parseCondition(self, parsed, connector, condition):
     inHaving = False
-    result = {
-      'not': isPrimitive(condition.elements[0], 'not')
-    }
+    negated = isPrimitive(condition.elements[0], 'not')
+    operator = None
+    targets = []
     for el in condition.elements:
-      if (isPrimitive(el, 'isNull')): result['operator'] = 'IS NULL'
-      elif (isPrimitive(el, 'isNotNull')): result['operator'] = 'IS NOT NULL'
+      if (isPrimitive(el, 'isNull')): operator = 'IS NULL'
+      elif (isPrimitive(el, 'isNotNull')): operator = 'IS NOT NULL'
       elif (isStruct(el, 'compareOperator')):
-        result['operator'] = el.elements[0].pattern.name
+        # ge and le are patterns (e.g. "больше или равный"), the others are primitives.
+        operator = el.elements[0].name if isinstance(el.elements[0], Structure) else el.elements[0].pattern.name
       elif (isStruct(el, 'columnExpr') or isStruct(el, 'columnLiteralExpr')):
         if (any([
           isinstance(e, Structure) and isStruct(e.elements[0], 'aggregateFunction')
           for e in el.elements
         ])):
           inHaving = True
-        if ('target' in result):
-          result['target'] = [result['target'], self.parseColumnExpr(parsed, None, el.elements)]
-        else:
-          expr = self.parseColumnExpr(parsed, None, el.elements)
-          result['target'] = expr
-    target = struct['having'] if inHaving else struct['where']
-    if (len(target) > 0): target.append(connector)
-    target.append(result)
+        targets.append(self.parseColumnExpr(parsed, None, el.elements))
+    target = parsed.having if inHaving else parsed.where
+    if (len(target) > 0): target.append(connectors[connector.lower()])
+    target.append(Condition(negated, operator, tuple(targets)))
 
   # Parses a column expression from ORDER BY.
-  def parseSortColumn(self, parsed, struct, sortColumn):
+  def parseSortColumn(self, parsed, sortColumn):
     isDesc = isStruct(sortColumn[-1], 'desc')
     for el in sortColumn:
       if (isStruct(el, 'columnExpr')):
         col = self.parseColumnExpr(parsed, None, el.elements)
-        self.addObject(struct['orderObjects'], { 'column': col, 'desc': isDesc })
+        self.addObject(parsed.orderBy, SortKey(col, isDesc))
 
 # Checks whether the element is a Structure and it's name is structName.
 def isStruct(element, structName):
@@ -0,0 +1,158 @@
+"""
+  admission.py
+
+  Admission control.
+  Work is split into lanes (analysis — parsing and translating, execution — running queries in the DB,
+  export and spill — streaming results into a response or into a result set's file),
+  each lane has it's own concurrency limit and bounded queue, so slow DB queries can't starve
+  the cheap analysis. Requests waiting in a queue longer than the lane's target wait are shed,
+  and every client is limited by a token bucket. A client is identified by it's address,
+  the X-Client-Id header is accepted only from the trusted proxies (ASQ_TRUSTED_PROXIES, separated by commas).
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Settings of the lanes: maximum number of concurrent requests, queue size
+# and the target wait (in seconds) after which a queued request is shed.
+LANES = {
+  'analysis': { 'concurrency': 8, 'queueSize': 64, 'targetWait': 0.5 },
+  'execution': { 'concurrency': 4, 'queueSize': 32, 'targetWait': 2.0 },
+  # Exports hold a connection while the file is sent.
+  'export': { 'concurrency': 2, 'queueSize': 4, 'targetWait': 1.0 },
+  # Paged queries hold a connection until all the rows are written into the result set's file.
+  'spill': { 'concurrency': 2, 'queueSize': 4, 'targetWait': 1.0 }
+}
+# Requests per second allowed for one client and the size of a burst.
+CLIENT_RATE = 10
+CLIENT_BURST = 20
+# Maximum number of the tracked clients (the least recently seen ones are forgotten).
+MAX_CLIENTS = 10000
+# Addresses of the proxies whose X-Client-Id headers are trusted.
+TRUSTED_PROXIES = { address.strip() for address in os.environ.get('ASQ_TRUSTED_PROXIES', '').split(',') if address.strip() }
+# Weight of the last value in the moving averages.
+EWMA_WEIGHT = 0.1
+
+# Raised when a request is not admitted,
+# status is the HTTP status and retryAfter — seconds after which the client may retry.
+class Rejected(Exception):
+  def __init__(self, status, retryAfter, message):
+    super().__init__(message)
+    self.status = status
+    self.retryAfter = retryAfter
+
+# Concurrency limit with a bounded queue.
+class Lane:
+  def __init__(self, name, concurrency, queueSize, targetWait):
+    self.name = name
+    self.concurrency = concurrency
+    self.queueSize = queueSize
+    self.targetWait = targetWait
+    self.semaphore = threading.BoundedSemaphore(concurrency)
+    self.lock = threading.Lock()
+    self.waiting = 0
+    self.running = 0
+    self.admitted = 0
+    self.rejected = 0
+    self.shed = 0
+    self.waitAverage = 0.0
+    self.waitMax = 0.0
+    self.serviceAverage = 0.0
+
+  # Seconds after which a rejected client should retry (the time to drain the queue).
+  def retryAfter(self):
+    return max(1, math.ceil(self.serviceAverage * (self.waiting + 1) / self.concurrency))
+
+  # Runs the block when the lane has a free slot, raises Rejected if the queue is full or the wait is too long.
+  @contextmanager
+  def admit(self):
+    with self.lock:
+      if (self.waiting >= self.queueSize):
+        self.rejected += 1
+        raise Rejected(503, self.retryAfter(), f'Сервер перегружен ({self.name})!')
+      self.waiting += 1
+    start = time.monotonic()
+    acquired = self.semaphore.acquire(timeout=self.targetWait)
+    wait = time.monotonic() - start
+    with self.lock:
+      self.waiting -= 1
+      self.waitAverage += EWMA_WEIGHT*(wait - self.waitAverage)
+      self.waitMax = max(self.waitMax, wait)
+      if (not acquired):
+        self.shed += 1
+        raise Rejected(503, self.retryAfter(), f'Сервер перегружен ({self.name})!')
+      self.admitted += 1
+      self.running += 1
+    start = time.monotonic()
+    try:
+      yield
+    finally:
+      service = time.monotonic() - start
+      with self.lock:
+        self.running -= 1
+        self.serviceAverage += EWMA_WEIGHT*(service - self.serviceAverage)
+      self.semaphore.release()
+
+  # Queue depth and wait times.
+  def stats(self):
+    with self.lock:
+      return {
+        'concurrency': self.concurrency,
+        'queueSize': self.queueSize,
+        'running': self.running,
+        'waiting': self.waiting,
+        'admitted': self.admitted,
+        'rejected': self.rejected,
+        'shed': self.shed,
+        'waitAverage': self.waitAverage,
+        'waitMax': self.waitMax,
+        'serviceAverage': self.serviceAverage
+      }
+
+# Token buckets of the clients.
+class ClientLimiter:
+  def __init__(self, rate=CLIENT_RATE, burst=CLIENT_BURST, maxClients=MAX_CLIENTS):
+    self.rate = rate
+    self.burst = burst
+    self.maxClients = maxClients
+    self.buckets = OrderedDict() # client -> (tokens, time of the last update), the least recently updated first
+    self.lock = threading.Lock()
+    self.rejected = 0
+
+  # Takes a token from the client's bucket, raises Rejected if the bucket is empty.
+  def take(self, client):
+    now = time.monotonic()
+    with self.lock:
+      (tokens, updated) = self.buckets.get(client, (self.burst, now))
+      tokens = min(self.burst, tokens + (now - updated)*self.rate)
+      if (tokens < 1):
+        self.update(client, tokens, now)
+        self.rejected += 1
+        raise Rejected(429, math.ceil((1 - tokens)/self.rate), 'Слишком много запросов!')
+      self.update(client, tokens - 1, now)
+
+  # Stores the client's bucket as the most recently updated one, forgetting the least recently updated ones
+  # over maxClients (the lock must be held).
+  def update(self, client, tokens, now):
+    self.buckets[client] = (tokens, now)
+    self.buckets.move_to_end(client)
+    while (len(self.buckets) > self.maxClients):
+      self.buckets.popitem(last=False)
+
+  def stats(self):
+    with self.lock:
+      return { 'clients': len(self.buckets), 'rejected': self.rejected }
+
+lanes = { name: Lane(name, **settings) for (name, settings) in LANES.items() }
+clientLimiter = ClientLimiter()
+
+# Statistics of the lanes and clients (for autoscaling).
+def admissionStats():
+  return {
+    'lanes': { name: lane.stats() for (name, lane) in lanes.items() },
+    'clients': clientLimiter.stats()
+  }
@@ -5,19 +5,55 @@
 """
 
 from pymystem3 import Mystem
-from AbstractRegularExpressions import Primitive, Pattern, PatternToken, Automata, printPattern, OR, Structure
-from dbObjects import dbObjects, dbObjectsLemmas, primaryKeys, references, paths
+from AbstractRegularExpressions import (
+  Primitive, Pattern, PatternToken, Automata, printPattern, OR, Structure, MatchCounters, MatcherStats
+)
 from patterns import Token, selectExpr, whereExpr, groupByExpr, orderByExpr
 from OracleTranslator import OracleTranslator
-from StructureParser import StructureParser
+from SQLiteTranslator import SQLiteTranslator
+from QueryIR import QueryBuilder
+from catalog import CatalogManager
+from tokenizer import FastTokenizer
+from sharedcache import SharedCache
+import patterns as patternsModule
 import json
+import os
+import threading
 
 mystem = Mystem()
+# Mystem is a single subprocess, so the threads analyze texts one by one.
+mystemLock = threading.Lock()
+# Texts consisting of known words are analyzed without Mystem.
+fastTokenizer = FastTokenizer.load()
+# Analyses, parsed and translated queries shared by the workers of the host (if ASQ_SHARED_CACHE is set).
+sharedCache = SharedCache()
 
-structureParser = StructureParser(dbObjects, dbObjectsLemmas)
-oracleTranslator = OracleTranslator(primaryKeys, references, paths)
+# Translators for the SQL dialects (a translator keeps it's state while translating,
+# so a new one is made for every query).
+translators = {
+  'oracle': OracleTranslator,
+  'sqlite': SQLiteTranslator
+}
 
-patterns = [Automata(pattern) for pattern in [selectExpr, whereExpr, groupByExpr, orderByExpr]]
+patternsToMatch = [selectExpr, whereExpr, groupByExpr, orderByExpr]
+# Matching mode of the automatas: only the leftmost-longest matches are kept while matching
+# (the shorter ones would be excluded as redundant substructures anyway).
+MATCHING_MODE = 'longest'
+# Whether the translated queries are optimized using the keys and the NOT NULL columns (see optimizer.py).
+OPTIMIZE_SQL = True
+# Whether the work of the automatas is counted (see MatchCounters), the counts of every parsed query
+# are returned with it (as matcher) and added to matcherStats.
+COUNT_MATCHING = os.environ.get('ASQ_MATCHER_STATS', '') not in ['', '0']
+matcherStats = MatcherStats()
+
+# Words of the primitives (their misspellings are corrected as the ones of the DB objects).
+primitiveWords = [
+  word
+  for primitive in vars(patternsModule).values() if isinstance(primitive, Primitive) and primitive.vocabulary
+  for word in primitive.vocabulary if word.isalpha()
+]
+# Versions of the DB objects of the default database.
+catalogs = CatalogManager(primitiveWords)
 
 # Used for excluding redundant substructures.
 class DeadOrAlive:
@@ -27,35 +63,84 @@ class DeadOrAlive:
     self.data = data
     self.alive = True
 
-# Parses a query in Russian language to JSON format.
-def parse(text):
-  analyzed = mystem.analyze(text)
-  tokens = []
-  for index, token in enumerate(analyzed):
-    text = token['text'].strip()
-    if (text == ""):
-      continue
-    analysis = {}
-    if ('analysis' in token and len(token['analysis']) > 0):
-      analysis = token['analysis'][0]
-    lemma = analysis['lex'] if 'lex' in analysis else ''
-    grammar = analysis['gr'] if 'gr' in analysis else ''
-
-    tokenType = ''
-    if (lemma in dbObjectsLemmas):
-      if (not isinstance(dbObjectsLemmas[lemma], list)):
-        tokenType = dbObjectsLemmas[lemma]['type']
-      else:
-        tokenType = 'column'
-    elif (text.isnumeric()):
-      tokenType = 'number'
+# Creates new automatas for matching the patterns (one set per query),
+# see Automata for the modes, the work is counted in counters if they are given.
+def makeAutomatas(mode=MATCHING_MODE, counters=None):
+  return [Automata(pattern, mode, counters) for pattern in patternsToMatch]
+
+# Makes a Token out of a token analyzed by Mystem (None for whitespaces),
+# the DB objects are looked up in the catalog.
+def makeToken(analyzedToken, index, catalog):
+  text = analyzedToken['text'].strip()
+  if (text == ""):
+    return None
+  analysis = {}
+  if ('analysis' in analyzedToken and len(analyzedToken['analysis']) > 0):
+    analysis = analyzedToken['analysis'][0]
+  lemma = analysis['lex'] if 'lex' in analysis else ''
+  grammar = analysis['gr'] if 'gr' in analysis else ''
+  # Words unknown to Mystem may be misspelled known words.
+  unknown = len(analysis) == 0 or analysis.get('qual') == 'bastard'
+  dbObjectsLemmas = catalog.dbObjectsLemmas
+  if (unknown and lemma not in dbObjectsLemmas and text.isalpha()):
+    corrected = catalog.fuzzyIndex.lookup(lemma or text.lower())
+    if (corrected != None): lemma = corrected
+
+  tokenType = ''
+  if (lemma in dbObjectsLemmas):
+    if (not isinstance(dbObjectsLemmas[lemma], list)):
+      tokenType = dbObjectsLemmas[lemma]['type']
     else:
-      tokenType = 'text'
+      tokenType = 'column'
+  elif (text.isnumeric()):
+    tokenType = 'number'
+  else:
+    tokenType = 'text'
+
+  return Token(text, tokenType, lemma, grammar, index)
 
-    token = Token(text, tokenType, lemma, grammar, len(tokens))
+# Splits the text into tokens, startIndex is the index of the first token
+# (the current version of the catalog is used by default).
+def tokenize(text, startIndex=0, catalog=None):
+  if (catalog == None): catalog = catalogs.current
+  tokens = []
+  analyzed = fastTokenizer.analyze(text)
+  if (analyzed == None):
+    analyzed = sharedCache.get(('mystem', text))
+  if (analyzed == None):
+    with mystemLock:
+      analyzed = mystem.analyze(text)
+    sharedCache.put(('mystem', text), analyzed)
+  for analyzedToken in analyzed:
+    token = makeToken(analyzedToken, startIndex + len(tokens), catalog)
+    if (token != None):
+      tokens.append(token)
+  return tokens
+
+# Parses a query in Russian language to the intermediate representation (QueryIR.Query).
+# The result holds the version of the catalog the query was parsed with
+# (the current version of the default catalog is used by default).
+# The results are shared by the workers (keyed by the normalized query and the catalog's digest),
+# the work of the automatas is counted only for the queries parsed by this worker.
+def parse(text, catalog=None):
+  if (catalog == None): catalog = catalogs.current
+  key = ('parse', catalog.digest, MATCHING_MODE, ' '.join(text.split()))
+  parsed = sharedCache.get(key)
+  if (parsed == None):
+    parsed = parseText(text, catalog)
+    sharedCache.put(key, { name: value for (name, value) in parsed.items() if name not in ['catalog', 'matcher'] })
+  elif (parsed['status'] == 'success'):
+    parsed['catalog'] = catalog
+  return parsed
+
+# Parses the query with the catalog (see parse).
+def parseText(text, catalog):
+  counters = MatchCounters() if COUNT_MATCHING else None
+  automatas = makeAutomatas(MATCHING_MODE, counters)
+  tokens = tokenize(text, 0, catalog)
+  for token in tokens:
     # print(token)
-    for p in patterns: p.feedToken(token)
-    tokens.append(token)
+    for p in automatas: p.feedToken(token)
 
   # Pretty print a structure.
   def printStucture(structure, padding=2):
@@ -68,14 +153,17 @@ def parse(text):
     print((padding - 2)*' ' + ']')
 
   # Feed token to patterns.
-  for p in patterns: p.feedToken(Token('', '', '', '', len(tokens)))
+  for p in automatas: p.feedToken(Token('', '', '', '', len(tokens)))
   
   # Eliminating redundant substructures.
   opponents = []
-  for p in patterns:
+  for p in automatas:
     for f in p.finalStates:
       ((startIndex, finalIndex), structure) = f.connect(p.pattern.name)
       opponents.append(DeadOrAlive(startIndex, finalIndex, structure))
+  if (counters != None):
+    counters.finalStates = len(opponents)
+    matcherStats.add(counters)
   for opponentA in opponents:
     for opponentB in opponents:
       if (opponentA == opponentB): continue
@@ -96,19 +184,34 @@ def parse(text):
     if opponent.alive
   ]
   try:
-    parsed = {
-      'tablesUsed': []
-    }
+    parsed = QueryBuilder()
     for structure in structures:
-      structureParser.parse(parsed, structure)
-    return { 'status': 'success', 'result': parsed }
+      catalog.structureParser.parse(parsed, structure)
+    result = { 'status': 'success', 'result': parsed.build(), 'catalog': catalog }
   except ValueError as err:
-    return { 'status': 'error', 'message': str(err) }
+    result = { 'status': 'error', 'message': str(err) }
+  if (counters != None): result['matcher'] = counters.toDict()
+  return result
+
+# Translates a parsed query to SQL-code (of the dialect) with bind variables,
+# the joins are optimized (see optimizer.py) if optimize is set.
+# The results are shared by the workers (keyed by the parsed query and the catalog's digest).
+def translate(parsed, dialect='oracle', optimize=OPTIMIZE_SQL):
+  catalog = parsed.get('catalog') or catalogs.current
+  key = ('translate', catalog.digest, dialect, optimize, parsed['result'])
+  translated = sharedCache.get(key)
+  if (translated == None):
+    translated = translateQuery(parsed['result'], catalog, dialect, optimize)
+    sharedCache.put(key, translated)
+  return translated
 
-# Translates a query in JSON format to SQL-code.
-def translate(parsed):
+# Translates the query (QueryIR.Query) with the catalog (see translate).
+def translateQuery(query, catalog, dialect, optimize):
   try:
-    SQL = oracleTranslator.translate(parsed['result'])
-    return { 'status': 'success', 'result': SQL }
+    translator = translators[dialect](
+      catalog.primaryKeys, catalog.references, catalog.paths, catalog.notNull if optimize else None
+    )
+    (SQL, binds) = translator.translate(query)
+    return { 'status': 'success', 'result': SQL, 'binds': binds, 'rewrites': translator.rewrites }
   except ValueError as err:
     return { 'status': 'error', 'message': str(err) }
@@ -0,0 +1,135 @@
+"""
+  cache.py
+
+  In-process cache for the results of executed SQL queries.
+  Results are keyed by the final SQL-code and it's bind values,
+  they expire depending on the tables used and are evicted when the memory budget is exceeded.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Time to live (in seconds) for results of the tables which are not listed in TABLES_TTL.
+DEFAULT_TTL = 60
+# Time to live (in seconds) for results depending on the tables used,
+# a result lives as long as the shortest TTL of it's tables.
+TABLES_TTL = {
+  'regions': 3600,
+  'countries': 3600,
+  'locations': 600,
+  'departments': 600,
+  'employees': 60
+}
+# Memory budget (in bytes) for all the cached results.
+MAX_BYTES = 64 * 1024 * 1024
+# How many least recently used entries are compared by hits in the LFU mode.
+LFU_SAMPLE = 8
+
+# One cached result.
+class CacheEntry:
+  def __init__(self, result, tables, size, expires):
+    self.result = result
+    self.tables = tables
+    self.size = size
+    self.expires = expires
+    self.hits = 0
+
+# LRU (or sampled LFU) cache with TTLs and a memory budget.
+class ResultCache:
+  def __init__(self, maxBytes=MAX_BYTES, defaultTTL=DEFAULT_TTL, tablesTTL=TABLES_TTL, policy='lru'):
+    if (policy not in ['lru', 'lfu']):
+      raise ValueError(f'Unknown eviction policy «{policy}»!')
+    self.maxBytes = maxBytes
+    self.defaultTTL = defaultTTL
+    self.tablesTTL = tablesTTL
+    self.policy = policy
+    self.entries = OrderedDict() # from the least to the most recently used.
+    self.byTable = {} # table name -> set of keys.
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+  # Makes a hashable key from the SQL-code and bind values.
+  @staticmethod
+  def key(SQL, binds=None):
+    return (SQL, tuple(sorted(binds.items())) if binds else ())
+
+  # Returns the cached result or None if there is no (alive) result.
+  def get(self, SQL, binds=None):
+    key = ResultCache.key(SQL, binds)
+    with self.lock:
+      entry = self.entries.get(key)
+      if (entry != None and entry.expires <= time.monotonic()):
+        self.remove(key)
+        entry = None
+      if (entry == None):
+        self.misses += 1
+        return None
+      self.entries.move_to_end(key)
+      entry.hits += 1
+      self.hits += 1
+      return entry.result
+
+  # Caches the result of the query which uses the tables.
+  def put(self, SQL, binds, tables, result):
+    size = len(json.dumps(result).encode('utf-8'))
+    if (size > self.maxBytes): return
+    ttl = min([self.tablesTTL.get(table, self.defaultTTL) for table in tables], default=self.defaultTTL)
+    key = ResultCache.key(SQL, binds)
+    with self.lock:
+      if (key in self.entries): self.remove(key)
+      while (self.size + size > self.maxBytes):
+        self.remove(self.victim())
+      self.entries[key] = CacheEntry(result, tables, size, time.monotonic() + ttl)
+      self.size += size
+      for table in tables:
+        self.byTable.setdefault(table, set()).add(key)
+
+  # Removes all the results which use the table, returns the number of removed results.
+  def invalidate(self, table):
+    with self.lock:
+      keys = list(self.byTable.get(table, []))
+      for key in keys: self.remove(key)
+      return len(keys)
+
+  # Removes all the results.
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.byTable.clear()
+      self.size = 0
+
+  # Statistics of the cache.
+  def stats(self):
+    with self.lock:
+      return {
+        'entries': len(self.entries),
+        'bytes': self.size,
+        'maxBytes': self.maxBytes,
+        'hits': self.hits,
+        'misses': self.misses,
+        'policy': self.policy
+      }
+
+  # Chooses the key to evict (the lock must be held).
+  def victim(self):
+    if (self.policy == 'lru'):
+      return next(iter(self.entries))
+    sample = []
+    for key in self.entries:
+      sample.append(key)
+      if (len(sample) == LFU_SAMPLE): break
+    return min(sample, key = lambda key: self.entries[key].hits)
+
+  # Removes the key (the lock must be held).
+  def remove(self, key):
+    entry = self.entries.pop(key)
+    self.size -= entry.size
+    for table in entry.tables:
+      keys = self.byTable.get(table)
+      if (keys != None):
+        keys.discard(key)
+        if (len(keys) == 0): del self.byTable[table]
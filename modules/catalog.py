@@ -0,0 +1,180 @@
+"""
+  catalog.py
+
+  Versioned catalog of the DB objects: the lexicon (lemmas of the DB objects), primary and foreign keys
+  and the join paths, together with the parser and the fuzzy index built from them.
+  A new version is built when LAST_DDL_TIME of the tables or the lexicon file changes (checked in the background)
+  or on the admin's request, and is swapped in at once: a request takes the current version once
+  and uses it to the end, so the requests in flight finish on the old version.
+  Only the join paths starting in the part of the FK graph affected by the change are recomputed.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from db import SELECT
+from dbObjects import (
+  LEXICON_PATH, loadDbObjects, lemmasIndex, loadPrimaryKeys, loadReferences, loadNotNullColumns, lastDDLTime, findPaths
+)
+from StructureParser import StructureParser
+from fuzzy import FuzzyIndex
+
+# Seconds between the checks for changes.
+CHECK_INTERVAL = 60
+
+# Digest of the catalog's contents: the versions with the same contents (in any process) have the same digest,
+# it versions the parsed and translated queries of the shared cache (see sharedcache.py).
+def catalogDigest(dbObjects, primaryKeys, references, notNull, paths):
+  contents = json.dumps([
+    dbObjects, primaryKeys, references,
+    sorted(notNull) if notNull != None else None,
+    sorted([[tableL, tableR, path] for ((tableL, tableR), path) in paths.items()])
+  ], sort_keys=True, ensure_ascii=False, default=str)
+  return hashlib.blake2b(contents.encode('utf-8'), digest_size=16).hexdigest()
+
+# One version of the catalog (never changed after it's built).
+class Catalog:
+  def __init__(self, version, dbObjects, lexiconStamp, primaryKeys, references, notNull, paths, ddlTime, extraWords,
+               previous=None):
+    self.version = version
+    self.built = time.time()
+    self.dbObjects = dbObjects
+    self.lexiconStamp = lexiconStamp
+    self.primaryKeys = primaryKeys
+    self.references = references
+    # NOT NULL columns (None if unknown, then the queries are not optimized).
+    self.notNull = notNull
+    self.paths = paths
+    self.ddlTime = ddlTime
+    self.digest = catalogDigest(dbObjects, primaryKeys, references, notNull, paths)
+    if (previous != None and previous.dbObjects == dbObjects):
+      # The lexicon is the same, so is everything built from it.
+      self.dbObjectsLemmas = previous.dbObjectsLemmas
+      self.structureParser = previous.structureParser
+      self.fuzzyIndex = previous.fuzzyIndex
+    else:
+      self.dbObjectsLemmas = lemmasIndex(dbObjects)
+      self.structureParser = StructureParser(dbObjects, self.dbObjectsLemmas)
+      # Index for correcting misspelled lemmas of DB objects and words of the primitives.
+      self.fuzzyIndex = FuzzyIndex(list(self.dbObjectsLemmas) + list(extraWords))
+
+  # Summary of the version.
+  def describe(self):
+    return {
+      'version': self.version,
+      'digest': self.digest,
+      'built': self.built,
+      'ddlTime': str(self.ddlTime),
+      'lexiconStamp': self.lexiconStamp,
+      'objects': len(self.dbObjects),
+      'tables': len(self.primaryKeys),
+      'references': sum(len(refs) for refs in self.references.values()),
+      'notNullColumns': len(self.notNull) if self.notNull != None else None,
+      'paths': len(self.paths)
+    }
+
+# Pairs of the tables connected by foreign keys.
+def edges(references):
+  return { (tableL, tableR) for (tableL, refs) in references.items() for tableR in refs }
+
+# Tables whose paths may have changed: the ones from which a changed FK can be reached (in the old or the new graph).
+def affectedSources(oldReferences, newReferences):
+  (oldEdges, newEdges) = (edges(oldReferences), edges(newReferences))
+  affected = { tableL for (tableL, tableR) in oldEdges ^ newEdges }
+  referencing = {}
+  for (tableL, tableR) in oldEdges | newEdges:
+    referencing.setdefault(tableR, set()).add(tableL)
+  queue = list(affected)
+  while (len(queue) > 0):
+    for table in referencing.get(queue.pop(), ()):
+      if (table not in affected):
+        affected.add(table)
+        queue.append(table)
+  return affected
+
+# Join paths for the new keys, the paths of the previous version are reused where the FK graph hasn't changed.
+# Returns the paths and the tables whose paths were recomputed.
+def updatePaths(previous, primaryKeys, references):
+  if (previous == None): return (findPaths(references, primaryKeys), set(references))
+  sources = affectedSources(previous.references, references)
+  paths = {
+    (tableL, tableR): path for ((tableL, tableR), path) in previous.paths.items()
+    if tableL not in sources and tableL in references and tableR in primaryKeys
+  }
+  paths.update(findPaths(references, primaryKeys, sources))
+  # The tables which got primary keys are new targets for all the tables.
+  newTargets = { table: keys for (table, keys) in primaryKeys.items() if table not in previous.primaryKeys }
+  if (len(newTargets) > 0):
+    paths.update(findPaths(references, newTargets, set(references) - sources))
+  return (paths, sources)
+
+# Builds the versions of the catalog and keeps the current one,
+# select is db.SELECT of the database and lexiconPath — the file of the DB objects.
+class CatalogManager:
+  def __init__(self, extraWords=(), select=SELECT, lexiconPath=LEXICON_PATH):
+    self.extraWords = list(extraWords)
+    self.select = select
+    self.lexiconPath = lexiconPath
+    self.current = None
+    self.reloadLock = threading.Lock()
+    self.reloads = 0
+    self.recomputed = None
+    self.lastCheck = None
+    self.lastError = None
+    self.reload(force=True)
+
+  # Builds a new version if the lexicon or the tables have changed (or force is set),
+  # returns whether a new version was swapped in.
+  def reload(self, force=False):
+    with self.reloadLock:
+      previous = self.current
+      try:
+        ddlTime = lastDDLTime(self.select)
+      except Exception:
+        ddlTime = None # Without access to USER_OBJECTS the keys are reloaded only by force.
+      (dbObjects, lexiconStamp) = loadDbObjects(self.lexiconPath)
+      keysChanged = force or previous == None or ddlTime != previous.ddlTime
+      if (not keysChanged and lexiconStamp == previous.lexiconStamp): return False
+      if (keysChanged):
+        primaryKeys = loadPrimaryKeys(self.select)
+        references = loadReferences(self.select)
+        try:
+          notNull = loadNotNullColumns(self.select)
+        except Exception:
+          notNull = None
+        (paths, self.recomputed) = updatePaths(previous, primaryKeys, references)
+      else:
+        (primaryKeys, references, notNull, paths) = (
+          previous.primaryKeys, previous.references, previous.notNull, previous.paths
+        )
+        self.recomputed = set()
+      version = previous.version + 1 if previous != None else 1
+      self.current = Catalog(
+        version, dbObjects, lexiconStamp, primaryKeys, references, notNull, paths, ddlTime, self.extraWords, previous
+      )
+      self.reloads += 1
+      return True
+
+  # Checks for changes in a background thread.
+  def start(self, interval=CHECK_INTERVAL):
+    def checkLoop():
+      while True:
+        time.sleep(interval)
+        try:
+          self.reload()
+          self.lastError = None
+        except Exception as error:
+          self.lastError = str(error) # The current version is kept.
+        self.lastCheck = time.time()
+    threading.Thread(target=checkLoop, name='catalog', daemon=True).start()
+
+  # The current version and the results of the last reload.
+  def stats(self):
+    return {
+      'current': self.current.describe(),
+      'reloads': self.reloads,
+      'recomputed': sorted(self.recomputed) if self.recomputed != None else None,
+      'lastCheck': self.lastCheck,
+      'lastError': self.lastError
+    }
@@ -0,0 +1,126 @@
+"""
+  compiledPatterns.py
+
+  Precompiled machines of the patterns.
+  Building the NFAs of all the patterns takes time on every start of a worker,
+  so they are compiled once into flat integer tables and saved into a file:
+    python compiledPatterns.py
+  The file stores the digest of the patterns' source code,
+  if the source has changed the file is ignored and the machines are built as usual.
+
+  Tables:
+    patternStates[p]    — index of the first state of the pattern p (it's start state),
+    stateTransitions[s] — index of the first transition of the state s,
+    transitions         — triples (kind, ID, next state index or -1 for the final state),
+                          kind is EPSILON, PRIMITIVE (ID of the primitive) or PATTERN (ID of the pattern).
+"""
+
+import hashlib
+import marshal
+import os
+import struct
+from array import array
+from AbstractRegularExpressions import State, Transition, Primitive, Pattern, statesIterator, definedPatterns, definedPrimitives
+
+# Version of the file format, increase it when the format changes.
+FORMAT_VERSION = 1
+MAGIC = b'ASQP'
+HEADER = struct.Struct('<4sI32s')
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+COMPILED_PATH = os.path.join(DIRECTORY, 'patterns.compiled')
+# Files which define the patterns and their machines.
+SOURCES = ['patterns.py', 'AbstractRegularExpressions.py', 'compiledPatterns.py']
+
+# Kinds of transitions.
+EPSILON = 0
+PRIMITIVE = 1
+PATTERN = 2
+
+# Digest of the patterns' source code.
+def sourceDigest():
+  digest = hashlib.sha256()
+  for source in SOURCES:
+    with open(os.path.join(DIRECTORY, source), 'rb') as file:
+      digest.update(file.read())
+  return digest.digest()
+
+# Compiles the machines of the patterns into flat tables.
+def compilePatterns(patterns, primitives):
+  patternStates = array('i')
+  stateTransitions = array('i')
+  transitions = array('i')
+  for pattern in patterns:
+    patternStates.append(len(stateTransitions))
+    states = list(statesIterator(pattern.machine, set()))
+    indexes = { state: len(stateTransitions) + i for (i, state) in enumerate(states) }
+    for state in states:
+      stateTransitions.append(len(transitions) // 3)
+      for t in state.transitions:
+        if (t.pattern == None): (kind, ID) = (EPSILON, -1)
+        elif (isinstance(t.pattern, Primitive)): (kind, ID) = (PRIMITIVE, t.pattern.ID)
+        else: (kind, ID) = (PATTERN, t.pattern.ID)
+        transitions.extend([kind, ID, indexes[t.nextState] if t.nextState != None else -1])
+  patternStates.append(len(stateTransitions))
+  stateTransitions.append(len(transitions) // 3)
+  return (patternStates, stateTransitions, transitions)
+
+# Builds the machines of the patterns from the tables.
+def loadMachines(patterns, primitives, tables):
+  (patternStates, stateTransitions, transitions) = tables
+  states = []
+  for p in range(len(patterns)):
+    for ID in range(1, patternStates[p + 1] - patternStates[p] + 1):
+      state = State(set())
+      state.ID = ID
+      states.append(state)
+  for (s, state) in enumerate(states):
+    for t in range(stateTransitions[s], stateTransitions[s + 1]):
+      (kind, ID, nextState) = transitions[3*t:3*t + 3]
+      pattern = None
+      if (kind == PRIMITIVE): pattern = primitives[ID]
+      elif (kind == PATTERN): pattern = patterns[ID]
+      state.transitions.add(Transition(pattern, states[nextState] if nextState >= 0 else None))
+  for (p, pattern) in enumerate(patterns):
+    pattern.compiledMachine = states[patternStates[p]]
+
+# Writes the compiled patterns into the file.
+def writeCompiledPatterns(path=COMPILED_PATH, patterns=definedPatterns, primitives=definedPrimitives):
+  tables = compilePatterns(patterns, primitives)
+  body = marshal.dumps((
+    [p.name for p in patterns],
+    [p.name for p in primitives],
+    [table.tobytes() for table in tables]
+  ))
+  temporaryPath = f'{path}.{os.getpid()}'
+  with open(temporaryPath, 'wb') as file:
+    file.write(HEADER.pack(MAGIC, FORMAT_VERSION, sourceDigest()))
+    file.write(body)
+  os.replace(temporaryPath, path)
+
+# Loads the compiled patterns from the file, returns False when the file is missing or outdated.
+def loadCompiledPatterns(path=COMPILED_PATH, patterns=definedPatterns, primitives=definedPrimitives):
+  try:
+    with open(path, 'rb') as file:
+      data = file.read()
+  except OSError:
+    return False
+  if (len(data) < HEADER.size): return False
+  (magic, version, digest) = HEADER.unpack_from(data)
+  if (magic != MAGIC or version != FORMAT_VERSION or digest != sourceDigest()):
+    return False
+  (patternNames, primitiveNames, tablesBytes) = marshal.loads(data[HEADER.size:])
+  if (patternNames != [p.name for p in patterns] or primitiveNames != [p.name for p in primitives]):
+    return False
+  tables = []
+  for tableBytes in tablesBytes:
+    table = array('i')
+    table.frombytes(tableBytes)
+    tables.append(table)
+  loadMachines(patterns, primitives, tables)
+  return True
+
+if __name__ == '__main__':
+  import patterns
+  writeCompiledPatterns()
+  print(f'The patterns are compiled into {COMPILED_PATH}')
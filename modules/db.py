@@ -4,16 +4,43 @@
   Database module, used to connect to Oracle Database.
 """
 
+import html
+import threading
+import time
 import cx_Oracle
 
+# Connection string of the default database (user/password@host:port/service).
+# @localhost:1521/orcl
+DSN = u'C##Yasos/Bib@localhost:1521/xe'
+# Maximum number of the connections of a database.
+POOL_SIZE = 8
+
+# Makes an HTML-row of the values (escaped).
+def HTMLrow(cols, header=False):
+  tag = 'th' if header else 'td'
+  return '<tr>' + ''.join([f'<{tag}>{html.escape(col.strip())}</{tag}>' for col in cols]) + '</tr>'
+
 # Parses a DB row into an HTML-row.
 def parseRow(row, separetor, header=False):
-  cols = row.split(separetor)
-  colsHTML = ''
-  for col in cols:
-    if (header): colsHTML += '<th>' + col.strip() + '</th>'
-    else:        colsHTML += '<td>' + col.strip() + '</td>'
-  return '<tr>' + colsHTML + '</tr>'
+  return HTMLrow(row.split(separetor), header)
+
+# Parts of an HTML table (strings to be joined): the header is a list of the column names
+# and rows — an iterable of lists of the values, which is read lazily (so the table can be streamed).
+def HTMLtableParts(header, rows, caption=''):
+  yield '<row class="aligment-center">'
+  yield '<table class="table table-scroll table-SQL table-striped table-hover">'
+  if (caption != ''): yield '<caption>' + caption + '</caption>'
+  if (header != None):
+    yield '<thead class="thead-dark">' + HTMLrow(header, header=True) + '</thead>'
+  hasRows = False
+  for row in rows:
+    if (not hasRows):
+      hasRows = True
+      yield '<tbody>'
+    yield HTMLrow(row)
+  if (hasRows): yield '</tbody>'
+  yield '</table>'
+  yield '</row>'
 
 # Makes an HTML table.
 def SQLtable(code, separetor='\t', caption=''):
@@ -21,37 +48,96 @@ def SQLtable(code, separetor='\t', caption=''):
     lines = code.split('\\n')
   else:
     lines = code.split('\n')
-  rows = []
-  if (len(lines) > 0):
-    rows.append(parseRow(lines[0], separetor, header=True))
-  if (len(lines) > 1):
-    for i in range(1, len(lines)):
-      rows.append(parseRow(lines[i], separetor, header=False))
-  table = '<row class="aligment-center">'
-  table += '<table class="table table-scroll table-SQL table-striped table-hover">'
-  if (caption != ''): table += '<caption>' + caption + '</caption>'
-  if (len(lines) > 0):
-    table += '<thead class="thead-dark">'
-    table += rows[0]
-    table += '</thead>'
-  if (len(lines) > 1):
-    table += '<tbody>'
-    for r in range(1, len(rows)):
-      table += rows[r]
-    table += '</tbody>'
-  table += '</table>'
-  table += '</row>'
-  return table
-
-# Selects data from database.
-# @localhost:1521/orcl
-def SELECT(query, cb):
-  connection = cx_Oracle.connect(u'C##Yasos/Bib@localhost:1521/xe')
-  cursor = connection.cursor()
-  cursor.execute(query)
-  result = cb(cursor)
-  connection.close()
-  return result
+  header = lines[0].split(separetor) if len(lines) > 0 else None
+  rows = (line.split(separetor) for line in lines[1:])
+  return ''.join(HTMLtableParts(header, rows, caption))
+
+# Database with a pool of connections (the pool is created on the first query).
+class Database:
+  def __init__(self, dsn=DSN, poolSize=POOL_SIZE):
+    (self.user, rest) = dsn.split('/', 1)
+    (self.password, self.address) = rest.rsplit('@', 1)
+    self.poolSize = poolSize
+    self.pool = None
+    self.lock = threading.Lock()
+
+  # The pool of connections (created on the first call).
+  def getPool(self):
+    with self.lock:
+      if (self.pool == None):
+        self.pool = cx_Oracle.SessionPool(
+          user=self.user, password=self.password, dsn=self.address,
+          min=1, max=self.poolSize, increment=1, threaded=True
+        )
+      return self.pool
+
+  # Selects data from the database, binds are the values of the query's bind variables,
+  # cb gets the cursor and returns the result.
+  def SELECT(self, query, cb, binds=None):
+    pool = self.getPool()
+    connection = pool.acquire()
+    try:
+      cursor = connection.cursor()
+      cursor.execute(query, binds or {})
+      return cb(cursor)
+    finally:
+      pool.release(connection)
+
+  # Opens all the connections of the pool and parses the statements on every one of them (until the deadline,
+  # a time.monotonic() value), so the first queries wait neither for the connections nor for the hard parses.
+  # Returns the number of the opened connections and of the parsed statements.
+  def warm(self, statements=(), deadline=None):
+    pool = self.getPool()
+    connections = []
+    prepared = 0
+    try:
+      for i in range(self.poolSize):
+        connections.append(pool.acquire())
+      for connection in connections:
+        cursor = connection.cursor()
+        for statement in statements:
+          if (deadline != None and time.monotonic() > deadline): return (len(connections), prepared)
+          try:
+            cursor.parse(statement)
+            prepared += 1
+          except cx_Oracle.DatabaseError:
+            pass # The query fails the same way when it's executed.
+        cursor.close()
+    finally:
+      for connection in connections: pool.release(connection)
+    return (len(connections), prepared)
+
+  # Executes the query and returns the header and a generator of batches of rows (with the values as they are in the DB),
+  # the rows are fetched while the generator is read and the connection is released when it's exhausted or closed.
+  def stream(self, query, binds=None, batchSize=1000):
+    pool = self.getPool()
+    connection = pool.acquire()
+    try:
+      cursor = connection.cursor()
+      cursor.arraysize = batchSize
+      cursor.execute(query, binds or {})
+      header = [col[0] for col in cursor.description]
+    except Exception:
+      pool.release(connection)
+      raise
+    def fetchBatches():
+      try:
+        yield None # the generator is started, so closing it releases the connection
+        while True:
+          rows = cursor.fetchmany(batchSize)
+          if (len(rows) == 0): return
+          yield rows
+      finally:
+        pool.release(connection)
+    batches = fetchBatches()
+    next(batches)
+    return (header, batches)
+
+defaultDatabase = Database()
+
+# Selects data from the default database, binds are the values of the query's bind variables.
+def SELECT(query, cb, binds=None):
+  return defaultDatabase.SELECT(query, cb, binds)
 
 # Converts SELECT data to a tuple of header and rows of the result.
 def SELECT2Data(cursor, separator='\t'):
@@ -68,19 +154,31 @@ def SELECT2Data(cursor, separator='\t'):
     rows.append(cols)
   return (header, rows)
 
+# Converts SELECT data to a tuple of header and rows with the values as they are in the DB.
+def SELECT2RawData(cursor):
+  header = [col[0] for col in cursor.description]
+  rows = [tuple(row) for row in cursor]
+  return (header, rows)
+
+# Converts the values of the raw data (see SELECT2RawData) to strings (as in SELECT2Data).
+def stringifyData(data):
+  (header, rows) = data
+  return (header, [[str(col) for col in row] for row in rows])
+
+# Converts SELECT data to a generator of batches of rows with the values converted to strings (as in SELECT2Data),
+# the rows are fetched from the DB batch by batch.
+def SELECT2Batches(cursor, batchSize=1000):
+  while True:
+    rows = cursor.fetchmany(batchSize)
+    if (len(rows) == 0): return
+    yield [[str(col) for col in row] for row in rows]
+
 # Converts SELECT data to string.
 def SELECT2String(cursor, separator='\t'):
-  cols = []
-  for col in cursor.description:
-    cols.append(col[0])
   # names of the columns
-  tableHeader = separator.join(cols)
-  rows = []
-  for row in cursor:
-    cols = []
-    for col in row:
-      cols.append(str(col))
-    rows.append(separator.join(cols))
+  lines = [separator.join([col[0] for col in cursor.description])]
   # the SELECT query rows
-  tableBody = '\n'.join(rows)
-  return tableHeader + '\n' + tableBody
+  for row in cursor:
+    lines.append(separator.join([str(col) for col in row]))
+  if (len(lines) == 1): lines.append('')
+  return '\n'.join(lines)
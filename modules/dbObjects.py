@@ -2,10 +2,17 @@
   dbObjects.py
 
   Description of database objects.
+  The functions below read the keys and build the join paths (see catalog.py for their versions).
 """
 
+import json
+import os
 from db import SELECT, SELECT2Data
 
+# When this file exists, the DB objects are read from it (a JSON list like the one below),
+# so the synonyms can be changed without restarting the server.
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon.json')
+
 # Synonyms in Russian language for database objects. 
 dbObjects = [
   {
@@ -117,79 +124,102 @@ dbObjects = [
   },
 ]
 
+# The DB objects (from the lexicon file if it exists) and the modification time of the file (None without it).
+def loadDbObjects(path=LEXICON_PATH):
+  if (not os.path.exists(path)): return (dbObjects, None)
+  with open(path, encoding='utf-8') as file:
+    return (json.load(file), os.path.getmtime(path))
+
 # Links from lemmas to DB objects.
-dbObjectsLemmas = {}
-for obj in dbObjects:
-  for lemma in obj['lemmas']:
-    if (lemma in dbObjectsLemmas):
-      if (isinstance(dbObjectsLemmas[lemma], list)):
-        dbObjectsLemmas[lemma].append(obj)
+def lemmasIndex(dbObjects):
+  dbObjectsLemmas = {}
+  for obj in dbObjects:
+    for lemma in obj['lemmas']:
+      if (lemma in dbObjectsLemmas):
+        if (isinstance(dbObjectsLemmas[lemma], list)):
+          dbObjectsLemmas[lemma].append(obj)
+        else:
+          dbObjectsLemmas[lemma] = [dbObjectsLemmas[lemma], obj]
       else:
-        dbObjectsLemmas[lemma] = [dbObjectsLemmas[lemma], obj]
-    else:
-      dbObjectsLemmas[lemma] = obj
-
-# Primary keys query
-(header, rows) = SELECT("""
-  SELECT LOWER(col.owner), LOWER(col.table_name), LOWER(col.column_name)
-  FROM USER_CONSTRAINTS con
-    JOIN USER_CONS_COLUMNS col ON con.constraint_name = col.constraint_name
-  WHERE con.constraint_type = 'P'
-""", SELECT2Data)
+        dbObjectsLemmas[lemma] = obj
+  return dbObjectsLemmas
 
-# Primary keys
-primaryKeys = {}
-for row in rows:
-  [schema, table, column] = row
-  if (table not in primaryKeys):
-    primaryKeys[table] = [column]
-  else:
-    primaryKeys[table].append(column)
-
-# Foreign keys query
-(header, rows) = SELECT("""
-  WITH constraints AS (
-    SELECT con.constraint_name
-         , con.r_constraint_name
-         , con.constraint_type
-         , col.owner
-         , col.table_name
-         , col.column_name
-         , col.position
+# Primary keys (table -> columns), select is db.SELECT of the database.
+def loadPrimaryKeys(select=SELECT):
+  (header, rows) = select("""
+    SELECT LOWER(col.owner), LOWER(col.table_name), LOWER(col.column_name)
     FROM USER_CONSTRAINTS con
       JOIN USER_CONS_COLUMNS col ON con.constraint_name = col.constraint_name
-  )
-  SELECT LOWER(L.constraint_name)
-       , LOWER(L.owner)
-       , LOWER(L.table_name)
-       , LOWER(L.column_name)
-       , LOWER(R.owner)
-       , LOWER(R.table_name)
-       , LOWER(R.column_name)
-  FROM constraints L
-    JOIN constraints R ON L.r_constraint_name = R.constraint_name
-                      AND L.Constraint_Type = 'R'
-                      AND L.position = R.position
-                      AND L.constraint_type = 'R'
-""", SELECT2Data)
+    WHERE con.constraint_type = 'P'
+  """, SELECT2Data)
+  primaryKeys = {}
+  for row in rows:
+    [schema, table, column] = row
+    if (table not in primaryKeys):
+      primaryKeys[table] = [column]
+    else:
+      primaryKeys[table].append(column)
+  return primaryKeys
 
-# Foreign keys
-references = {}
-for row in rows:
-  [refName, ownerL, tableL, columnL, ownerR, tableR, columnR] = row
-  if (tableL not in references):
-    references[tableL] = {}
-  if (tableR not in references[tableL]):
-    references[tableL][tableR] = {}
-  if (refName not in references[tableL][tableR]):
-    references[tableL][tableR][refName] = []
-  references[tableL][tableR][refName].append((columnL, columnR))
+# Foreign keys (tableL -> tableR -> name of the key -> pairs of the columns).
+def loadReferences(select=SELECT):
+  (header, rows) = select("""
+    WITH constraints AS (
+      SELECT con.constraint_name
+           , con.r_constraint_name
+           , con.constraint_type
+           , col.owner
+           , col.table_name
+           , col.column_name
+           , col.position
+      FROM USER_CONSTRAINTS con
+        JOIN USER_CONS_COLUMNS col ON con.constraint_name = col.constraint_name
+    )
+    SELECT LOWER(L.constraint_name)
+         , LOWER(L.owner)
+         , LOWER(L.table_name)
+         , LOWER(L.column_name)
+         , LOWER(R.owner)
+         , LOWER(R.table_name)
+         , LOWER(R.column_name)
+    FROM constraints L
+      JOIN constraints R ON L.r_constraint_name = R.constraint_name
+                        AND L.Constraint_Type = 'R'
+                        AND L.position = R.position
+                        AND L.constraint_type = 'R'
+  """, SELECT2Data)
+  references = {}
+  for row in rows:
+    [refName, ownerL, tableL, columnL, ownerR, tableR, columnR] = row
+    if (tableL not in references):
+      references[tableL] = {}
+    if (tableR not in references[tableL]):
+      references[tableL][tableR] = {}
+    if (refName not in references[tableL][tableR]):
+      references[tableL][tableR][refName] = []
+    references[tableL][tableR][refName].append((columnL, columnR))
+  return references
 
-# Shortest paths
-paths = {}
+# Time of the last DDL change of the tables (a change of the keys changes it too).
+def lastDDLTime(select=SELECT):
+  (header, rows) = select("""
+    SELECT MAX(last_ddl_time)
+    FROM USER_OBJECTS
+    WHERE object_type = 'TABLE'
+  """, SELECT2Data)
+  return rows[0][0] if len(rows) > 0 else None
+
+# NOT NULL columns of the tables ({ (table, column), ... }).
+def loadNotNullColumns(select=SELECT):
+  (header, rows) = select("""
+    SELECT LOWER(table_name), LOWER(column_name)
+    FROM USER_TAB_COLUMNS
+    WHERE nullable = 'N'
+  """, SELECT2Data)
+  return { (table, column) for [table, column] in rows }
 
 # Finds the shortest path from tableL to tableR.
-def findShortestPath(tableL, tableR, currentPath=[], passedTables=set()):
+def findShortestPath(references, tableL, tableR, currentPath=[], passedTables=set()):
   if (len(passedTables) == 0): passedTables = { tableL }
   if (len(currentPath) == 0): currentPath = [tableL]
   if (tableL == tableR): return currentPath[1:]
@@ -197,16 +227,21 @@ def findShortestPath(tableL, tableR, currentPath=[], passedTables=set()):
   allPaths = []
   for (nextTable, ref) in references[tableL].items():
     if (nextTable not in passedTables):
-      path = findShortestPath(nextTable, tableR, currentPath + [nextTable], passedTables | {nextTable})
+      path = findShortestPath(references, nextTable, tableR, currentPath + [nextTable], passedTables | {nextTable})
       if (path):
         allPaths.append(path)
   if (len(allPaths) == 0): return None
   else: return min(allPaths, key = lambda p: len(p))
 
-# Fills in the «paths» dictionary.
-for (tableL, refs) in references.items():
-  for (tableR, PKs) in primaryKeys.items():
-    if (tableL == tableR): continue
-    path = findShortestPath(tableL, tableR)
-    if (path):
-      paths[(tableL, tableR)] = path
+# Shortest paths (tableL, tableR) -> path from the tables in sources (all the referencing tables by default)
+# to the tables with primary keys.
+def findPaths(references, primaryKeys, sources=None):
+  paths = {}
+  for tableL in references:
+    if (sources != None and tableL not in sources): continue
+    for tableR in primaryKeys:
+      if (tableL == tableR): continue
+      path = findShortestPath(references, tableL, tableR)
+      if (path):
+        paths[(tableL, tableR)] = path
+  return paths
@@ -0,0 +1,89 @@
+"""
+  export.py
+
+  Streaming export of the query results as CSV, TSV or an HTML table (see db.SQLtable).
+  The rows are read from the cursor batch by batch and every batch is written out as soon as it's fetched,
+  so the memory used doesn't depend on the size of the result and the response is sent with chunked transfer.
+  NULL is exported as an empty value, TSV escapes tabs, line breaks and backslashes (\\t, \\n, \\r, \\\\).
+"""
+
+import csv
+import io
+from db import HTMLtableParts
+
+# Content types of the formats.
+FORMATS = {
+  'csv': 'text/csv; charset=utf-8',
+  'tsv': 'text/tab-separated-values; charset=utf-8',
+  'html': 'text/html; charset=utf-8'
+}
+# Number of rows fetched from the DB at once.
+BATCH_SIZE = 1000
+# Minimum size (in characters) of a chunk of the response.
+CHUNK_SIZE = 64 * 1024
+
+TSVescapes = str.maketrans({ '\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r' })
+
+# Value of a cell as a string.
+def cellValue(value):
+  return '' if value == None else str(value)
+
+# Lines of the CSV-file.
+def CSVparts(header, batches):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer, lineterminator='\r\n')
+  writer.writerow(header)
+  for batch in batches:
+    writer.writerows([[cellValue(value) for value in row] for row in batch])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+  yield buffer.getvalue()
+
+# Lines of the TSV-file.
+def TSVparts(header, batches):
+  yield '\t'.join([name.translate(TSVescapes) for name in header]) + '\n'
+  for batch in batches:
+    yield ''.join(['\t'.join([cellValue(value).translate(TSVescapes) for value in row]) + '\n' for row in batch])
+
+# Parts of the HTML table.
+def HTMLparts(header, batches):
+  return HTMLtableParts(header, ([cellValue(value) for value in row] for batch in batches for row in batch))
+
+# Joins the parts into chunks of at least CHUNK_SIZE characters (the first chunk is sent at once),
+# returns them encoded in UTF-8.
+def chunks(parts, size=CHUNK_SIZE):
+  buffer = []
+  length = 0
+  first = True
+  for part in parts:
+    buffer.append(part)
+    length += len(part)
+    if (first or length >= size):
+      yield ''.join(buffer).encode('utf-8')
+      (buffer, length, first) = ([], 0, False)
+  if (length > 0): yield ''.join(buffer).encode('utf-8')
+
+exporters = {
+  'csv': CSVparts,
+  'tsv': TSVparts,
+  'html': HTMLparts
+}
+
+# Body of an export response (a WSGI iterable): the chunks of the file in the format,
+# closing it closes the batches (releasing the connection) and calls onClose.
+class ExportStream:
+  def __init__(self, format, header, batches, onClose=None):
+    self.batches = batches
+    self.onClose = onClose
+    self.chunks = chunks(exporters[format](header, batches))
+
+  def __iter__(self):
+    return self.chunks
+
+  def close(self):
+    try:
+      self.chunks.close()
+      if (hasattr(self.batches, 'close')): self.batches.close()
+    finally:
+      if (self.onClose != None): self.onClose()
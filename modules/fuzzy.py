@@ -0,0 +1,79 @@
+"""
+  fuzzy.py
+
+  Fuzzy lookup of misspelled words (SymSpell-like).
+  For every known word all the variants with up to maxDistance deleted characters are indexed,
+  so a lookup only generates the deletes of the searched word and checks the few candidates found.
+  Only the first PREFIX_LENGTH characters are indexed, which keeps the index small
+  and the lookup time independent of the number of words.
+"""
+
+# Number of the first characters of a word used for the index.
+PREFIX_LENGTH = 7
+
+# All the variants of the word with up to distance characters deleted (including the word itself).
+def deletes(word, distance):
+  result = { word }
+  current = { word }
+  for _ in range(distance):
+    current = { w[:i] + w[i + 1:] for w in current for i in range(len(w)) }
+    result |= current
+  return result
+
+# Optimal string alignment distance (Levenshtein with transpositions),
+# returns maxDistance + 1 as soon as the distance is known to exceed maxDistance.
+def editDistance(a, b, maxDistance):
+  if (abs(len(a) - len(b)) > maxDistance): return maxDistance + 1
+  previousRow = None
+  row = list(range(len(b) + 1))
+  for i in range(1, len(a) + 1):
+    (beforeRow, previousRow) = (previousRow, row)
+    row = [i] + [0]*len(b)
+    for j in range(1, len(b) + 1):
+      cost = 0 if a[i - 1] == b[j - 1] else 1
+      row[j] = min(previousRow[j] + 1, row[j - 1] + 1, previousRow[j - 1] + cost)
+      if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+        row[j] = min(row[j], beforeRow[j - 2] + 1)
+    if (min(row) > maxDistance): return maxDistance + 1
+  return row[-1]
+
+# The allowed number of typos depending on the word's length.
+def allowedDistance(word):
+  if (len(word) < 5): return 0
+  if (len(word) < 8): return 1
+  return 2
+
+# Index of the known words.
+class FuzzyIndex:
+  def __init__(self, words=[], maxDistance=2):
+    self.maxDistance = maxDistance
+    self.words = set()
+    self.index = {} # delete -> set of words.
+    for word in words: self.add(word)
+
+  # Adds the word to the index.
+  def add(self, word):
+    if (word in self.words): return
+    self.words.add(word)
+    for delete in deletes(word[:PREFIX_LENGTH], self.maxDistance):
+      self.index.setdefault(delete, set()).add(word)
+
+  # Finds the closest known word, returns None if there is no close word or there are several of them.
+  def lookup(self, word, maxDistance=None):
+    if (word in self.words): return word
+    if (maxDistance == None): maxDistance = allowedDistance(word)
+    maxDistance = min(maxDistance, self.maxDistance)
+    if (maxDistance == 0): return None
+    best = []
+    bestDistance = maxDistance + 1
+    checked = set()
+    for delete in deletes(word[:PREFIX_LENGTH], maxDistance):
+      for candidate in self.index.get(delete, ()):
+        if (candidate in checked): continue
+        checked.add(candidate)
+        distance = editDistance(word, candidate, min(maxDistance, bestDistance))
+        if (distance < bestDistance):
+          (best, bestDistance) = ([candidate], distance)
+        elif (distance == bestDistance and distance <= maxDistance):
+          best.append(candidate)
+    return best[0] if len(best) == 1 else None
@@ -0,0 +1,93 @@
+"""
+  checkOptimizer.py
+
+  Check of the optimizer's rewrites (see optimizer.py) on the test database (stubs/).
+  The queries of CASES and random queries (see grammar.py) or the ones of a file (as for translateLog.py)
+  are translated with and without the optimization and both codes are executed: the header and the rows
+  (in any order, the ties of ORDER BY may be ordered differently) have to be the same.
+    python loadtest/checkOptimizer.py -n 2000 --columns 1-3 --conditions 0-2 --tables 2-3
+    python loadtest/checkOptimizer.py --input corpus.jsonl
+  The queries whose code fails without the optimization are skipped (that's not the optimizer's error),
+  the differing queries are printed and the exit code is 1 if there are any.
+"""
+
+import argparse
+import os
+import sys
+
+LOADTEST = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(LOADTEST, 'stubs'), os.path.dirname(LOADTEST)]
+
+from grammar import GrammarGenerator, parseRange
+from translateLog import readQueries
+
+# Queries checked every time (the rewrites which changed the results before).
+CASES = [
+  'название отделов и номер сотрудников', # the selected column is renamed by the join elimination
+  'имя сотрудников и номер отделов'
+]
+
+# Header and rows (sorted) of the translated query.
+def execute(translated):
+  from db import SELECT, SELECT2RawData
+  (header, rows) = SELECT(translated['result'], SELECT2RawData, translated['binds'])
+  return (header, sorted(rows, key=repr))
+
+# Executes the query translated with and without the optimization,
+# returns None if it's not rewritten (or not translated) and the two results otherwise.
+def compare(query):
+  from asq import parse, translate
+  parsed = parse(query)
+  if (parsed['status'] == 'error'): return None
+  (plain, optimized) = (translate(parsed, optimize=False), translate(parsed, optimize=True))
+  if (plain['status'] == 'error' or optimized['status'] == 'error' or len(optimized['rewrites']) == 0): return None
+  try:
+    expected = execute(plain)
+  except Exception:
+    return None
+  try:
+    result = execute(optimized)
+  except Exception as error:
+    result = (f'{type(error).__name__}: {error}', [])
+  return (plain['result'], expected, optimized['result'], result)
+
+def main():
+  argsParser = argparse.ArgumentParser(description='Compares the results of the optimized and not optimized queries.')
+  argsParser.add_argument('-n', '--count', type=int, default=1000, help='number of the queries')
+  argsParser.add_argument('--seed', type=int, default=0)
+  argsParser.add_argument('--columns', type=parseRange, default=(1, 3), help='selected columns, N or MIN-MAX')
+  argsParser.add_argument('--conditions', type=parseRange, default=(0, 2), help='WHERE conditions')
+  argsParser.add_argument('--groups', type=parseRange, default=(0, 0), help='grouping columns')
+  argsParser.add_argument('--sorts', type=parseRange, default=(0, 1), help='sorting columns')
+  argsParser.add_argument('--tables', type=parseRange, default=(2, 3), help='joined tables')
+  argsParser.add_argument('--input', help='JSONL or text file with the queries (instead of the random ones)')
+  argsParser.add_argument('--field', default='query', help='field of the query in JSONL')
+  argsParser.add_argument('--examples', type=int, default=10, help='number of the printed differences')
+  args = argsParser.parse_args()
+
+  if (args.input):
+    with open(args.input, encoding='utf-8') as inputFile:
+      queries = [query for (line, query) in readQueries(inputFile, args.field)]
+  else:
+    from asq import catalogs
+    generator = GrammarGenerator(
+      catalogs.current, args.seed, args.columns, args.conditions, args.groups, args.sorts, args.tables
+    )
+    queries = [generator.next() for i in range(args.count)]
+  (rewritten, differences) = (0, 0)
+  for query in CASES + queries:
+    compared = compare(query)
+    if (compared == None): continue
+    rewritten += 1
+    (plainSQL, expected, optimizedSQL, result) = compared
+    if (expected == result): continue
+    differences += 1
+    if (differences > args.examples): continue
+    if (expected[0] != result[0]): print(f'{query}\n  header {expected[0]} != {result[0]}')
+    else: print(f'{query}\n  rows differ')
+    print(f'{plainSQL}\n--\n{optimizedSQL}\n')
+  print(f'{len(CASES) + len(queries)} queries, {rewritten} rewritten, {differences} differ')
+  if (differences > 0): sys.exit(1)
+
+if __name__ == '__main__':
+  main()
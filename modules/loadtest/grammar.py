@@ -0,0 +1,267 @@
+"""
+  grammar.py
+
+  Grammar-driven query generator for the stress and scaling benchmarks.
+  Random queries are made by walking the machines of the patterns (patterns.py): a pattern's transitions are chosen
+  at random, subpatterns are walked recursively and the primitives are replaced by the words of their vocabularies,
+  the DB objects' lemmas (columns of the chosen tables, which are connected by the join paths), numbers and values.
+  The transitions going back in a machine are the repetitions (of columns, conditions, grouping and sorting columns),
+  they are taken as many times as the requested complexity needs, so the walk always ends.
+    python loadtest/grammar.py -n 10000 --columns 1-4 --conditions 0-3 --tables 1-3 -o corpus.jsonl
+  The DB objects are the ones of the test database (stubs/), the corpus can be translated by translateLog.py,
+  which reports the timings of every query (to find the slow inputs).
+  With --valid only the queries which are parsed and translated without errors are written
+  (the number of the ones crashing the parser or the translator is printed).
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+LOADTEST = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(LOADTEST, 'stubs'), os.path.dirname(LOADTEST)]
+
+from patterns import selectExpr, whereExpr, groupByExpr, orderByExpr
+from AbstractRegularExpressions import Pattern
+
+# Relative weights of the alternatives (by the name of the pattern or primitive), the others weigh 1.
+WEIGHTS = { 'number': 3, 'string': 1 }
+# Weights for the subpatterns walked by a pattern: (pattern, number of the subpattern in the walk) -> weights,
+# so a comparison has a column on the left and usually a literal on the right.
+SUBPATTERN_WEIGHTS = {
+  ('compare', 0): { 'literal': 0 },
+  ('compare', 2): { 'column': 1, 'literal': 3 }
+}
+# Probability of taking an optional element (of a pattern, the default one otherwise).
+OPTIONAL = { 'columnExpr': 0.15, 'stringQuoteContent': 1, 'stringDoubleQuoteContent': 1, None: 0.3 }
+# Values of the primitives without a vocabulary.
+NUMBERS = list(range(100, 25000, 100))
+VALUES = ['King', 'Chen', 'IT', 'Sales', 'Seattle', 'London', 'Europe']
+
+# Transitions of the machine which go back to a state on the way from the start (the repetitions)
+# and the states from which such a transition can be reached.
+def analyzeMachine(machine):
+  loops = set()
+  onPath = set()
+  done = set()
+  # Depth-first search marking the transitions to the states on the current path.
+  def visit(state):
+    onPath.add(state)
+    for transition in sortedTransitions(state):
+      nextState = transition.nextState
+      if (nextState == None): continue
+      if (nextState in onPath): loops.add(transition)
+      elif (nextState not in done): visit(nextState)
+    onPath.discard(state)
+    done.add(state)
+  visit(machine)
+  reachesLoop = {}
+  # Whether a repetition can be reached from the state (without repeating).
+  def reaches(state):
+    if (state == None): return False
+    if (state not in reachesLoop):
+      reachesLoop[state] = False
+      reachesLoop[state] = any(t in loops or reaches(t.nextState) for t in state.transitions)
+    return reachesLoop[state]
+  for state in done: reaches(state)
+  return (loops, reachesLoop)
+
+# Transitions of the state in a fixed order (so the same seed gives the same queries).
+def sortedTransitions(state):
+  return sorted(state.transitions, key = lambda t: (
+    t.pattern.name if t.pattern != None else '',
+    t.nextState.ID if t.nextState != None else 0
+  ))
+
+# Name of the transition's pattern or primitive (None for epsilon-transitions).
+def transitionName(transition):
+  return transition.pattern.name if transition.pattern != None else None
+
+# Makes random queries of the given complexity, catalog is a version of the DB objects (see catalog.py).
+# The parameters are pairs (minimum, maximum): the number of the selected columns (0 — a table is selected),
+# of the conditions, of the grouping and sorting columns, of the tables, and the number of repetitions
+# of the whole query (for long inputs).
+class GrammarGenerator:
+  def __init__(self, catalog, seed=0, columns=(1, 3), conditions=(0, 2), groups=(0, 0), sorts=(0, 1),
+               tables=(1, 2), repeat=(1, 1), weights=WEIGHTS, optional=OPTIONAL):
+    self.catalog = catalog
+    self.random = random.Random(seed)
+    self.ranges = {
+      'columns': columns, 'conditions': conditions, 'groups': groups,
+      'sorts': sorts, 'tables': tables, 'repeat': repeat
+    }
+    self.weights = weights
+    self.optional = optional
+    self.machines = {}
+    # Unambiguous lemmas of the columns of every table and the lemmas of the tables.
+    self.columnLemmas = {}
+    self.tableLemmas = {}
+    for obj in catalog.dbObjects:
+      if (obj['type'] == 'table'):
+        self.tableLemmas[obj['name']] = obj['lemmas']
+      elif (obj['type'] == 'column'):
+        lemmas = [l for l in obj['lemmas'] if not isinstance(catalog.dbObjectsLemmas.get(l), list)]
+        if (len(lemmas) > 0): self.columnLemmas.setdefault(obj['table'], []).append(lemmas)
+    self.connected = {}
+    for (tableL, tableR) in catalog.paths:
+      self.connected.setdefault(tableL, set()).add(tableR)
+      self.connected.setdefault(tableR, set()).add(tableL)
+    self.tables = []
+    self.columnCounter = 0
+
+  # The next random query.
+  def next(self):
+    return self.generate()[0]
+
+  # Makes a random query, returns it and it's parameters.
+  def generate(self):
+    parameters = { name: self.random.randint(*bounds) for (name, bounds) in self.ranges.items() }
+    self.tables = self.chooseTables(parameters['tables'])
+    self.columnCounter = 0
+    words = []
+    for i in range(parameters['repeat']):
+      if (parameters['columns'] > 0):
+        words += self.walk(selectExpr, { 'listOfColumns': parameters['columns'] - 1 }, { 'listOfTables': 0 })
+      else:
+        words += self.walk(selectExpr, {}, { 'listOfColumns': 0 })
+      # The tables without columns are selected as a whole.
+      for table in self.tables:
+        if (table not in self.columnLemmas): words.append(self.random.choice(self.tableLemmas[table]))
+      if (parameters['conditions'] > 0):
+        words += ['с'] + self.walk(whereExpr, { 'whereExpr': parameters['conditions'] - 1 })
+      if (parameters['groups'] > 0):
+        words += self.walk(groupByExpr, { 'groupByExpr': parameters['groups'] - 1 })
+      if (parameters['sorts'] > 0):
+        words += self.walk(orderByExpr, { 'orderByExpr': parameters['sorts'] - 1 })
+    parameters['tables'] = len(self.tables)
+    return (joinWords(words), parameters)
+
+  # Random connected tables (at least one of them has columns), as many as there are (up to count).
+  def chooseTables(self, count):
+    tables = [self.random.choice(sorted(self.columnLemmas))]
+    while (len(tables) < count):
+      candidates = sorted({ t for table in tables for t in self.connected.get(table, ()) if t in self.tableLemmas } - set(tables))
+      if (len(candidates) == 0): break
+      tables.append(self.random.choice(candidates))
+    return tables
+
+  # The repetitions and the states reaching them of the pattern's machine.
+  def machineOf(self, pattern):
+    if (pattern not in self.machines): self.machines[pattern] = analyzeMachine(pattern.machine)
+    return self.machines[pattern]
+
+  # Walks the pattern's machine, repetitions are the numbers of the repetitions to take in the machines of the patterns
+  # (by their names, none by default), weights override the weights of the alternatives (0 excludes one).
+  # Returns the words.
+  def walk(self, pattern, repetitions={}, weights={}):
+    (loops, reachesLoop) = self.machineOf(pattern)
+    repeats = repetitions.get(pattern.name, 0)
+    subpatterns = 0
+    words = []
+    state = pattern.machine
+    while True:
+      transitions = sortedTransitions(state)
+      transitions = [t for t in transitions if weights.get(transitionName(t), 1) > 0] or transitions
+      backward = [t for t in transitions if t in loops]
+      forward = [t for t in transitions if t not in loops]
+      if (repeats > 0 and len(backward) > 0):
+        transition = self.random.choice(backward)
+        repeats -= 1
+      else:
+        if (repeats > 0):
+          # Going on towards a repetition.
+          candidates = [t for t in forward if reachesLoop.get(t.nextState, False)]
+        else:
+          candidates = [t for t in forward if not reachesLoop.get(t.nextState, False)]
+        transition = self.choose(pattern, candidates or forward or backward, weights)
+      if (transition.pattern != None):
+        if (isinstance(transition.pattern, Pattern)):
+          subweights = SUBPATTERN_WEIGHTS.get((pattern.name, subpatterns), {})
+          words += self.walk(transition.pattern, repetitions, subweights)
+          subpatterns += 1
+        else: words.append(self.word(transition.pattern))
+      if (transition.nextState == None): return words
+      state = transition.nextState
+
+  # Chooses one of the transitions: an epsilon-transition (skipping an optional element) with the probability
+  # of skipping, the others by their weights.
+  def choose(self, pattern, transitions, weights):
+    epsilons = [t for t in transitions if t.pattern == None]
+    others = [t for t in transitions if t.pattern != None]
+    if (len(epsilons) > 0 and len(others) > 0):
+      optional = self.optional.get(pattern.name, self.optional[None])
+      if (self.random.random() >= optional): return self.random.choice(epsilons)
+    if (len(others) == 0): return self.random.choice(epsilons)
+    return self.random.choices(others, [
+      weights.get(transitionName(t), self.weights.get(transitionName(t), 1)) for t in others
+    ])[0]
+
+  # A word accepted by the primitive.
+  def word(self, primitive):
+    if (primitive.name == 'column'):
+      withColumns = [t for t in self.tables if t in self.columnLemmas]
+      table = withColumns[self.columnCounter % len(withColumns)]
+      self.columnCounter += 1
+      return self.random.choice(self.random.choice(self.columnLemmas[table]))
+    if (primitive.name == 'table'):
+      return self.random.choice(self.tableLemmas[self.random.choice(self.tables)])
+    if (primitive.name == 'number'): return str(self.random.choice(NUMBERS))
+    if (primitive.vocabulary): return self.random.choice(primitive.vocabulary)
+    return self.random.choice(VALUES)
+
+# Joins the words into a query (commas are attached to the previous words).
+def joinWords(words):
+  text = ''
+  for word in words:
+    text += word if (word == ',' or text == '') else ' ' + word
+  return text
+
+# Parses a range of integers: "N" or "MIN-MAX".
+def parseRange(text):
+  (low, high) = text.split('-', 1) if '-' in text else (text, text)
+  return (int(low), int(high))
+
+def main():
+  argsParser = argparse.ArgumentParser(description='Makes random queries from the patterns.')
+  argsParser.add_argument('-n', '--count', type=int, default=1000, help='number of the queries')
+  argsParser.add_argument('-o', '--output', help='JSONL file (standard output by default)')
+  argsParser.add_argument('--seed', type=int, default=0)
+  argsParser.add_argument('--columns', type=parseRange, default=(1, 3), help='selected columns, N or MIN-MAX')
+  argsParser.add_argument('--conditions', type=parseRange, default=(0, 2), help='WHERE conditions')
+  argsParser.add_argument('--groups', type=parseRange, default=(0, 0), help='grouping columns')
+  argsParser.add_argument('--sorts', type=parseRange, default=(0, 1), help='sorting columns')
+  argsParser.add_argument('--tables', type=parseRange, default=(1, 2), help='joined tables')
+  argsParser.add_argument('--repeat', type=parseRange, default=(1, 1), help='repetitions of the whole query')
+  argsParser.add_argument('--valid', action='store_true', help='only the queries translated without errors')
+  args = argsParser.parse_args()
+
+  from asq import catalogs, parse, translate
+  generator = GrammarGenerator(
+    catalogs.current, args.seed, args.columns, args.conditions, args.groups, args.sorts, args.tables, args.repeat
+  )
+  output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+  (written, rejected, crashed) = (0, 0, 0)
+  try:
+    while (written < args.count):
+      (query, parameters) = generator.generate()
+      if (args.valid):
+        try:
+          parsed = parse(query)
+          valid = parsed['status'] != 'error' and translate(parsed)['status'] != 'error'
+        except Exception:
+          # The queries crashing the parser or the translator are rejected too (and counted).
+          (valid, crashed) = (False, crashed + 1)
+        if (not valid):
+          rejected += 1
+          if (rejected > 100*args.count): break
+          continue
+      output.write(json.dumps(dict(parameters, query=query), ensure_ascii=False) + '\n')
+      written += 1
+  finally:
+    if (output is not sys.stdout): output.close()
+  if (args.valid): print(f'{written} queries written, {rejected} rejected ({crashed} crashed)', file=sys.stderr)
+
+if (__name__ == '__main__'):
+  main()
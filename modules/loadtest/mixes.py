@@ -0,0 +1,76 @@
+"""
+  mixes.py
+
+  Query mixes of the load tests.
+  A mix is a list of (weight, template) pairs, the templates' fields are filled with random values,
+  so the share of repeated queries (and cache hits) depends on the number of the values.
+"""
+
+import random
+
+MIXES = {
+  # Single table queries without conditions.
+  'lookup': [
+    (3, 'сотрудники'),
+    (2, 'имена сотрудников'),
+    (2, 'имя и фамилия сотрудников'),
+    (1, 'телефон и почта сотрудников'),
+    (1, 'отделы'),
+    (1, 'название отделов'),
+    (1, 'страны'),
+    (1, 'регионы')
+  ],
+  # Queries with conditions.
+  'filters': [
+    (3, 'сотрудники с зарплатой больше {salary}'),
+    (2, 'имя и фамилия сотрудников с зарплатой больше {salary}'),
+    (2, 'сотрудники с зарплатой меньше {salary}'),
+    (2, 'сотрудники с зарплатой больше {salary} и зарплатой меньше {maxSalary}'),
+    (1, 'сотрудники с зарплатой больше {salary} или без комиссионных'),
+    (1, 'сотрудники без комиссионных')
+  ],
+  # Queries joining tables.
+  'joins': [
+    (2, 'сотрудники отдел'),
+    (2, 'имена сотрудников и название отделов'),
+    (2, 'название отделов и имя сотрудников с зарплатой меньше {salary}'),
+    (1, 'название отделов и фамилии сотрудников с зарплатой больше {salary}')
+  ],
+  # Aggregates and sorting.
+  'aggregates': [
+    (2, 'средняя зарплата по отделам'),
+    (2, 'максимальная зарплата сотрудников'),
+    (1, 'средняя зарплата сотрудников'),
+    (2, 'сотрудники без комиссионных сортировка по зарплате по убыванию'),
+    (1, 'имена сотрудников сортировка по фамилии')
+  ],
+  # Queries which are not translated.
+  'errors': [
+    (1, 'абырвалг'),
+    (1, 'с и по'),
+    (1, 'отсортировать по убыванию')
+  ]
+}
+# All the mixes together, the errors are rare.
+MIXES['mixed'] = (
+  [(4*weight, template) for (weight, template) in MIXES['lookup']] +
+  [(4*weight, template) for (weight, template) in MIXES['filters']] +
+  [(2*weight, template) for (weight, template) in MIXES['joins']] +
+  [(2*weight, template) for (weight, template) in MIXES['aggregates']] +
+  [(weight, template) for (weight, template) in MIXES['errors']]
+)
+
+# Makes random queries of the mix, distinct is the number of the values of every field.
+class QueryGenerator:
+  def __init__(self, mix, seed=0, distinct=20):
+    self.templates = [template for (weight, template) in MIXES[mix]]
+    self.weights = [weight for (weight, template) in MIXES[mix]]
+    self.random = random.Random(seed)
+    self.values = {
+      'salary': [2000 + 500*i for i in range(distinct)],
+      'maxSalary': [12000 + 500*i for i in range(distinct)]
+    }
+
+  def next(self):
+    template = self.random.choices(self.templates, self.weights)[0]
+    return template.format(**{ field: self.random.choice(values) for (field, values) in self.values.items() })
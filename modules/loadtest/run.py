@@ -0,0 +1,206 @@
+"""
+  run.py
+
+  End-to-end load test of the server.
+  Starts server:app (waitress) with the stand-ins of Oracle and Mystem from loadtest/stubs
+  and drives it with an open-loop load: the requests are sent at the given rate (Poisson arrivals)
+  no matter how fast the server answers, and the latencies are measured from the time a request
+  was due to be sent, so a stalled server can't hide it's queueing delay.
+    python loadtest/run.py --rate 50 --duration 30 --mix lookup --mix mixed
+  With --no-server an already running server is tested (--host, --port).
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from mixes import MIXES, QueryGenerator
+
+LOADTEST = os.path.dirname(os.path.abspath(__file__))
+MODULES = os.path.dirname(LOADTEST)
+STUBS = os.path.join(LOADTEST, 'stubs')
+sys.path.append(MODULES)
+from translateLog import percentile
+
+# Seconds to wait for the server to start.
+START_TIMEOUT = 60
+
+# Starts the server with the stubs on the path, environment holds the settings of the stubs.
+def startServer(port, threads, environment):
+  env = dict(os.environ, **environment)
+  paths = [STUBS, MODULES]
+  if (env.get('PYTHONPATH')): paths.append(env['PYTHONPATH'])
+  env['PYTHONPATH'] = os.pathsep.join(paths)
+  return subprocess.Popen(
+    [sys.executable, '-m', 'waitress', f'--port={port}', f'--threads={threads}', 'server:app'],
+    cwd=MODULES, env=env
+  )
+
+# Waits until the server is ready (it's warm-up is over).
+def waitServer(host, port, process=None):
+  deadline = time.monotonic() + START_TIMEOUT
+  while time.monotonic() < deadline:
+    if (process != None and process.poll() != None):
+      raise RuntimeError(f'The server has exited with the code {process.returncode}!')
+    try:
+      connection = http.client.HTTPConnection(host, port, timeout=5)
+      connection.request('GET', '/health/ready')
+      if (connection.getresponse().status == 200): return
+    except OSError:
+      pass
+    time.sleep(0.5)
+  raise RuntimeError(f'The server hasn\'t started in {START_TIMEOUT} seconds!')
+
+# Sends a POST request, returns the status, the headers (in lower case) and the body.
+async def post(host, port, path, data, headers):
+  (reader, writer) = await asyncio.open_connection(host, port)
+  try:
+    body = json.dumps(data).encode('utf-8')
+    head = [f'POST {path} HTTP/1.1', f'Host: {host}:{port}', 'Content-Type: application/json',
+      f'Content-Length: {len(body)}', 'Connection: close']
+    head += [f'{name}: {value}' for (name, value) in headers.items()]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    responseHeaders = {}
+    while True:
+      line = (await reader.readline()).decode('latin-1').strip()
+      if (line == ''): break
+      (name, value) = line.split(':', 1)
+      responseHeaders[name.strip().lower()] = value.strip()
+    if ('content-length' in responseHeaders):
+      responseBody = await reader.readexactly(int(responseHeaders['content-length']))
+    else:
+      responseBody = await reader.read()
+    return (status, responseHeaders, responseBody)
+  finally:
+    writer.close()
+
+# Sends one query of the load, due is the (loop) time it was due to be sent.
+async def shoot(host, port, query, client, due, timeout):
+  result = { 'query': query }
+  try:
+    (status, headers, body) = await asyncio.wait_for(
+      post(host, port, '/asq', { 'query': query }, { 'X-Client-Id': client }), timeout
+    )
+    if (status != 200): result['error'] = f'http {status}'
+    elif (json.loads(body)['status'] == 'error'): result['error'] = 'translation'
+    result['cache'] = headers.get('x-asq-cache')
+  except asyncio.TimeoutError:
+    result['error'] = 'timeout'
+  except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+    result['error'] = 'connection'
+  result['latency'] = asyncio.get_running_loop().time() - due
+  return result
+
+# Sends the queries of the mix at the rate (per second) for the duration (in seconds).
+async def load(host, port, mix, rate, duration, clients, seed, timeout, distinct):
+  generator = QueryGenerator(mix, seed, distinct)
+  arrivals = random.Random(seed)
+  loop = asyncio.get_running_loop()
+  start = loop.time()
+  tasks = []
+  offset = 0.0
+  while offset < duration:
+    delay = start + offset - loop.time()
+    if (delay > 0): await asyncio.sleep(delay)
+    client = f'loadtest-{arrivals.randrange(clients)}'
+    tasks.append(asyncio.ensure_future(shoot(host, port, generator.next(), client, start + offset, timeout)))
+    offset += arrivals.expovariate(rate)
+  results = await asyncio.gather(*tasks)
+  return (results, loop.time() - start)
+
+# Summary of the results of the mix.
+def report(mix, rate, results, elapsed):
+  latencies = sorted(result['latency']*1000 for result in results if result.get('error') not in ['timeout', 'connection'])
+  errors = {}
+  caches = {}
+  for result in results:
+    if ('error' in result): errors[result['error']] = errors.get(result['error'], 0) + 1
+    if (result.get('cache') != None): caches[result['cache']] = caches.get(result['cache'], 0) + 1
+  succeeded = len(results) - sum(errors.values())
+  return {
+    'mix': mix,
+    'rate': rate,
+    'requests': len(results),
+    'seconds': elapsed,
+    'rps': succeeded/elapsed if elapsed > 0 else None,
+    'latency': {
+      'p50': percentile(latencies, 0.5),
+      'p95': percentile(latencies, 0.95),
+      'p99': percentile(latencies, 0.99),
+      'max': latencies[-1] if len(latencies) > 0 else None
+    },
+    'errors': errors,
+    'errorRate': sum(errors.values())/len(results) if len(results) > 0 else None,
+    'cache': caches
+  }
+
+# Prints the summaries as a table.
+def printReports(reports):
+  columns = ['mix', 'rate', 'rps', 'p50 ms', 'p95 ms', 'p99 ms', 'errors']
+  print(''.join(column.ljust(12) for column in columns))
+  for summary in reports:
+    latency = summary['latency']
+    values = [summary['mix'], summary['rate'], summary['rps']] + [latency[p] for p in ['p50', 'p95', 'p99']]
+    values = [f'{value:.1f}' if isinstance(value, float) else str(value) for value in values]
+    values.append(f'{100*summary["errorRate"]:.2f}%' if summary['errorRate'] != None else '-')
+    print(''.join(value.ljust(12) for value in values))
+    for (error, count) in sorted(summary['errors'].items()):
+      print(f'  {error}: {count}')
+
+def main():
+  argsParser = argparse.ArgumentParser(description='Load test of the server.')
+  argsParser.add_argument('--mix', action='append', choices=sorted(MIXES), help='query mix (all the mixes by default)')
+  argsParser.add_argument('--rate', type=float, default=20, help='requests per second')
+  argsParser.add_argument('--duration', type=float, default=30, help='seconds of load for every mix')
+  argsParser.add_argument('--warmup', type=float, default=5, help='seconds of unmeasured load before every mix')
+  argsParser.add_argument('--clients', type=int, default=100, help='number of the clients (X-Client-Id, trusted from 127.0.0.1)')
+  argsParser.add_argument('--distinct', type=int, default=20, help='number of the values of the queries\' fields')
+  argsParser.add_argument('--timeout', type=float, default=30, help='seconds to wait for a response')
+  argsParser.add_argument('--seed', type=int, default=1)
+  argsParser.add_argument('--host', default='127.0.0.1')
+  argsParser.add_argument('--port', type=int, default=8765)
+  argsParser.add_argument('--threads', type=int, default=8, help='threads of the server')
+  argsParser.add_argument('--employees', type=int, default=107, help='number of the employees in the test database')
+  argsParser.add_argument('--db-delay', type=float, default=0.005, help='seconds added to every database query')
+  argsParser.add_argument('--mystem-delay', type=float, default=0.002, help='seconds added to every Mystem call')
+  argsParser.add_argument('--no-server', action='store_true', help='test an already running server')
+  argsParser.add_argument('--output', help='JSON file for the results')
+  args = argsParser.parse_args()
+
+  process = None
+  if (not args.no_server):
+    process = startServer(args.port, args.threads, {
+      'ASQ_TRUSTED_PROXIES': '127.0.0.1', # the clients are told apart by X-Client-Id
+      'ASQ_STUB_EMPLOYEES': str(args.employees),
+      'ASQ_STUB_DB_DELAY': str(args.db_delay),
+      'ASQ_STUB_MYSTEM_DELAY': str(args.mystem_delay)
+    })
+  try:
+    waitServer(args.host, args.port, process)
+    reports = []
+    for mix in args.mix or [mix for mix in MIXES]:
+      if (args.warmup > 0):
+        asyncio.run(load(args.host, args.port, mix, args.rate, args.warmup, args.clients, args.seed + 1, args.timeout, args.distinct))
+      (results, elapsed) = asyncio.run(
+        load(args.host, args.port, mix, args.rate, args.duration, args.clients, args.seed, args.timeout, args.distinct)
+      )
+      reports.append(report(mix, args.rate, results, elapsed))
+  finally:
+    if (process != None):
+      process.terminate()
+      process.wait()
+  printReports(reports)
+  if (args.output):
+    with open(args.output, 'w', encoding='utf-8') as file:
+      json.dump(reports, file, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+  main()
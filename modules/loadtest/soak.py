@@ -0,0 +1,79 @@
+"""
+  soak.py
+
+  Memory leak check of the translator.
+  Runs thousands of queries through parse and translate (with the stand-ins of Oracle and Mystem)
+  and checks that the resident memory and the number of objects stop growing after the warm-up:
+  the growth between the first and the last measurement (after the warm-up) has to stay under the limits.
+    python loadtest/soak.py --requests 20000
+  Exits with the code 1 if the memory or objects keep growing.
+"""
+
+import argparse
+import gc
+import os
+import resource
+import sys
+import tracemalloc
+
+LOADTEST = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(LOADTEST, 'stubs'), os.path.dirname(LOADTEST)]
+
+from asq import parse, translate
+from mixes import MIXES, QueryGenerator
+
+# Resident memory of the process in bytes.
+def residentMemory():
+  try:
+    with open('/proc/self/statm') as file:
+      return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except OSError:
+    # Maximum resident memory (in kilobytes on Linux, in bytes on macOS).
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+# Memory and objects after a full garbage collection.
+def measure():
+  gc.collect()
+  return { 'rss': residentMemory(), 'objects': len(gc.get_objects()), 'traced': tracemalloc.get_traced_memory()[0] }
+
+def main():
+  argsParser = argparse.ArgumentParser(description='Checks that translating queries doesn\'t leak memory.')
+  argsParser.add_argument('--requests', type=int, default=20000, help='number of the measured queries')
+  argsParser.add_argument('--warmup', type=int, default=2000, help='number of the queries before the first measurement')
+  argsParser.add_argument('--mix', default='mixed', choices=sorted(MIXES))
+  argsParser.add_argument('--distinct', type=int, default=1000, help='number of the values of the queries\' fields')
+  argsParser.add_argument('--max-rss', type=float, default=8, help='allowed growth of the resident memory (MB)')
+  argsParser.add_argument('--max-objects', type=int, default=2000, help='allowed growth of the number of objects')
+  argsParser.add_argument('--max-traced', type=float, default=2, help='allowed growth of the traced memory (MB)')
+  args = argsParser.parse_args()
+
+  tracemalloc.start()
+  generator = QueryGenerator(args.mix, 0, args.distinct)
+  # Translates the next query.
+  def run():
+    parsed = parse(generator.next())
+    if (parsed['status'] == 'success'): translate(parsed)
+
+  for i in range(args.warmup): run()
+  measurements = [measure()]
+  for i in range(1, args.requests + 1):
+    run()
+    if (i % max(1, args.requests // 10) == 0):
+      measurements.append(measure())
+      print(f'{i} queries: ' + ', '.join(f'{key} {value}' for (key, value) in measurements[-1].items()))
+
+  (first, last) = (measurements[0], measurements[-1])
+  growth = { key: last[key] - first[key] for key in first }
+  limits = { 'rss': args.max_rss * 2**20, 'objects': args.max_objects, 'traced': args.max_traced * 2**20 }
+  exceeded = [key for key in limits if growth[key] > limits[key]]
+  print('growth: ' + ', '.join(f'{key} {value}' for (key, value) in growth.items()))
+  if (len(exceeded) > 0):
+    print('The growth exceeds the limits: ' + ', '.join(exceeded), file=sys.stderr)
+    snapshot = tracemalloc.take_snapshot()
+    for stat in snapshot.statistics('lineno')[:10]: print(stat, file=sys.stderr)
+    sys.exit(1)
+  print('OK')
+
+if __name__ == '__main__':
+  main()
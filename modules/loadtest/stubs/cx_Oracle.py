@@ -0,0 +1,258 @@
+"""
+  cx_Oracle.py
+
+  Stand-in for cx_Oracle used by the load tests.
+  The HR schema (and the part of the data dictionary read by dbObjects.py) is generated
+  into a temporary SQLite database, every connection opens it's own SQLite connection to it.
+  ASQ_STUB_EMPLOYEES sets the number of employees, ASQ_STUB_DB_DELAY — seconds added to every query
+  (the network round trip of the real database).
+"""
+
+import atexit
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+
+EMPLOYEES = int(os.environ.get('ASQ_STUB_EMPLOYEES', 107))
+DB_DELAY = float(os.environ.get('ASQ_STUB_DB_DELAY', 0))
+SEED = 42
+
+SCHEMA = """
+  CREATE TABLE regions (
+    region_id INTEGER NOT NULL PRIMARY KEY,
+    region_name TEXT
+  );
+  CREATE TABLE countries (
+    country_id TEXT NOT NULL PRIMARY KEY,
+    country_name TEXT,
+    region_id INTEGER REFERENCES regions
+  );
+  CREATE TABLE locations (
+    location_id INTEGER NOT NULL PRIMARY KEY,
+    street_address TEXT,
+    postal_code TEXT,
+    city TEXT NOT NULL,
+    state_province TEXT,
+    country_id TEXT REFERENCES countries
+  );
+  CREATE TABLE departments (
+    department_id INTEGER NOT NULL PRIMARY KEY,
+    department_name TEXT NOT NULL,
+    manager_id INTEGER REFERENCES employees,
+    location_id INTEGER REFERENCES locations
+  );
+  CREATE TABLE employees (
+    employee_id INTEGER NOT NULL PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    phone_number TEXT,
+    hire_date TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    salary REAL,
+    commission_pct REAL,
+    manager_id INTEGER REFERENCES employees,
+    department_id INTEGER REFERENCES departments
+  );
+  CREATE TABLE user_tab_columns (
+    table_name TEXT,
+    column_name TEXT,
+    nullable TEXT
+  );
+  CREATE TABLE user_objects (
+    object_name TEXT,
+    object_type TEXT,
+    last_ddl_time TEXT
+  );
+  CREATE TABLE user_constraints (
+    owner TEXT,
+    constraint_name TEXT,
+    constraint_type TEXT,
+    table_name TEXT,
+    r_constraint_name TEXT
+  );
+  CREATE TABLE user_cons_columns (
+    owner TEXT,
+    constraint_name TEXT,
+    table_name TEXT,
+    column_name TEXT,
+    position INTEGER
+  );
+"""
+
+REGIONS = [(1, 'Europe'), (2, 'Americas'), (3, 'Asia'), (4, 'Middle East and Africa')]
+COUNTRIES = [
+  ('UK', 'United Kingdom', 1), ('DE', 'Germany', 1), ('FR', 'France', 1), ('IT', 'Italy', 1),
+  ('US', 'United States of America', 2), ('CA', 'Canada', 2), ('BR', 'Brazil', 2),
+  ('JP', 'Japan', 3), ('CN', 'China', 3), ('IN', 'India', 3),
+  ('EG', 'Egypt', 4), ('IL', 'Israel', 4)
+]
+LOCATIONS = [
+  (1400, '2014 Jabberwocky Rd', '26192', 'Southlake', 'Texas', 'US'),
+  (1500, '2011 Interiors Blvd', '99236', 'South San Francisco', 'California', 'US'),
+  (1700, '2004 Charade Rd', '98199', 'Seattle', 'Washington', 'US'),
+  (1800, '147 Spadina Ave', 'M5V 2L7', 'Toronto', 'Ontario', 'CA'),
+  (2400, '8204 Arthur St', None, 'London', None, 'UK'),
+  (2500, 'Magdalen Centre', 'OX9 9ZB', 'Oxford', 'Oxford', 'UK'),
+  (2700, 'Schwanthalerstr. 7031', '80925', 'Munich', 'Bavaria', 'DE')
+]
+DEPARTMENTS = [
+  (10, 'Administration', 1700), (20, 'Marketing', 1800), (30, 'Purchasing', 1700),
+  (40, 'Human Resources', 2400), (50, 'Shipping', 1500), (60, 'IT', 1400),
+  (70, 'Public Relations', 2700), (80, 'Sales', 2500), (90, 'Executive', 1700),
+  (100, 'Finance', 1700), (110, 'Accounting', 1700), (120, 'Treasury', 1700)
+]
+FIRST_NAMES = [
+  'Steven', 'Neena', 'Lex', 'Alexander', 'Bruce', 'David', 'Valli', 'Diana', 'Nancy', 'Daniel',
+  'John', 'Ismael', 'Luis', 'Den', 'Shelli', 'Sigal', 'Guy', 'Karen', 'Matthew', 'Adam',
+  'Payam', 'Shanta', 'Kevin', 'Julia', 'Irene', 'James', 'Jason', 'Michael', 'Pat', 'Susan'
+]
+LAST_NAMES = [
+  'King', 'Kochhar', 'De Haan', 'Hunold', 'Ernst', 'Austin', 'Pataballa', 'Lorentz', 'Greenberg',
+  'Faviet', 'Chen', 'Sciarra', 'Urman', 'Popp', 'Raphaely', 'Khoo', 'Baida', 'Tobias', 'Himuro',
+  'Colmenares', 'Weiss', 'Fripp', 'Kaufling', 'Vollman', 'Mourgos', 'Nayer', 'Mikkilineni',
+  'Landry', 'Markle', 'Bissot', 'Atkinson', 'Marlow', 'Olson', 'Mallin', 'Rogers', 'Gee', 'Whalen',
+  'Hartstein', 'Fay', 'Mavris', 'Baer', 'Higgins', 'Gietz'
+]
+JOBS = ['AD_PRES', 'AD_VP', 'IT_PROG', 'FI_ACCOUNT', 'PU_CLERK', 'ST_CLERK', 'SA_REP', 'SA_MAN', 'MK_REP']
+# Constraints: name, type, table, columns, referenced constraint.
+CONSTRAINTS = [
+  ('REG_ID_PK', 'P', 'REGIONS', ['REGION_ID'], None),
+  ('COUNTRY_C_ID_PK', 'P', 'COUNTRIES', ['COUNTRY_ID'], None),
+  ('LOC_ID_PK', 'P', 'LOCATIONS', ['LOCATION_ID'], None),
+  ('DEPT_ID_PK', 'P', 'DEPARTMENTS', ['DEPARTMENT_ID'], None),
+  ('EMP_EMP_ID_PK', 'P', 'EMPLOYEES', ['EMPLOYEE_ID'], None),
+  ('COUNTR_REG_FK', 'R', 'COUNTRIES', ['REGION_ID'], 'REG_ID_PK'),
+  ('LOC_C_ID_FK', 'R', 'LOCATIONS', ['COUNTRY_ID'], 'COUNTRY_C_ID_PK'),
+  ('DEPT_LOC_FK', 'R', 'DEPARTMENTS', ['LOCATION_ID'], 'LOC_ID_PK'),
+  ('DEPT_MGR_FK', 'R', 'DEPARTMENTS', ['MANAGER_ID'], 'EMP_EMP_ID_PK'),
+  ('EMP_DEPT_FK', 'R', 'EMPLOYEES', ['DEPARTMENT_ID'], 'DEPT_ID_PK'),
+  ('EMP_MANAGER_FK', 'R', 'EMPLOYEES', ['MANAGER_ID'], 'EMP_EMP_ID_PK')
+]
+
+# Generates the HR schema into a new SQLite file, returns it's path.
+def createDatabase():
+  (handle, path) = tempfile.mkstemp(prefix='asq-hr-', suffix='.sqlite')
+  os.close(handle)
+  atexit.register(os.remove, path)
+  generator = random.Random(SEED)
+  connection = sqlite3.connect(path)
+  connection.executescript(SCHEMA)
+  connection.executemany('INSERT INTO regions VALUES (?, ?)', REGIONS)
+  connection.executemany('INSERT INTO countries VALUES (?, ?, ?)', COUNTRIES)
+  connection.executemany('INSERT INTO locations VALUES (?, ?, ?, ?, ?, ?)', LOCATIONS)
+  employees = []
+  for number in range(EMPLOYEES):
+    ID = 100 + number
+    (firstName, lastName) = (generator.choice(FIRST_NAMES), generator.choice(LAST_NAMES))
+    job = 'AD_PRES' if number == 0 else generator.choice(JOBS[1:])
+    employees.append((
+      ID, firstName, lastName, (firstName[0] + lastName.replace(' ', '')).upper()[:8] + str(ID),
+      f'515.{generator.randint(100, 999)}.{generator.randint(1000, 9999)}',
+      f'{generator.randint(2001, 2008)}-{generator.randint(1, 12):02}-{generator.randint(1, 28):02}', job,
+      24000 if number == 0 else generator.randrange(2100, 17000, 100),
+      round(generator.choice([0.1, 0.15, 0.2, 0.25, 0.3]), 2) if job.startswith('SA_') else None,
+      None if number == 0 else 100 + generator.randrange(0, min(number, 20)),
+      90 if number == 0 else (None if generator.random() < 0.01 else generator.choice(DEPARTMENTS)[0])
+    ))
+  connection.executemany('INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', employees)
+  managers = [employee[0] for employee in employees[:20]]
+  connection.executemany('INSERT INTO departments VALUES (?, ?, ?, ?)', [
+    (ID, name, generator.choice(managers) if ID < 120 else None, location)
+    for (ID, name, location) in DEPARTMENTS
+  ])
+  connection.executemany('INSERT INTO user_objects VALUES (?, ?, ?)', [
+    (table, 'TABLE', '2008-01-01 00:00:00') for table in ['REGIONS', 'COUNTRIES', 'LOCATIONS', 'DEPARTMENTS', 'EMPLOYEES']
+  ])
+  for table in ['REGIONS', 'COUNTRIES', 'LOCATIONS', 'DEPARTMENTS', 'EMPLOYEES']:
+    connection.executemany('INSERT INTO user_tab_columns VALUES (?, ?, ?)', [
+      (table, column.upper(), 'N' if notNull else 'Y')
+      for (cid, column, columnType, notNull, default, primaryKey) in list(connection.execute(f'PRAGMA table_info({table})'))
+    ])
+  for (name, constraintType, table, columns, referenced) in CONSTRAINTS:
+    connection.execute(
+      'INSERT INTO user_constraints VALUES (?, ?, ?, ?, ?)', ('HR', name, constraintType, table, referenced)
+    )
+    connection.executemany('INSERT INTO user_cons_columns VALUES (?, ?, ?, ?, ?)', [
+      ('HR', name, table, column, position) for (position, column) in enumerate(columns, 1)
+    ])
+  connection.commit()
+  connection.close()
+  return path
+
+DATABASE_PATH = createDatabase()
+
+# The base class of the database errors.
+class DatabaseError(Exception):
+  pass
+
+# Cursor with the column names in upper case, as Oracle has them.
+class Cursor:
+  def __init__(self, connection):
+    self.cursor = connection.cursor()
+    self.description = None
+    self.arraysize = 100
+
+  def execute(self, statement, parameters=None, **keywordParameters):
+    if (DB_DELAY > 0): time.sleep(DB_DELAY)
+    try:
+      self.cursor.execute(statement, parameters or keywordParameters or {})
+    except sqlite3.Error as error:
+      raise DatabaseError(str(error))
+    description = self.cursor.description or []
+    self.description = [(col[0].upper(),) + tuple(col[1:]) for col in description] or None
+    return self
+
+  # Compiles the statement without executing it (the bind variables are NULL).
+  def parse(self, statement):
+    if (DB_DELAY > 0): time.sleep(DB_DELAY)
+    try:
+      self.cursor.execute(f'EXPLAIN {statement}', { name: None for name in re.findall(r':(\w+)', statement) })
+    except sqlite3.Error as error:
+      raise DatabaseError(str(error))
+
+  def fetchone(self):
+    return self.cursor.fetchone()
+
+  def fetchmany(self, numRows=None):
+    return self.cursor.fetchmany(numRows or self.arraysize)
+
+  def fetchall(self):
+    return self.cursor.fetchall()
+
+  def __iter__(self):
+    return iter(self.cursor)
+
+  def close(self):
+    self.cursor.close()
+
+# Connection to the generated database.
+class Connection:
+  def __init__(self):
+    self.connection = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
+
+  def cursor(self):
+    return Cursor(self.connection)
+
+  def commit(self):
+    self.connection.commit()
+
+  def close(self):
+    self.connection.close()
+
+def connect(*args, **kwargs):
+  return Connection()
+
+# Pool of connections (every acquire opens a new SQLite connection).
+class SessionPool:
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def acquire(self):
+    return Connection()
+
+  def release(self, connection):
+    connection.close()
@@ -0,0 +1,95 @@
+"""
+  pymystem3.py
+
+  Deterministic stand-in for Mystem used by the load tests.
+  Words are lemmatized with a fixed table of the wordforms of the test queries,
+  the other words are returned as unknown (as Mystem does with the words it guesses).
+  ASQ_STUB_MYSTEM_DELAY sets seconds added to every call (the round trip to the Mystem process).
+"""
+
+import os
+import re
+import time
+
+MYSTEM_DELAY = float(os.environ.get('ASQ_STUB_MYSTEM_DELAY', 0))
+
+# lemma -> (grammar, wordforms)
+LEMMAS = {
+  'сотрудник': ('S,муж,од', ['сотрудник', 'сотрудники', 'сотрудников', 'сотрудника', 'сотрудникам', 'сотрудниками']),
+  'работник': ('S,муж,од', ['работник', 'работники', 'работников']),
+  'отдел': ('S,муж,неод', ['отдел', 'отделы', 'отделов', 'отдела', 'отделам', 'отделе']),
+  'департамент': ('S,муж,неод', ['департамент', 'департаменты', 'департаментов']),
+  'страна': ('S,жен,неод', ['страна', 'страны', 'стран', 'странам']),
+  'регион': ('S,муж,неод', ['регион', 'регионы', 'регионов', 'регионам']),
+  'локация': ('S,жен,неод', ['локация', 'локации', 'локаций']),
+  'номер': ('S,муж,неод', ['номер', 'номера', 'номеров']),
+  'идентификатор': ('S,муж,неод', ['идентификатор', 'идентификаторы']),
+  'имя': ('S,сред,неод', ['имя', 'имена', 'имени', 'именем']),
+  'фамилия': ('S,жен,неод', ['фамилия', 'фамилии', 'фамилией', 'фамилий']),
+  'почта': ('S,жен,неод', ['почта', 'почту', 'почты']),
+  'телефон': ('S,муж,неод', ['телефон', 'телефоны', 'телефонов']),
+  'комиссионные': ('S,мн,неод', ['комиссионные', 'комиссионных', 'комиссионными']),
+  'зарплата': ('S,жен,неод', ['зарплата', 'зарплаты', 'зарплат', 'зарплате', 'зарплату', 'зарплатой']),
+  'оклад': ('S,муж,неод', ['оклад', 'оклады', 'окладом']),
+  'менеджер': ('S,муж,од', ['менеджер', 'менеджеры', 'менеджеров']),
+  'руководитель': ('S,муж,од', ['руководитель', 'руководители', 'руководителей']),
+  'название': ('S,сред,неод', ['название', 'названия', 'названий']),
+  'средний': ('A', ['средний', 'средняя', 'среднее', 'средние', 'среднюю']),
+  'максимальный': ('A', ['максимальный', 'максимальная', 'максимальное', 'максимальную']),
+  'минимальный': ('A', ['минимальный', 'минимальная', 'минимальное', 'минимальную']),
+  'сумма': ('S,жен,неод', ['сумма', 'сумму', 'суммы']),
+  'сколько': ('ADV', ['сколько']),
+  'количество': ('S,сред,неод', ['количество']),
+  'округлять': ('V', ['округлить', 'округленная', 'округленный']),
+  'много': ('ADV', ['больше']),
+  'мало': ('ADV', ['меньше']),
+  'выше': ('ADV', ['выше']),
+  'ниже': ('ADV', ['ниже']),
+  'равный': ('A', ['равно', 'равна', 'равен', 'равный']),
+  'сортировка': ('S,жен,неод', ['сортировка', 'сортировкой']),
+  'отсортировывать': ('V', ['отсортировать', 'отсортированные']),
+  'возрастание': ('S,сред,неод', ['возрастанию', 'возрастание']),
+  'убывание': ('S,сред,неод', ['убыванию', 'убывание']),
+  'по': ('PR', ['по']),
+  'среди': ('PR', ['среди']),
+  'с': ('PR', ['с', 'со']),
+  'без': ('PR', ['без']),
+  'у': ('PR', ['у']),
+  'и': ('CONJ', ['и']),
+  'или': ('CONJ', ['или']),
+  'не': ('PART', ['не']),
+  'нет': ('PART', ['нет']),
+  'быть': ('V', ['есть'])
+}
+WORDFORMS = { form: (lemma, grammar) for (lemma, (grammar, forms)) in LEMMAS.items() for form in forms }
+
+tokenPattern = re.compile(r'(\d+)|([^\W\d_]+(?:-[^\W\d_]+)*)|([\W_]+)')
+
+class Mystem:
+  def __init__(self, *args, **kwargs):
+    pass
+
+  # Analyzes the text, the result has the same structure as the one of Mystem.analyze.
+  def analyze(self, text):
+    if (MYSTEM_DELAY > 0): time.sleep(MYSTEM_DELAY)
+    analyzed = []
+    for match in tokenPattern.finditer(text):
+      (number, word, other) = match.groups()
+      if (word != None):
+        known = WORDFORMS.get(word.lower())
+        if (known != None):
+          analyzed.append({ 'text': word, 'analysis': [{ 'lex': known[0], 'wt': 1, 'gr': known[1] }] })
+        elif (re.search('[а-яё]', word, re.IGNORECASE)):
+          analyzed.append({ 'text': word, 'analysis': [{ 'lex': word.lower(), 'wt': 1, 'gr': 'S', 'qual': 'bastard' }] })
+        else:
+          analyzed.append({ 'text': word, 'analysis': [] })
+      else:
+        analyzed.append({ 'text': number if number != None else other })
+    analyzed.append({ 'text': '\n' })
+    return analyzed
+
+  def lemmatize(self, text):
+    return [token['analysis'][0]['lex'] if token.get('analysis') else token['text'] for token in self.analyze(text)]
+
+  def close(self):
+    pass
@@ -0,0 +1,131 @@
+"""
+  memprofile.py
+
+  Memory accounting of the requests (turned on by the ASQ_TRACEMALLOC environment variable).
+  The allocations are traced by tracemalloc, the change of the traced memory is recorded
+  for every stage (parse, translate, execute) and request, and the allocation sites which grew the most
+  since the baseline snapshot are shown on /debug/memory.
+  tracemalloc traces the whole process, so with concurrent requests the deltas include
+  the allocations of the other threads, they are exact only under the sequential load.
+"""
+
+import linecache
+import os
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# Whether the profiler is on and the number of frames stored for every allocation.
+ENABLED = os.environ.get('ASQ_TRACEMALLOC', '') not in ['', '0']
+FRAMES = int(os.environ.get('ASQ_TRACEMALLOC_FRAMES', 1))
+# Number of the last requests kept.
+RECENT_SIZE = 100
+
+# Statistics of the memory deltas (in bytes) of a stage.
+class DeltaStats:
+  def __init__(self):
+    self.count = 0
+    self.total = 0
+    self.max = 0
+
+  def add(self, delta):
+    self.count += 1
+    self.total += delta
+    self.max = max(self.max, delta)
+
+  def toDict(self):
+    return {
+      'count': self.count,
+      'total': self.total,
+      'average': self.total/self.count if self.count > 0 else None,
+      'max': self.max
+    }
+
+# Records the memory deltas of the stages and requests.
+class MemoryProfiler:
+  def __init__(self, enabled=ENABLED, frames=FRAMES):
+    self.enabled = enabled
+    self.frames = frames
+    self.lock = threading.Lock()
+    self.stages = {}
+    self.requests = DeltaStats()
+    self.recent = deque(maxlen=RECENT_SIZE)
+    self.baseline = None
+    if (enabled):
+      if (not tracemalloc.is_tracing()): tracemalloc.start(frames)
+      self.baseline = self.snapshot()
+
+  # Snapshot of the traced allocations without the ones of tracemalloc itself.
+  def snapshot(self):
+    return tracemalloc.take_snapshot().filter_traces([
+      tracemalloc.Filter(False, tracemalloc.__file__),
+      tracemalloc.Filter(False, linecache.__file__)
+    ])
+
+  # Measures the memory delta of the block (nothing is done if the profiler is off).
+  def stage(self, name):
+    return self.measure(name) if self.enabled else nullcontext()
+
+  @contextmanager
+  def measure(self, name):
+    before = tracemalloc.get_traced_memory()[0]
+    try:
+      yield
+    finally:
+      delta = tracemalloc.get_traced_memory()[0] - before
+      with self.lock:
+        self.stages.setdefault(name, DeltaStats()).add(delta)
+
+  # Measures the memory delta of the request, label identifies it in the recent requests.
+  def request(self, label):
+    return self.measureRequest(label) if self.enabled else nullcontext()
+
+  @contextmanager
+  def measureRequest(self, label):
+    before = tracemalloc.get_traced_memory()[0]
+    try:
+      yield
+    finally:
+      delta = tracemalloc.get_traced_memory()[0] - before
+      with self.lock:
+        self.requests.add(delta)
+        self.recent.append({ 'request': label, 'delta': delta })
+
+  # The allocation sites which grew the most since the baseline.
+  def topSites(self, limit=20):
+    if (not self.enabled): return []
+    differences = self.snapshot().compare_to(self.baseline, 'traceback' if self.frames > 1 else 'lineno')
+    return [{
+      'site': [f'{frame.filename}:{frame.lineno}' for frame in difference.traceback],
+      'size': difference.size,
+      'sizeDiff': difference.size_diff,
+      'count': difference.count,
+      'countDiff': difference.count_diff
+    } for difference in differences[:limit]]
+
+  # Makes the current allocations the baseline and forgets the statistics.
+  def reset(self):
+    if (not self.enabled): return
+    baseline = self.snapshot()
+    with self.lock:
+      self.baseline = baseline
+      self.stages = {}
+      self.requests = DeltaStats()
+      self.recent.clear()
+
+  # Traced memory and the deltas of the stages and requests.
+  def stats(self):
+    if (not self.enabled): return { 'enabled': False }
+    (current, peak) = tracemalloc.get_traced_memory()
+    with self.lock:
+      return {
+        'enabled': True,
+        'traced': current,
+        'tracedPeak': peak,
+        'stages': { name: stats.toDict() for (name, stats) in self.stages.items() },
+        'requests': self.requests.toDict(),
+        'recent': list(self.recent)
+      }
+
+memoryProfiler = MemoryProfiler()
@@ -0,0 +1,183 @@
+"""
+  optimizer.py
+
+  Rewrites of the translated query which use the keys of the tables (see OracleTranslator.py).
+  The translator joins every table to the one it references (by a foreign key), so a join never
+  multiplies the rows when the referenced columns contain the table's primary key. That makes the rewrites safe:
+    - a joined table whose only used columns are the ones it's joined by is removed
+      (the columns are taken from the referencing table, which is checked for NULL if they are nullable,
+      and the selected ones keep their names, so the header of the result doesn't change);
+    - joined tables used only in the WHERE conditions are checked by EXISTS (a semi-join);
+    - ORDER BY of a query selecting only aggregates (one row) is dropped.
+  Every rewrite that fired is reported.
+"""
+
+from QueryIR import TableRef, ColumnRef, Operation, Condition, SortKey, Query
+
+AGGREGATES = ['AVG', 'MAX', 'MIN', 'COUNT', 'SUM']
+
+# Tables referenced by the object (column, table, operation, condition, sort key or connector).
+def tablesOf(obj):
+  if (isinstance(obj, ColumnRef)): return { obj.table }
+  if (isinstance(obj, TableRef)): return { obj.name }
+  if (isinstance(obj, Operation)): return tablesOf(obj.target)
+  if (isinstance(obj, SortKey)): return tablesOf(obj.target)
+  if (isinstance(obj, Condition)): return set().union(*[tablesOf(t) for t in obj.targets])
+  return set()
+
+# Columns and tables referenced by the object.
+def referencesOf(obj):
+  if (isinstance(obj, (ColumnRef, TableRef))): return [obj]
+  if (isinstance(obj, (Operation, SortKey))): return referencesOf(obj.target)
+  if (isinstance(obj, Condition)): return [ref for t in obj.targets for ref in referencesOf(t)]
+  return []
+
+# Replaces the columns of the object by the mapping (ColumnRef -> ColumnRef).
+def substitute(obj, mapping):
+  if (isinstance(obj, ColumnRef)): return mapping.get(obj, obj)
+  if (isinstance(obj, Operation)): return Operation(obj.operator, substitute(obj.target, mapping))
+  if (isinstance(obj, SortKey)): return SortKey(substitute(obj.target, mapping), obj.desc)
+  if (isinstance(obj, Condition)):
+    return Condition(obj.negated, obj.operator, tuple(substitute(t, mapping) for t in obj.targets))
+  return obj
+
+# The query with the columns replaced by the mapping.
+def substituteQuery(query, mapping):
+  return Query(*[tuple(substitute(obj, mapping) for obj in part) for part in query.values()])
+
+# Whether the object is an aggregate (or a function of one).
+def isAggregate(obj):
+  return isinstance(obj, Operation) and (obj.operator in AGGREGATES or isAggregate(obj.target))
+
+# Conditions of a WHERE/HAVING section (without the connectors).
+def conditionsOf(section):
+  return [c for c in section if isinstance(c, Condition)]
+
+# Joins the conditions by AND (as a WHERE/HAVING section).
+def conjunction(conditions):
+  section = []
+  for condition in conditions:
+    if (len(section) > 0): section.append('AND')
+    section.append(condition)
+  return tuple(section)
+
+# Rewrites the joins of the translated query,
+# primaryKeys are the keys of the tables and notNull — the (table, column) pairs of the NOT NULL columns.
+class QueryOptimizer:
+  def __init__(self, primaryKeys, notNull):
+    self.primaryKeys = primaryKeys
+    self.notNull = notNull
+
+  # Optimizes the query (QueryIR.Query) joined by the joins ((mainTable, refTable, [(colA, colB), ...]), ...).
+  # Returns the rewritten query, the remaining joins, the semi-joins ((joins, conditions), ...),
+  # the names of the selected columns which were renamed by the rewrites ({ index in SELECT: name })
+  # and the descriptions of the rewrites.
+  def optimize(self, query, joins):
+    rewrites = []
+    aliases = {}
+    (query, joins) = self.eliminateJoins(query, list(joins), aliases, rewrites)
+    (query, joins, semiJoins) = self.makeSemiJoins(query, joins, rewrites)
+    query = self.dropOrderBy(query, rewrites)
+    return (query, joins, semiJoins, aliases, rewrites)
+
+  # Whether the columns of the table contain it's primary key (so they identify a row).
+  def isUnique(self, table, columns):
+    keys = self.primaryKeys.get(table)
+    return bool(keys) and set(keys) <= set(columns)
+
+  # Whether the WHERE conditions (joined by AND) filter out the rows where the column is NULL.
+  def impliesNotNull(self, query, column):
+    if ('OR' in query.where): return False
+    for condition in conditionsOf(query.where):
+      if (column not in condition.targets): continue
+      if ('NULL' not in condition.operator): return True # comparisons with NULL are never true
+      if ((condition.operator == 'IS NOT NULL') != condition.negated): return True
+    return False
+
+  # Removes the joined tables (leaves of the joins) whose only used columns are the ones they are joined by,
+  # the original names of the replaced columns in SELECT are put into aliases.
+  def eliminateJoins(self, query, joins, aliases, rewrites):
+    references = [ref for part in query.values()[1:] for obj in part for ref in referencesOf(obj)]
+    # The tables are joined after the ones they are joined to, so the leaves come first from the end.
+    for join in reversed(list(joins)):
+      (mainTable, refTable, cols) = join
+      if (any(j[0] == refTable for j in joins)): continue # other tables are joined through it
+      joinColumns = { colB: colA for (colA, colB) in cols }
+      uses = { ref for ref in references if tablesOf(ref) == { refTable } }
+      if (any(not isinstance(ref, ColumnRef) or ref.name not in joinColumns for ref in uses)): continue
+      if (not self.isUnique(refTable, joinColumns)): continue
+      # The name of an expression is it's code, so it would change with the column.
+      if (any(not isinstance(obj, ColumnRef) and len(set(referencesOf(obj)) & uses) > 0 for obj in query.select)):
+        continue
+      # Rows with NULL in the referencing columns are removed by the join.
+      nullable = [
+        ColumnRef(mainTable, colA) for (colA, colB) in cols
+        if (mainTable, colA) not in self.notNull and not self.impliesNotNull(query, ColumnRef(mainTable, colA))
+      ]
+      if (len(nullable) > 0 and 'OR' in query.where): continue
+      mapping = { ref: ColumnRef(mainTable, joinColumns[ref.name]) for ref in uses }
+      for (i, obj) in enumerate(query.select):
+        if (obj in mapping and mapping[obj].name != obj.name and i not in aliases): aliases[i] = obj.name
+      query = substituteQuery(query, mapping)
+      if (len(nullable) > 0):
+        notNullChecks = [Condition(False, 'IS NOT NULL', (column,)) for column in nullable]
+        query = Query(
+          query.tables, query.select, conjunction(conditionsOf(query.where) + notNullChecks),
+          query.having, query.groupBy, query.orderBy
+        )
+      joins.remove(join)
+      references = [ref for part in query.values()[1:] for obj in part for ref in referencesOf(obj)]
+      rewrites.append({ 'rewrite': 'joinElimination', 'tables': [refTable], 'notNullChecks': len(nullable) })
+    return (query, joins)
+
+  # Moves the joined tables used only in the WHERE conditions (joined by AND) into EXISTS subqueries.
+  def makeSemiJoins(self, query, joins, rewrites):
+    if ('OR' in query.where): return (query, joins, [])
+    children = {}
+    for join in joins:
+      children.setdefault(join[0], []).append(join)
+    # Joins of the table and of the tables joined through it.
+    def subtree(join):
+      result = [join]
+      for child in children.get(join[1], []): result += subtree(child)
+      return result
+    output = set().union(*[tablesOf(obj) for part in [query.select, query.having, query.groupBy, query.orderBy] for obj in part])
+    conditions = conditionsOf(query.where)
+    candidates = []
+    for join in joins:
+      if (any(join[0] in {j[1] for j in candidate} for candidate in candidates)): continue
+      tree = subtree(join)
+      tables = { j[1] for j in tree }
+      if (len(tables & output) > 0): continue
+      if (not all(self.isUnique(refTable, [colB for (colA, colB) in cols]) for (mainTable, refTable, cols) in tree)):
+        continue
+      candidates.append(tree)
+    # A condition may be moved only into one subquery.
+    while True:
+      tableSets = [{ j[1] for j in tree } for tree in candidates]
+      shared = [
+        i for (i, tables) in enumerate(tableSets)
+        if any(len(tablesOf(c) & tables) > 0 and any(len(tablesOf(c) & other) > 0 for other in tableSets if other is not tables)
+               for c in conditions)
+      ]
+      if (len(shared) == 0): break
+      candidates = [tree for (i, tree) in enumerate(candidates) if i not in shared]
+    semiJoins = []
+    for tree in candidates:
+      tables = { j[1] for j in tree }
+      moved = [c for c in conditions if len(tablesOf(c) & tables) > 0]
+      if (len(moved) == 0): continue # not used at all, but not removable either
+      conditions = [c for c in conditions if c not in moved]
+      joins = [j for j in joins if j not in tree]
+      semiJoins.append((tree, moved))
+      rewrites.append({ 'rewrite': 'semiJoin', 'tables': [j[1] for j in tree] })
+    if (len(semiJoins) > 0):
+      query = Query(query.tables, query.select, conjunction(conditions), query.having, query.groupBy, query.orderBy)
+    return (query, joins, semiJoins)
+
+  # Drops ORDER BY when only aggregates are selected without GROUP BY (the result is one row).
+  def dropOrderBy(self, query, rewrites):
+    if (len(query.orderBy) == 0 or len(query.groupBy) > 0): return query
+    if (not all(isAggregate(obj) for obj in query.select)): return query
+    rewrites.append({ 'rewrite': 'orderByDropped' })
+    return Query(query.tables, query.select, query.where, query.having, query.groupBy, ())
@@ -5,6 +5,7 @@
 """
 
 from AbstractRegularExpressions import Primitive, Pattern, PatternToken, Automata, printPattern, OR, Structure
+from compiledPatterns import loadCompiledPatterns
 
 class Token:
   def __init__(self, text, tokenType='text', lemma='', grammar='', index=-1):
@@ -36,14 +37,22 @@ def lemmasPart(token, lemmas):
     if l in text: return True
   return False
 
+# Makes a primitive which compares the token's lemma or text to the lemmas.
+def lemmasPrimitive(name, lemmas):
+  return Primitive(name, lambda token: lemmasCompare(token, lemmas), lemmas)
+
+# Makes a primitive which compares the token's text to the texts.
+def textPrimitive(name, texts):
+  return Primitive(name, lambda token: textCompare(token, texts), texts)
+
 # Basic primitives
-connector = Primitive('connector', lambda token: lemmasCompare(token, [',', 'и']))
+connector = lemmasPrimitive('connector', [',', 'и'])
 
 # Number
 numberP = Primitive('number', lambda token: token.type in ['number'])
 # String
-quoteP = Primitive('quote', lambda token: lemmasPart(token, ['\'']))
-doubleQuoteP = Primitive('doubleQuote', lambda token: lemmasPart(token, ['"']))
+quoteP = Primitive('quote', lambda token: lemmasPart(token, ['\'']), ['\''])
+doubleQuoteP = Primitive('doubleQuote', lambda token: lemmasPart(token, ['"']), ['"'])
 nonQuoteP = Primitive('nonQuote', lambda token: not lemmasPart(token, ['\'']))
 nonDoubleQuoteP = Primitive('nonDoubleQuote', lambda token: not lemmasPart(token, ['"']))
 stringQuoteContent = Pattern('stringQuoteContent', (nonQuoteP, '*'))
@@ -57,19 +66,19 @@ stringP = Pattern(
 literal = Pattern('literal', numberP |OR| stringP)
 
 # Operators
-isNullP = Primitive('isNull', lambda token: lemmasCompare(token, ['без', 'нет']))
-isNotNullP = Primitive('isNotNull', lambda token: lemmasCompare(token, ['быть']))
-notP = Primitive('not', lambda token: lemmasCompare(token, ['не']))
+isNullP = lemmasPrimitive('isNull', ['без', 'нет'])
+isNotNullP = lemmasPrimitive('isNotNull', ['быть'])
+notP = lemmasPrimitive('not', ['не'])
 
 # Functions
-roundP = Primitive('round', lambda token: lemmasCompare(token, ['округлять']))
+roundP = lemmasPrimitive('round', ['округлять'])
 
 # Aggregate functions
-avgP = Primitive('avg', lambda token: lemmasCompare(token, ['средний', 'усреднять', 'avg']))
-maxP = Primitive('max', lambda token: lemmasCompare(token, ['большой', 'высокий', 'максимальный']))
-minP = Primitive('min', lambda token: lemmasCompare(token, ['маленький', 'низкий', 'минимальный']))
-countP = Primitive('count', lambda token: lemmasCompare(token, ['сколько', 'количество']))
-sumP = Primitive('sum', lambda token: lemmasCompare(token, ['сумма', 'суммировать']))
+avgP = lemmasPrimitive('avg', ['средний', 'усреднять', 'avg'])
+maxP = lemmasPrimitive('max', ['большой', 'высокий', 'максимальный'])
+minP = lemmasPrimitive('min', ['маленький', 'низкий', 'минимальный'])
+countP = lemmasPrimitive('count', ['сколько', 'количество'])
+sumP = lemmasPrimitive('sum', ['сумма', 'суммировать'])
 
 # Operator's patterns
 function = Pattern('function', roundP)
@@ -86,31 +95,34 @@ listOfColumns = Pattern('listOfColumns', [columnExpr, ([connector, columnExpr],
 selectExpr = Pattern('selectExpr', [listOfColumns |OR| listOfTables])
 
 # Conditions
-orP = Primitive('or', lambda token: lemmasCompare(token, ['или']))
-gt = Primitive('gt', lambda token: textCompare(token, ['>', 'больше', 'выше', 'превышать']))
-lt = Primitive('lt', lambda token: textCompare(token, ['<', 'меньше', 'ниже']))
-eq = Primitive('eq', lambda token: lemmasCompare(token, ['=', 'равный']))
+orP = lemmasPrimitive('or', ['или'])
+gt = textPrimitive('gt', ['>', 'больше', 'выше', 'превышать'])
+lt = textPrimitive('lt', ['<', 'меньше', 'ниже'])
+eq = lemmasPrimitive('eq', ['=', 'равный'])
 ge = Pattern('ge', [gt, orP, eq] |OR| [notP, lt])
 le = Pattern('le', [lt, orP, eq] |OR| [notP, gt])
-logicalConnector = Primitive('logicalConnector', lambda token: lemmasCompare(token, [',', 'и', 'или']))
+logicalConnector = lemmasPrimitive('logicalConnector', [',', 'и', 'или'])
 compareOperator = Pattern('compareOperator', gt |OR| lt |OR| eq |OR| ge |OR| le)
 compare = Pattern('compare', [(notP, '?'), columnLiteralExpr, compareOperator, columnLiteralExpr])
 check = Pattern('check', [(notP, '?'), isNullP |OR| isNotNullP, columnExpr])
 whereExpr = Pattern('whereExpr', [compare |OR| check, ([logicalConnector, compare |OR| check], '*')])
 
 # Grouping
-groupPreposition = Primitive('groupPreposition', lambda token: lemmasCompare(token, ['по', 'среди']))
+groupPreposition = lemmasPrimitive('groupPreposition', ['по', 'среди'])
 groupByExpr = Pattern(
   'groupByExpr',
   [groupPreposition, columnExpr, ([connector, (groupPreposition, '?'), columnExpr], '*'), (table, '?')]
 )
 
 # Sorting
-sortP = Primitive('sort', lambda token: lemmasPart(token, ['сортиров']))
-by = Primitive('by', lambda token: lemmasCompare(token, ['по']))
-ascP = Primitive('asc', lambda token: lemmasCompare(token, ['возрастание']))
-descP = Primitive('desc', lambda token: lemmasCompare(token, ['убывание']))
+sortP = Primitive('sort', lambda token: lemmasPart(token, ['сортиров']), ['сортировка', 'отсортировать'])
+by = lemmasPrimitive('by', ['по'])
+ascP = lemmasPrimitive('asc', ['возрастание'])
+descP = lemmasPrimitive('desc', ['убывание'])
 asc = Pattern('asc', [by, ascP])
 desc = Pattern('desc', [by, descP])
 sortColumn = Pattern('sortColumn', [(by, '?'), columnExpr, (asc |OR| desc, '?')])
 orderByExpr = Pattern('orderByExpr', [sortP, sortColumn, ([connector, sortColumn], '*')])
+
+# Machines of the patterns are loaded from the compiled file (if it's up to date).
+compiled = loadCompiledPatterns()
@@ -0,0 +1,274 @@
+"""
+  resultsets.py
+
+  Server-side result sets of the paged queries.
+  The rows of a query are fetched in batches and written into a temporary file
+  (every row is a 4-byte length followed by the marshalled row), the first page is returned
+  as soon as it's written and the rest of the rows are written in the background.
+  The next pages are read from the memory-mapped file by the result set's token.
+  Result sets expire after the TTL (since the last access), and when the files exceed the disk budget
+  the least recently used result sets are deleted.
+"""
+
+import atexit
+import marshal
+import mmap
+import os
+import secrets
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from db import SELECT2Batches
+
+# Default and maximum number of rows of a page.
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+# Seconds a result set is kept since the last access.
+TTL = 600
+# Maximum size of all the files (in bytes).
+MAX_DISK_BYTES = 1024 * 1024 * 1024
+# Number of rows fetched from the DB at once.
+BATCH_SIZE = 1000
+# Seconds to wait for the rows of a page which are not written yet.
+WAIT_TIMEOUT = 60
+
+lengthFormat = struct.Struct('<I')
+
+# Raised when the result set is not found (expired or deleted).
+class ResultSetNotFound(Exception):
+  pass
+
+# Rows of a query in a temporary file.
+class ResultSet:
+  def __init__(self, store, token, path, pageSize):
+    self.store = store
+    self.token = token
+    self.path = path
+    self.pageSize = pageSize
+    self.header = None
+    self.pageOffsets = array('Q') # offsets of the first rows of the pages
+    self.rows = 0
+    self.size = 0
+    self.complete = False
+    self.truncated = False
+    self.error = None
+    self.closed = False
+    self.map = None
+    self.accessed = time.monotonic()
+    self.condition = threading.Condition()
+
+  # Writes the rows of the cursor into the file (a callback for db.SELECT).
+  def spill(self, cursor):
+    self.spillRows([col[0] for col in cursor.description], SELECT2Batches(cursor, BATCH_SIZE))
+
+  # Writes the batches of rows into the file.
+  def spillRows(self, header, batches):
+    with self.condition:
+      self.header = header
+      self.condition.notify_all()
+    try:
+      with open(self.path, 'wb') as file:
+        for batch in batches:
+          chunk = bytearray()
+          offsets = []
+          for (number, row) in enumerate(batch, self.rows):
+            if (number % self.pageSize == 0): offsets.append(self.size + len(chunk))
+            data = marshal.dumps(row)
+            chunk += lengthFormat.pack(len(data))
+            chunk += data
+          if (self.closed): return
+          if (not self.store.reserve(self, len(chunk))):
+            self.truncated = True
+            break
+          file.write(chunk)
+          file.flush()
+          with self.condition:
+            self.pageOffsets.extend(offsets)
+            self.rows += len(batch)
+            self.size += len(chunk)
+            self.condition.notify_all()
+    except Exception as error:
+      with self.condition:
+        self.error = error
+      raise
+    finally:
+      with self.condition:
+        self.complete = True
+        self.condition.notify_all()
+
+  # Records the error of the query.
+  def fail(self, error):
+    with self.condition:
+      self.error = error
+      self.complete = True
+      self.condition.notify_all()
+
+  # Returns the rows of the page (numbered from 0), waits for them if they are not written yet.
+  def page(self, number):
+    self.accessed = time.monotonic()
+    with self.condition:
+      ready = self.condition.wait_for(
+        lambda: self.complete or self.rows >= (number + 1)*self.pageSize, WAIT_TIMEOUT
+      )
+      if (self.error != None): raise self.error
+      if (self.closed): raise ResultSetNotFound(self.token)
+      if (not ready): raise TimeoutError(f'Page {number} of {self.token} is not ready')
+      if (number >= len(self.pageOffsets)): return []
+      start = self.pageOffsets[number]
+      count = min(self.pageSize, self.rows - number*self.pageSize)
+      (complete, size) = (self.complete, self.size)
+    if (complete):
+      # The file doesn't change anymore, it's mapped once.
+      with self.condition:
+        if (self.map == None): self.map = self.mapFile(size)
+        data = self.map
+      try:
+        return readRows(data, start, count)
+      except ValueError:
+        raise ResultSetNotFound(self.token) # closed while reading
+    data = self.mapFile(size)
+    try:
+      return readRows(data, start, count)
+    finally:
+      data.close()
+
+  # Maps the first size bytes of the file into memory.
+  def mapFile(self, size):
+    with open(self.path, 'rb') as file:
+      return mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+
+  # Description of the result set for the responses (total is known when all the rows are written).
+  def describe(self):
+    with self.condition:
+      return {
+        'token': self.token,
+        'pageSize': self.pageSize,
+        'rows': self.rows,
+        'complete': self.complete,
+        'total': self.rows if self.complete else None,
+        'truncated': self.truncated
+      }
+
+  # Deletes the file (a running spill stops after the current batch).
+  def close(self):
+    with self.condition:
+      self.closed = True
+      if (self.map != None):
+        self.map.close()
+        self.map = None
+      self.condition.notify_all()
+    try:
+      os.remove(self.path)
+    except OSError:
+      pass
+
+# Reads count rows starting at the offset.
+def readRows(data, offset, count):
+  rows = []
+  for i in range(count):
+    (length,) = lengthFormat.unpack_from(data, offset)
+    offset += lengthFormat.size
+    rows.append(marshal.loads(data[offset:offset + length]))
+    offset += length
+  return rows
+
+# The result sets by their tokens.
+class ResultSetStore:
+  def __init__(self, directory=None, ttl=TTL, maxBytes=MAX_DISK_BYTES):
+    if (directory == None):
+      directory = tempfile.mkdtemp(prefix='asq-results-')
+      atexit.register(shutil.rmtree, directory, True)
+    self.directory = directory
+    self.ttl = ttl
+    self.maxBytes = maxBytes
+    self.resultSets = {}
+    self.reserved = {} # token -> bytes
+    self.lock = threading.Lock()
+    self.evicted = 0
+    self.expired = 0
+
+  # Makes a new empty result set.
+  def create(self, pageSize):
+    self.sweep()
+    token = secrets.token_urlsafe(16)
+    resultSet = ResultSet(self, token, os.path.join(self.directory, token + '.rows'), pageSize)
+    with self.lock:
+      self.resultSets[token] = resultSet
+      self.reserved[token] = 0
+    return resultSet
+
+  # Runs the query in a background thread writing the rows into a new result set,
+  # select is db.SELECT or a function with the same signature, onDone is called when all the rows are written
+  # (or the query has failed).
+  def execute(self, select, SQL, binds, pageSize=PAGE_SIZE, onDone=None):
+    resultSet = self.create(pageSize)
+    def run():
+      try:
+        select(SQL, resultSet.spill, binds)
+      except Exception as error:
+        resultSet.fail(error)
+      finally:
+        if (onDone != None): onDone()
+    threading.Thread(target=run, name='resultset', daemon=True).start()
+    return resultSet
+
+  # Makes a result set of the rows which are already in memory (e.g. the cached ones).
+  def fromRows(self, header, rows, pageSize=PAGE_SIZE):
+    resultSet = self.create(pageSize)
+    resultSet.spillRows(header, (rows[i:i + BATCH_SIZE] for i in range(0, len(rows), BATCH_SIZE)))
+    return resultSet
+
+  # The result set by the token, raises ResultSetNotFound if it's expired or deleted.
+  def get(self, token):
+    self.sweep()
+    with self.lock:
+      resultSet = self.resultSets.get(token)
+    if (resultSet == None): raise ResultSetNotFound(token)
+    return resultSet
+
+  # Reserves the disk space for the result set's rows, deleting the least recently used result sets if needed,
+  # returns False if there is not enough space even without them.
+  def reserve(self, resultSet, size):
+    evicted = []
+    with self.lock:
+      if (resultSet.token not in self.reserved): return False
+      used = sum(self.reserved.values())
+      others = sorted(
+        (r for r in self.resultSets.values() if r is not resultSet),
+        key = lambda r: r.accessed
+      )
+      while (used + size > self.maxBytes and len(others) > 0):
+        other = others.pop(0)
+        used -= self.reserved.pop(other.token)
+        del self.resultSets[other.token]
+        evicted.append(other)
+      fits = used + size <= self.maxBytes
+      if (fits): self.reserved[resultSet.token] += size
+      self.evicted += len(evicted)
+    for other in evicted: other.close()
+    return fits
+
+  # Deletes the expired result sets.
+  def sweep(self):
+    now = time.monotonic()
+    with self.lock:
+      expired = [r for r in self.resultSets.values() if r.accessed + self.ttl < now]
+      for resultSet in expired:
+        del self.resultSets[resultSet.token]
+        del self.reserved[resultSet.token]
+      self.expired += len(expired)
+    for resultSet in expired: resultSet.close()
+
+  # Number and size of the result sets.
+  def stats(self):
+    with self.lock:
+      return {
+        'resultSets': len(self.resultSets),
+        'bytes': sum(self.reserved.values()),
+        'maxBytes': self.maxBytes,
+        'evicted': self.evicted,
+        'expired': self.expired
+      }
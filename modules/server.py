@@ -10,38 +10,443 @@
 
 import falcon
 import json
-from Asq import parse, translate
-from db import SELECT, SELECT2Data
+import time
+from contextlib import ExitStack
+from asq import parse, translate, fastTokenizer, sharedCache, matcherStats, COUNT_MATCHING
+from db import SELECT2RawData, stringifyData
+from cache import ResultCache
+from tenants import loadTenants, UnknownTenant, TENANT_HEADER, DEFAULT_TENANT
+from admission import Rejected, lanes, clientLimiter, admissionStats, TRUSTED_PROXIES
+from slowlog import SlowLog
+from memprofile import memoryProfiler
+from resultsets import ResultSetNotFound, MAX_PAGE_SIZE
+from warmup import Warmup
+from export import FORMATS, BATCH_SIZE as EXPORT_BATCH_SIZE, ExportStream
 
-# The only rout of the server (/asq), translates the passed query and returns the result from DB.
+# The schemas (see tenants.py), the snapshots are refreshed and the DB objects are reloaded in the background.
+tenants = loadTenants()
+for tenant in tenants.values(): tenant.start()
+slowLog = SlowLog()
+slowLog.start()
+# The frequent queries of the logs are analyzed and the connections are opened before the worker is ready.
+warmup = Warmup(tenants)
+warmup.start()
+
+# The tenant of the request (set by the X-Asq-Tenant header).
+def tenantFor(req):
+  name = req.get_header(TENANT_HEADER) or DEFAULT_TENANT
+  if (name not in tenants): raise UnknownTenant(name)
+  return tenants[name]
+
+# Parses and translates the query with the tenant's catalog, returns the parsed query, the translated one,
+# whether it's executed locally (translated is None if parsing has failed) and the durations of the stages.
+def analyze(query, tenant):
+  snapshot = tenant.snapshot
+  def run():
+    stages = {}
+    start = time.perf_counter()
+    with memoryProfiler.stage('parse'):
+      parsed = parse(query, tenant.catalogs.current)
+    stages['parse'] = time.perf_counter() - start
+    if (parsed['status'] == 'error'):
+      return (parsed, None, False, stages)
+    # Queries using only the snapshot's tables are executed locally.
+    tables = [t.name for t in parsed['result'].tables]
+    local = snapshot.covers(tables)
+    start = time.perf_counter()
+    with memoryProfiler.stage('translate'):
+      translated = translate(parsed, 'sqlite' if local else 'oracle')
+    stages['translate'] = time.perf_counter() - start
+    return (parsed, translated, local, stages)
+  (result, shared) = tenant.analysisFlights.do(' '.join(query.split()), run)
+  return result
+
+# Executes the translated query in the tenant's database, caching the result.
+def execute(parsed, translated, local, tenant):
+  (SQL, binds) = (translated['result'], translated['binds'])
+  def run():
+    with memoryProfiler.stage('execute'):
+      rawResult = selectFor(tenant, local)(SQL, SELECT2RawData, binds)
+    tenant.subsumptionCache.put(parsed['result'], rawResult)
+    result = stringifyData(rawResult)
+    tenant.resultCache.put(SQL, binds, [t.name for t in parsed['result'].tables], result)
+    return result
+  (result, shared) = tenant.executionFlights.do((local,) + ResultCache.key(SQL, binds), run)
+  return result
+
+# SELECT of the tenant's snapshot (if local) or database.
+def selectFor(tenant, local):
+  return tenant.snapshot.SELECT if local else tenant.database.SELECT
+
+# The main rout of the server (/asq), translates the passed query and returns the result from DB.
 class Asq(object):
   def on_post(self, req, resp):
     requestData = req.media
-    query = requestData['query']
+    # The entry of the slow requests log.
+    entry = { 'query': requestData['query'], 'stages': {}, 'status': 'error' }
+    start = time.perf_counter()
+    try:
+      with memoryProfiler.request(requestData['query']):
+        self.respond(req, resp, requestData['query'], entry)
+    finally:
+      entry['duration'] = time.perf_counter() - start
+      slowLog.record(entry)
 
-    parsed = parse(requestData['query'])
+  def respond(self, req, resp, query, entry):
+    tenant = tenantFor(req)
+    entry['tenant'] = tenant.name
+    clientLimiter.take(clientID(req))
+    with lanes['analysis'].admit():
+      (parsed, translated, local, stages) = analyze(query, tenant)
+    entry['stages'].update(stages)
+    if ('matcher' in parsed): entry['matcher'] = parsed['matcher']
     if (parsed['status'] == 'error'):
+      entry['message'] = parsed['message']
       resp.body = json.dumps(parsed)
       return
+    entry['parsed'] = parsed['result'].toDict()
+    entry['engine'] = 'sqlite' if local else 'oracle'
+    resp.set_header('X-Asq-Engine', entry['engine'])
+    if (translated['status'] == 'error'):
+      entry['message'] = translated['message']
+      resp.body = json.dumps(translated)
+      return
+    entry['sql'] = translated['result']
+    entry['binds'] = translated['binds']
+    entry['rewrites'] = translated['rewrites']
+    if (req.media.get('pageSize') != None):
+      self.respondPage(req, resp, tenant, parsed, translated, local, entry)
+      return
+
+    start = time.perf_counter()
+    result = tenant.resultCache.get(translated['result'], translated['binds'])
+    if (result != None):
+      entry['cache'] = 'HIT'
+    else:
+      # Narrower queries are answered from the cached results of the wider ones.
+      result = tenant.subsumptionCache.answer(parsed['result'])
+      if (result != None):
+        entry['cache'] = 'SUBSUMED'
+      else:
+        entry['cache'] = 'MISS'
+        with lanes['execution'].admit():
+          start = time.perf_counter()
+          try:
+            result = execute(parsed, translated, local, tenant)
+          except Exception:
+            entry['message'] = 'Database error!'
+            resp.body = json.dumps({
+              'status': 'error',
+              'message': 'Database error!'
+            })
+            return
+          finally:
+            entry['stages']['execute'] = time.perf_counter() - start
+    if (entry['cache'] != 'MISS'):
+      entry['stages']['cache'] = time.perf_counter() - start
+    resp.set_header('X-Asq-Cache', entry['cache'])
+    entry['status'] = 'success'
+    entry['rows'] = len(result[1])
+    resp.body = json.dumps({
+      'status': 'success',
+      'result': result
+    })
+
+  # Responds with the first page of the result and the token of the result set for the next pages.
+  def respondPage(self, req, resp, tenant, parsed, translated, local, entry):
+    pageSize = req.media['pageSize']
+    if (not isinstance(pageSize, int) or pageSize < 1 or pageSize > MAX_PAGE_SIZE):
+      entry['message'] = f'Размер страницы должен быть от 1 до {MAX_PAGE_SIZE}!'
+      resp.body = json.dumps({
+        'status': 'error',
+        'message': entry['message']
+      })
+      return
+    (SQL, binds) = (translated['result'], translated['binds'])
+    start = time.perf_counter()
+    cached = tenant.resultCache.get(SQL, binds)
+    try:
+      if (cached != None):
+        entry['cache'] = 'HIT'
+        resultSet = tenant.resultSets.fromRows(cached[0], cached[1], pageSize)
+        page = resultSet.page(0)
+        entry['stages']['cache'] = time.perf_counter() - start
+      elif (local):
+        # The snapshot's tables are small, their rows are read at once (not holding the snapshot while spilling).
+        entry['cache'] = 'MISS'
+        with lanes['execution'].admit():
+          start = time.perf_counter()
+          (header, rows) = tenant.snapshot.SELECT(SQL, SELECT2RawData, binds)
+          resultSet = tenant.resultSets.fromRows(header, rows, pageSize)
+          page = resultSet.page(0)
+          entry['stages']['execute'] = time.perf_counter() - start
+      else:
+        # Large results are not cached, the rows are written into the result set's file,
+        # the spill's slot is released when all of them are written.
+        entry['cache'] = 'MISS'
+        admission = ExitStack()
+        admission.enter_context(lanes['spill'].admit())
+        start = time.perf_counter()
+        try:
+          resultSet = tenant.resultSets.execute(tenant.database.SELECT, SQL, binds, pageSize, admission.close)
+        except Exception:
+          admission.close()
+          raise
+        page = resultSet.page(0)
+        entry['stages']['execute'] = time.perf_counter() - start
+    except Rejected:
+      raise
+    except Exception:
+      entry['message'] = 'Database error!'
+      resp.body = json.dumps({
+        'status': 'error',
+        'message': 'Database error!'
+      })
+      return
+    resp.set_header('X-Asq-Cache', entry['cache'])
+    entry['status'] = 'success'
+    entry['rows'] = len(page)
+    resp.body = json.dumps(dict(resultSet.describe(), status='success', result=(resultSet.header, page)))
+
+# The export route (/asq/export), streams the whole result of the query as a file:
+# POST { "query": ..., "format": "csv" | "tsv" | "html" } or GET ?query=...&format=...
+class AsqExport(object):
+  def on_post(self, req, resp):
+    requestData = req.media
+    self.respond(req, resp, requestData['query'], requestData.get('format') or 'csv')
 
-    translated = translate(parsed)
+  def on_get(self, req, resp):
+    self.respond(req, resp, req.get_param('query', required=True), req.get_param('format') or 'csv')
+
+  def respond(self, req, resp, query, format):
+    if (format not in FORMATS):
+      resp.body = json.dumps({
+        'status': 'error',
+        'message': f'Неизвестный формат «{format}», доступны: {", ".join(FORMATS)}!'
+      })
+      return
+    tenant = tenantFor(req)
+    clientLimiter.take(clientID(req))
+    with lanes['analysis'].admit():
+      (parsed, translated, local, stages) = analyze(query, tenant)
+    if (parsed['status'] == 'error'):
+      resp.body = json.dumps(parsed)
+      return
     if (translated['status'] == 'error'):
       resp.body = json.dumps(translated)
       return
+    (SQL, binds) = (translated['result'], translated['binds'])
+    # The export's slot is released when the file is sent (or the client has gone).
+    admission = ExitStack()
+    admission.enter_context(lanes['export'].admit())
+    try:
+      if (local):
+        (header, rows) = tenant.snapshot.SELECT(SQL, SELECT2RawData, binds) # the snapshot's tables are small
+        batches = iter([rows])
+      else:
+        (header, batches) = tenant.database.stream(SQL, binds, EXPORT_BATCH_SIZE)
+    except Exception:
+      admission.close()
+      resp.body = json.dumps({
+        'status': 'error',
+        'message': 'Database error!'
+      })
+      return
+    resp.content_type = FORMATS[format]
+    resp.set_header('X-Asq-Engine', 'sqlite' if local else 'oracle')
+    resp.set_header('Content-Disposition', f'attachment; filename="asq.{format}"')
+    resp.stream = ExportStream(format, header, batches, admission.close)
 
+# The page route (/asq/page?token=T&page=N), returns the page (numbered from 0) of a paged result.
+class AsqPage(object):
+  def on_get(self, req, resp):
+    tenant = tenantFor(req)
+    clientLimiter.take(clientID(req))
+    number = req.get_param_as_int('page', min_value=0) or 0
     try:
-      result = SELECT(translated['result'], SELECT2Data)
+      resultSet = tenant.resultSets.get(req.get_param('token', required=True))
+      page = resultSet.page(number)
+    except ResultSetNotFound:
+      resp.status = falcon.HTTP_404
+      resp.body = json.dumps({
+        'status': 'error',
+        'message': 'Результат запроса не найден или устарел!'
+      })
+      return
+    except TimeoutError:
+      resp.status = falcon.HTTP_503
+      resp.set_header('Retry-After', '1')
       resp.body = json.dumps({
-        'status': 'success',
-        'result': result
+        'status': 'error',
+        'message': 'Страница ещё не готова!'
       })
+      return
     except Exception:
+      # The query has failed while it's rows were written.
       resp.body = json.dumps({
         'status': 'error',
         'message': 'Database error!'
       })
       return
+    resp.body = json.dumps(dict(resultSet.describe(), status='success', page=number, result=(resultSet.header, page)))
+
+# The translation route (/asq/translate), only translates the passed query to SQL-code.
+class AsqTranslate(object):
+  def on_post(self, req, resp):
+    requestData = req.media
+    tenant = tenantFor(req)
+    clientLimiter.take(clientID(req))
+    with lanes['analysis'].admit():
+      (parsed, translated, local, stages) = analyze(requestData['query'], tenant)
+    response = parsed if parsed['status'] == 'error' else translated
+    if ('matcher' in parsed): response = dict(response, matcher=parsed['matcher'])
+    resp.body = json.dumps(response)
+
+# The results cache route (/asq/cache), shows the cache statistics and invalidates cached results.
+class AsqCache(object):
+  def on_get(self, req, resp):
+    resp.body = json.dumps(tenantFor(req).resultCache.stats())
+
+  # Invalidates the results of the passed tables ({ "tables": [...] }) or the whole cache.
+  def on_delete(self, req, resp):
+    tenant = tenantFor(req)
+    requestData = req.media if req.content_length else {}
+    tables = requestData.get('tables')
+    if (tables == None):
+      tenant.resultCache.clear()
+      tenant.subsumptionCache.clear()
+      resp.body = json.dumps({ 'status': 'success' })
+    else:
+      for table in tables: tenant.subsumptionCache.invalidate(table)
+      removed = sum([tenant.resultCache.invalidate(table) for table in tables])
+      resp.body = json.dumps({ 'status': 'success', 'removed': removed })
+
+# The suggestions route (/asq/suggest), called as the user types the query.
+# The returned session should be passed with the next call, so only the new tokens are analyzed.
+class AsqSuggest(object):
+  def on_post(self, req, resp):
+    requestData = req.media
+    suggestSessions = tenantFor(req).suggestSessions
+    with lanes['analysis'].admit():
+      (session, prefix, expected) = suggestSessions.suggest(requestData['query'], requestData.get('session'))
+    resp.body = json.dumps({
+      'status': 'success',
+      'session': session,
+      'prefix': prefix,
+      'expected': expected
+    })
+
+# The admission control route (/debug/admission), shows the queues' depth and wait times.
+class DebugAdmission(object):
+  def on_get(self, req, resp):
+    resp.body = json.dumps(admissionStats())
+
+# The tokenizer route (/debug/tokenizer), shows the share of the queries analyzed without Mystem.
+class DebugTokenizer(object):
+  def on_get(self, req, resp):
+    resp.body = json.dumps(fastTokenizer.stats())
+
+# The shared cache route (/debug/sharedcache), shows the hits of this worker in the cache shared by the workers.
+class DebugSharedCache(object):
+  def on_get(self, req, resp):
+    resp.body = json.dumps(sharedCache.stats())
+
+# The matcher route (/debug/matcher), shows the work of the automatas (with ASQ_MATCHER_STATS set):
+# the primitives tested the most (?limit=N), the states of the automatas, the epsilon-transitions of the patterns
+# and the final states passed to the overlap resolution, DELETE resets the counts.
+class DebugMatcher(object):
+  def on_get(self, req, resp):
+    limit = req.get_param_as_int('limit') or 20
+    resp.body = json.dumps(dict(matcherStats.stats(limit), enabled=COUNT_MATCHING), ensure_ascii=False)
+
+  def on_delete(self, req, resp):
+    matcherStats.reset()
+    resp.body = json.dumps({ 'status': 'success' })
+
+# The slow requests route (/debug/slow), shows the slowest requests (?limit=N).
+class DebugSlow(object):
+  def on_get(self, req, resp):
+    limit = req.get_param_as_int('limit') or 20
+    resp.body = json.dumps({
+      'stats': slowLog.stats(),
+      'slowest': slowLog.top(limit)
+    }, ensure_ascii=False, default=str)
+
+# The memory route (/debug/memory), shows the memory deltas of the stages and requests
+# and the allocation sites which grew the most (?limit=N), DELETE makes the current allocations the baseline.
+class DebugMemory(object):
+  def on_get(self, req, resp):
+    limit = req.get_param_as_int('limit') or 20
+    resp.body = json.dumps({
+      'stats': memoryProfiler.stats(),
+      'top': memoryProfiler.topSites(limit)
+    }, ensure_ascii=False)
+
+  def on_delete(self, req, resp):
+    memoryProfiler.reset()
+    resp.body = json.dumps({ 'status': 'success' })
+
+# The catalog route (/admin/catalog), shows the current version of the tenant's DB objects,
+# POST rebuilds it (after changing the keys or the lexicon).
+class AdminCatalog(object):
+  def on_get(self, req, resp):
+    resp.body = json.dumps(tenantFor(req).catalogs.stats())
+
+  def on_post(self, req, resp):
+    catalogs = tenantFor(req).catalogs
+    catalogs.reload(force=True)
+    resp.body = json.dumps(catalogs.stats())
+
+# The tenants route (/admin/tenants), shows the tenants with their catalogs and caches.
+class AdminTenants(object):
+  def on_get(self, req, resp):
+    resp.body = json.dumps({ name: tenant.stats() for (name, tenant) in tenants.items() })
+
+# The readiness route (/health/ready), 503 until the warm-up is over.
+class HealthReady(object):
+  def on_get(self, req, resp):
+    if (not warmup.ready.is_set()): resp.status = falcon.HTTP_503
+    resp.body = json.dumps(warmup.stats())
+
+# Identifier of the client for the rate limits: it's address,
+# or the X-Client-Id header set by a trusted proxy.
+def clientID(req):
+  if (req.remote_addr in TRUSTED_PROXIES): return req.get_header('X-Client-Id') or req.remote_addr
+  return req.remote_addr
+
+# Responds to the requests which were not admitted.
+def handleRejected(req, resp, error, params):
+  resp.status = falcon.HTTP_429 if error.status == 429 else falcon.HTTP_503
+  resp.set_header('Retry-After', str(error.retryAfter))
+  resp.body = json.dumps({
+    'status': 'error',
+    'message': str(error)
+  })
+
+# Responds to the requests of unknown tenants.
+def handleUnknownTenant(req, resp, error, params):
+  resp.status = falcon.HTTP_404
+  resp.body = json.dumps({
+    'status': 'error',
+    'message': f'Неизвестная схема «{error}»!'
+  })
 
 app = falcon.API()
+app.add_error_handler(Rejected, handleRejected)
+app.add_error_handler(UnknownTenant, handleUnknownTenant)
 
 app.add_route('/asq', Asq())
+app.add_route('/asq/translate', AsqTranslate())
+app.add_route('/asq/cache', AsqCache())
+app.add_route('/asq/page', AsqPage())
+app.add_route('/asq/export', AsqExport())
+app.add_route('/asq/suggest', AsqSuggest())
+app.add_route('/debug/admission', DebugAdmission())
+app.add_route('/debug/tokenizer', DebugTokenizer())
+app.add_route('/debug/sharedcache', DebugSharedCache())
+app.add_route('/debug/matcher', DebugMatcher())
+app.add_route('/debug/slow', DebugSlow())
+app.add_route('/debug/memory', DebugMemory())
+app.add_route('/admin/catalog', AdminCatalog())
+app.add_route('/admin/tenants', AdminTenants())
+app.add_route('/health/ready', HealthReady())
@@ -0,0 +1,204 @@
+"""
+  sharedcache.py
+
+  Cache shared by the worker processes of a host (turned on by the ASQ_SHARED_CACHE environment variable,
+  the path of the cache file, preferably in /dev/shm): Mystem's analyses of the texts and the parsed
+  and translated queries (see asq.parse and asq.translate), so a query analyzed by one worker is a hit for the others.
+  The file is a fixed-size hash table of slots (open addressing with a few probes, the oldest entry is replaced),
+  every slot is a header (sequence number, hash of the key, length, CRC-32 and time of the value) and a pickled value.
+  Reads take no locks: the sequence number is odd while the slot is written (seqlock), so a reader copies the slot
+  and checks that the number hasn't changed, and the checksum is verified too (a torn read is a miss).
+  Writers lock the slot's bytes of the file (fcntl.lockf), so it works only on UNIX.
+  Every key is hashed together with the digest of the parser's and translator's sources,
+  and the keys of the parsed and translated queries contain the digest of the catalog (see catalog.py),
+  so the entries of an older catalog or code are never found and are replaced as the slots are reused.
+  Only the classes of QueryIR are unpickled (the file is created readable only by it's owner).
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+import QueryIR
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# Path of the file (the cache is off without it) and the size of the table.
+PATH = os.environ.get('ASQ_SHARED_CACHE', '') if os.environ.get('ASQ_SHARED_CACHE', '') != '0' else ''
+SLOTS = int(os.environ.get('ASQ_SHARED_CACHE_SLOTS', 16384))
+SLOT_SIZE = int(os.environ.get('ASQ_SHARED_CACHE_SLOT_SIZE', 2048))
+# Number of the slots where a key may be stored.
+PROBES = 4
+# Modules whose changes change the cached values (the parsed queries depend on the lemmas of the DB objects
+# made by dbObjects.py, and catalog.py computes the catalog's digest in the keys).
+SOURCES = [
+  'AbstractRegularExpressions.py', 'patterns.py', 'tokenizer.py', 'StructureParser.py', 'QueryIR.py',
+  'OracleTranslator.py', 'SQLiteTranslator.py', 'optimizer.py', 'fuzzy.py', 'dbObjects.py', 'catalog.py', 'asq.py'
+]
+MODULES_PATH = os.path.dirname(os.path.abspath(__file__))
+
+MAGIC = b'ASQSHC01'
+fileHeader = struct.Struct('<8sII')
+HEADER_SIZE = 64
+# Sequence number, hash of the key, length, checksum and time of the value.
+slotHeader = struct.Struct('<Q16sIII')
+sequence = struct.Struct('<Q')
+
+# Digest of the sources of the modules.
+def codeDigest(sources=SOURCES):
+  digest = hashlib.blake2b(digest_size=16)
+  for name in sources:
+    with open(os.path.join(MODULES_PATH, name), 'rb') as file:
+      digest.update(file.read())
+  return digest.digest()
+
+# Unpickler of the cached values: only the builtin values and the nodes of QueryIR.
+class ValueUnpickler(pickle.Unpickler):
+  def find_class(self, module, name):
+    if (module == 'QueryIR' and isinstance(getattr(QueryIR, name, None), type)
+        and issubclass(getattr(QueryIR, name), QueryIR.Node)):
+      return getattr(QueryIR, name)
+    raise pickle.UnpicklingError(f'{module}.{name} is not allowed')
+
+# The hash table in the file (see the module's description), without a path every key is a miss.
+class SharedCache:
+  def __init__(self, path=PATH, slots=SLOTS, slotSize=SLOT_SIZE):
+    self.path = path
+    self.slots = slots
+    self.slotSize = slotSize
+    self.map = None
+    self.fd = None
+    self.lock = threading.Lock()
+    self.hits = Counter()
+    self.misses = Counter()
+    self.writes = Counter()
+    self.tooLarge = 0
+    self.replaced = 0
+    self.errors = 0
+    self.lastError = None
+    if (not path): return
+    try:
+      if (fcntl == None): raise OSError('fcntl is not available')
+      if (slotSize <= slotHeader.size): raise ValueError(f'Слот размером {slotSize} меньше заголовка!')
+      self.codeDigest = codeDigest()
+      self.open()
+    except (OSError, ValueError) as error:
+      self.map = None
+      self.lastError = str(error)
+
+  # Maps the file, making it if it's new (the file of another layout is not changed, the cache is off then).
+  def open(self):
+    size = HEADER_SIZE + self.slots*self.slotSize
+    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX)
+      try:
+        if (os.fstat(fd).st_size == 0):
+          os.ftruncate(fd, size)
+          os.pwrite(fd, fileHeader.pack(MAGIC, self.slots, self.slotSize), 0)
+        header = fileHeader.unpack(os.pread(fd, fileHeader.size, 0))
+        if (header != (MAGIC, self.slots, self.slotSize) or os.fstat(fd).st_size < size):
+          raise ValueError(f'Файл «{self.path}» имеет другой формат или размер!')
+      finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+      self.map = mmap.mmap(fd, size)
+      self.fd = fd
+    except Exception:
+      os.close(fd)
+      raise
+
+  # Whether the cache is on.
+  @property
+  def enabled(self):
+    return self.map != None
+
+  # Hash of the key (a tuple of the kind of the value and the values it depends on).
+  def hashKey(self, key):
+    return hashlib.blake2b(self.codeDigest + repr(key).encode('utf-8'), digest_size=16).digest()
+
+  # Slots where the key may be stored.
+  def probes(self, keyHash):
+    first = int.from_bytes(keyHash[:8], 'little') % self.slots
+    return [(first + i) % self.slots for i in range(PROBES)]
+
+  # Returns the cached value or None (when there is no value for the key).
+  def get(self, key):
+    if (self.map == None): return None
+    keyHash = self.hashKey(key)
+    for index in self.probes(keyHash):
+      offset = HEADER_SIZE + index*self.slotSize
+      slot = self.map[offset:offset + self.slotSize]
+      (seq, slotHash, length, checksum, stamp) = slotHeader.unpack_from(slot)
+      if (seq == 0): break # the slot was never written, so are the next probes
+      if (slotHash != keyHash): continue
+      if (seq & 1 or sequence.unpack_from(self.map, offset)[0] != seq): break # being written
+      payload = slot[slotHeader.size:slotHeader.size + length]
+      if (length > self.slotSize - slotHeader.size or zlib.crc32(payload) != checksum): break
+      try:
+        value = ValueUnpickler(io.BytesIO(payload)).load()
+      except Exception as error:
+        self.errors += 1
+        self.lastError = str(error)
+        break
+      self.hits[key[0]] += 1
+      return value
+    self.misses[key[0]] += 1
+    return None
+
+  # Caches the value (the values larger than a slot are not cached).
+  def put(self, key, value):
+    if (self.map == None): return
+    payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    if (len(payload) > self.slotSize - slotHeader.size):
+      self.tooLarge += 1
+      return
+    keyHash = self.hashKey(key)
+    with self.lock:
+      # The slot of the key, an empty one or the oldest one.
+      candidates = []
+      for index in self.probes(keyHash):
+        offset = HEADER_SIZE + index*self.slotSize
+        (seq, slotHash, length, checksum, stamp) = slotHeader.unpack_from(self.map, offset)
+        if (slotHash == keyHash or seq == 0):
+          candidates = [(0, offset, False)]
+          break
+        candidates.append((stamp, offset, True))
+      (stamp, offset, replacing) = min(candidates)
+      fcntl.lockf(self.fd, fcntl.LOCK_EX, self.slotSize, offset)
+      try:
+        seq = sequence.unpack_from(self.map, offset)[0]
+        seq = seq if seq & 1 else seq + 1 # odd while written (it stays odd if a writer has died)
+        sequence.pack_into(self.map, offset, seq)
+        self.map[offset + slotHeader.size:offset + slotHeader.size + len(payload)] = payload
+        slotHeader.pack_into(
+          self.map, offset, seq, keyHash, len(payload), zlib.crc32(payload), int(time.time()) & 0xFFFFFFFF
+        )
+        sequence.pack_into(self.map, offset, seq + 1)
+      finally:
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, self.slotSize, offset)
+    self.writes[key[0]] += 1
+    if (replacing): self.replaced += 1
+
+  # Statistics of this process (hits, misses and writes by the kind of the values).
+  def stats(self):
+    return {
+      'enabled': self.enabled,
+      'path': self.path,
+      'slots': self.slots,
+      'slotSize': self.slotSize,
+      'hits': dict(self.hits),
+      'misses': dict(self.misses),
+      'writes': dict(self.writes),
+      'tooLarge': self.tooLarge,
+      'replaced': self.replaced,
+      'errors': self.errors,
+      'lastError': self.lastError
+    }
@@ -0,0 +1,76 @@
+"""
+  singleflight.py
+
+  Coalescing of identical concurrent calls.
+  The first caller with a key executes the function, the callers coming while it runs
+  wait for it and share it's result (or exception) instead of executing the function again.
+"""
+
+import asyncio
+import threading
+
+# A call in progress.
+class Flight:
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+# Coalescing for threads (synchronous handlers).
+class SingleFlight:
+  def __init__(self):
+    self.flights = {}
+    self.lock = threading.Lock()
+    self.coalesced = 0
+
+  # Calls fn() once for all the concurrent callers with the same key, returns (result, shared).
+  def do(self, key, fn):
+    with self.lock:
+      flight = self.flights.get(key)
+      leader = flight == None
+      if (leader):
+        flight = self.flights[key] = Flight()
+      else:
+        self.coalesced += 1
+    if (not leader):
+      flight.done.wait()
+      if (flight.error != None): raise flight.error
+      return (flight.result, True)
+    try:
+      flight.result = fn()
+      return (flight.result, False)
+    except BaseException as error:
+      flight.error = error
+      raise
+    finally:
+      with self.lock:
+        del self.flights[key]
+      flight.done.set()
+
+# Coalescing for coroutines (an asyncio event loop).
+class AsyncSingleFlight:
+  def __init__(self):
+    self.flights = {}
+    self.coalesced = 0
+
+  # Awaits fn() once for all the concurrent callers with the same key, returns (result, shared).
+  async def do(self, key, fn):
+    future = self.flights.get(key)
+    if (future != None):
+      self.coalesced += 1
+      return (await asyncio.shield(future), True)
+    future = asyncio.get_running_loop().create_future()
+    self.flights[key] = future
+    try:
+      result = await fn()
+      future.set_result(result)
+      return (result, False)
+    except asyncio.CancelledError:
+      future.cancel()
+      raise
+    except BaseException as error:
+      future.set_exception(error)
+      future.exception() # The error is re-raised to the waiters, mark it as retrieved.
+      raise
+    finally:
+      del self.flights[key]
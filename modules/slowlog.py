@@ -0,0 +1,123 @@
+"""
+  slowlog.py
+
+  Log of slow requests.
+  Requests slower than the threshold (and a sampled share of the others) are put into an in-memory
+  ring buffer, a background thread writes them into rotating JSONL files,
+  so the requests themselves never wait for the disk.
+  The failed writes are logged (by the asq logger, the asq.slowlog one writes only the entries)
+  and counted with the lost entries in the stats (see /debug/slow).
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Requests taking longer (in seconds) are logged.
+SLOW_THRESHOLD = 1.0
+# Share of the other requests which are logged.
+SAMPLE_RATE = 0.01
+# Maximum number of the entries waiting to be written (the oldest ones are dropped).
+BUFFER_SIZE = 10000
+# Seconds between writes.
+FLUSH_INTERVAL = 5
+# The log files.
+LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'slow.jsonl')
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+# Number of the slowest requests kept for /debug/slow.
+TOP_SIZE = 100
+
+# Buffered log of the slow requests.
+class SlowLog:
+  def __init__(self, path=LOG_PATH, threshold=SLOW_THRESHOLD, sampleRate=SAMPLE_RATE, bufferSize=BUFFER_SIZE):
+    self.path = path
+    self.threshold = threshold
+    self.sampleRate = sampleRate
+    self.buffer = deque(maxlen=bufferSize)
+    self.slowest = [] # heap of (duration, number, entry).
+    self.counter = itertools.count()
+    self.dropped = 0
+    self.failures = 0
+    self.lost = 0
+    self.lastError = None
+    self.lock = threading.Lock()
+    self.logger = None
+    self.errorLogger = logging.getLogger('asq')
+
+  # Records the request's entry (a dict with the duration in seconds) if it's slow or sampled.
+  def record(self, entry):
+    slow = entry['duration'] >= self.threshold
+    if (not slow and random.random() >= self.sampleRate): return
+    entry['slow'] = slow
+    entry['time'] = time.time()
+    with self.lock:
+      if (len(self.buffer) == self.buffer.maxlen): self.dropped += 1
+      self.buffer.append(entry)
+      if (slow):
+        item = (entry['duration'], next(self.counter), entry)
+        if (len(self.slowest) < TOP_SIZE): heapq.heappush(self.slowest, item)
+        else: heapq.heappushpop(self.slowest, item)
+
+  # The slowest requests (the slowest first).
+  def top(self, limit=TOP_SIZE):
+    with self.lock:
+      return [entry for (duration, number, entry) in heapq.nlargest(limit, self.slowest)]
+
+  # Writes the buffered entries into the log (the entries not written when it fails are counted as lost).
+  def flush(self):
+    with self.lock:
+      entries = list(self.buffer)
+      self.buffer.clear()
+    if (len(entries) == 0): return
+    written = 0
+    try:
+      if (self.logger == None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+          self.path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger = logging.getLogger('asq.slowlog')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(handler)
+      for entry in entries:
+        self.logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+        written += 1
+    except Exception:
+      self.lost += len(entries) - written
+      raise
+
+  # Writes the entries in a background thread.
+  def start(self, interval=FLUSH_INTERVAL):
+    def flushLoop():
+      while True:
+        time.sleep(interval)
+        try:
+          self.flush()
+        except Exception as error:
+          # The entries are lost, but the requests are not affected.
+          self.failures += 1
+          self.lastError = str(error)
+          self.errorLogger.exception('Slow log flush failed')
+    threading.Thread(target=flushLoop, name='slowlog', daemon=True).start()
+
+  # Number of the buffered, dropped and kept slowest entries and the failed writes with the entries they lost.
+  def stats(self):
+    with self.lock:
+      return {
+        'buffered': len(self.buffer),
+        'dropped': self.dropped,
+        'slow': len(self.slowest),
+        'failures': self.failures,
+        'lost': self.lost,
+        'lastError': self.lastError
+      }
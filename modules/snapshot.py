@@ -0,0 +1,117 @@
+"""
+  snapshot.py
+
+  Local replica of small, rarely changing tables.
+  The tables are periodically copied from Oracle into an in-memory SQLite database,
+  queries using only these tables are executed locally (see SQLiteTranslator.py).
+  When the refreshes fail for longer than MAX_AGE refresh intervals, the snapshot is too old to be used
+  and the queries go to Oracle until a refresh succeeds.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from db import SELECT
+
+# Tables copied into the snapshot (an empty list disables the snapshot).
+SNAPSHOT_TABLES = ['regions', 'countries', 'locations', 'departments']
+# Seconds between refreshes of the snapshot.
+REFRESH_INTERVAL = 300
+# The snapshot isn't used when it's older than this number of refresh intervals.
+MAX_AGE = 3
+# Number of rows fetched from Oracle at once.
+BATCH_SIZE = 1000
+
+# SQLite cursor which names the columns in upper case, as Oracle does.
+class SnapshotCursor:
+  def __init__(self, cursor):
+    self.cursor = cursor
+    self.description = [(col[0].upper(),) + tuple(col[1:]) for col in cursor.description]
+  def __iter__(self):
+    return iter(self.cursor)
+  def fetchmany(self, size=BATCH_SIZE):
+    return self.cursor.fetchmany(size)
+
+# In-memory SQLite copy of the tables, select is db.SELECT of the copied database.
+class SQLiteSnapshot:
+  def __init__(self, tables=SNAPSHOT_TABLES, refreshInterval=REFRESH_INTERVAL, select=SELECT):
+    self.tables = set(tables)
+    self.select = select
+    self.refreshInterval = refreshInterval
+    self.connection = None
+    self.refreshed = None
+    self.refreshes = 0
+    self.failures = 0
+    self.lastError = None
+    self.lock = threading.Lock()
+    self.logger = logging.getLogger('asq.snapshot')
+
+  # Whether all the tables are in the (already loaded and not too old) snapshot.
+  def covers(self, tables):
+    return (
+      self.refreshed != None and len(tables) > 0 and set(tables) <= self.tables
+      and time.time() - self.refreshed <= MAX_AGE*self.refreshInterval
+    )
+
+  # Seconds since the last successful refresh (None before the first one).
+  def age(self):
+    return time.time() - self.refreshed if self.refreshed != None else None
+
+  # Copies the tables from Oracle into a new SQLite database and replaces the old one with it.
+  def refresh(self):
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    for table in sorted(self.tables):
+      self.select(f'SELECT * FROM {table}', lambda cursor: copyTable(connection, table, cursor))
+    connection.commit()
+    with self.lock:
+      (oldConnection, self.connection) = (self.connection, connection)
+      self.refreshed = time.time()
+    if (oldConnection != None): oldConnection.close()
+
+  # Refreshes the snapshot in a background thread.
+  def start(self):
+    if (len(self.tables) == 0): return
+    def refreshLoop():
+      while True:
+        try:
+          self.refresh()
+          self.refreshes += 1
+          self.lastError = None
+        except Exception as error:
+          # The old snapshot (if any) is used until the next successful refresh or until it's too old.
+          self.failures += 1
+          self.lastError = str(error)
+          self.logger.exception('Snapshot refresh failed')
+        time.sleep(self.refreshInterval)
+    threading.Thread(target=refreshLoop, name='snapshot', daemon=True).start()
+
+  # The tables, the age of the snapshot and the results of the refreshes.
+  def stats(self):
+    age = self.age()
+    return {
+      'tables': sorted(self.tables),
+      'age': age,
+      'stale': age != None and age > MAX_AGE*self.refreshInterval,
+      'refreshInterval': self.refreshInterval,
+      'refreshes': self.refreshes,
+      'failures': self.failures,
+      'lastError': self.lastError
+    }
+
+  # Selects data from the snapshot (the same way as db.SELECT).
+  def SELECT(self, query, cb, binds=None):
+    with self.lock:
+      cursor = self.connection.cursor()
+      cursor.execute(query, binds or {})
+      return cb(SnapshotCursor(cursor))
+
+# Creates the table in SQLite and fills it with the rows from the Oracle cursor.
+def copyTable(connection, table, cursor):
+  columns = [col[0].lower() for col in cursor.description]
+  connection.execute(f'CREATE TABLE {table} ({", ".join(columns)})')
+  insert = f'INSERT INTO {table} VALUES ({", ".join(["?"]*len(columns))})'
+  while True:
+    rows = cursor.fetchmany(BATCH_SIZE)
+    if (len(rows) == 0): break
+    connection.executemany(insert, rows)
@@ -0,0 +1,208 @@
+"""
+  subsumption.py
+
+  Cache answering narrower queries from the results of wider ones.
+  When a user drills down («сотрудники» -> «сотрудники с зарплатой больше 5000» -> ... sorted by last name),
+  the new query differs only in the conditions and sorting, so it's answered by filtering, sorting
+  and projecting the cached rows of the wider query in memory instead of going to the DB.
+
+  Only single-table queries with plain columns are handled: the cached query must have no conditions,
+  grouping or aggregates, the new query must have no grouping or aggregates
+  and all of it's columns must be present in the cached result.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from QueryIR import TableRef, ColumnRef, Literal
+from cache import TABLES_TTL, DEFAULT_TTL
+
+# Maximum number of the cached results.
+MAX_ENTRIES = 32
+# Results with more rows are not cached.
+MAX_ROWS = 100000
+
+# Raised when the query can't be evaluated in memory (e.g. it compares values of different types).
+class NotSubsumed(Exception):
+  pass
+
+# One cached result with the query it came from.
+class SubsumptionEntry:
+  def __init__(self, query, header, rows, expires):
+    self.query = query
+    self.header = header
+    self.columns = { name: index for (index, name) in enumerate(header) }
+    self.rows = rows
+    self.expires = expires
+
+# Cache of the results of wide queries.
+class SubsumptionCache:
+  def __init__(self, maxEntries=MAX_ENTRIES, maxRows=MAX_ROWS, tablesTTL=TABLES_TTL, defaultTTL=DEFAULT_TTL):
+    self.maxEntries = maxEntries
+    self.maxRows = maxRows
+    self.tablesTTL = tablesTTL
+    self.defaultTTL = defaultTTL
+    self.entries = OrderedDict() # query -> SubsumptionEntry, from the least to the most recently used.
+    self.lock = threading.Lock()
+
+  # Caches the raw result (header and rows with the original values) of the query if it can be reused.
+  def put(self, query, result):
+    (header, rows) = result
+    if (not isWide(query) or len(rows) > self.maxRows): return
+    expires = time.monotonic() + self.tablesTTL.get(query.tables[0].name, self.defaultTTL)
+    with self.lock:
+      self.entries[query] = SubsumptionEntry(query, header, rows, expires)
+      self.entries.move_to_end(query)
+      while (len(self.entries) > self.maxEntries):
+        self.entries.popitem(last=False)
+
+  # Answers the query from a cached result, returns the header and rows (as strings) or None.
+  def answer(self, query):
+    if (not isNarrowable(query)): return None
+    now = time.monotonic()
+    with self.lock:
+      for (cachedQuery, entry) in reversed(list(self.entries.items())):
+        if (entry.expires <= now):
+          del self.entries[cachedQuery]
+        elif (subsumes(entry, query)):
+          self.entries.move_to_end(cachedQuery)
+          break
+      else:
+        return None
+    try:
+      return evaluate(entry, query)
+    except NotSubsumed:
+      return None
+
+  # Removes the results of the table.
+  def invalidate(self, table):
+    with self.lock:
+      for query in [q for q in self.entries if q.tables[0].name == table]:
+        del self.entries[query]
+
+  # Removes all the results.
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+# Whether the query's result can answer narrower queries.
+def isWide(query):
+  return (
+    len(query.tables) == 1 and len(query.where) == 0 and len(query.having) == 0 and len(query.groupBy) == 0
+    and all([isinstance(obj, TableRef) or isinstance(obj, ColumnRef) for obj in query.select])
+  )
+
+# Whether the query may be answered from a wider query's result.
+def isNarrowable(query):
+  return (
+    len(query.tables) == 1 and len(query.having) == 0 and len(query.groupBy) == 0
+    and all([isinstance(obj, TableRef) or isinstance(obj, ColumnRef) for obj in query.select])
+    and all([
+      isinstance(c, str) or all([isinstance(t, ColumnRef) or isinstance(t, Literal) for t in c.targets])
+      for c in query.where
+    ])
+    and all([isinstance(key.target, ColumnRef) for key in query.orderBy])
+  )
+
+# Whether the cached result has all the rows and columns needed for the query.
+def subsumes(entry, query):
+  if (entry.query.tables != query.tables): return False
+  if (TableRef(query.tables[0].name) in entry.query.select): return True
+  if (any([isinstance(obj, TableRef) for obj in query.select])): return False
+  columns = set(query.select)
+  columns |= { t for c in query.where if not isinstance(c, str) for t in c.targets if isinstance(t, ColumnRef) }
+  columns |= { key.target for key in query.orderBy }
+  return all([column.name.upper() in entry.columns for column in columns])
+
+# Filters, sorts and projects the cached rows.
+def evaluate(entry, query):
+  rows = entry.rows
+  if (len(query.where) > 0):
+    predicate = compileWhere(entry, query.where)
+    rows = [row for row in rows if predicate(row) == True]
+  else:
+    rows = list(rows)
+  for key in reversed(query.orderBy):
+    index = entry.columns[key.target.name.upper()]
+    try:
+      # Oracle puts NULLs last in the ascending order (and first in the descending one).
+      rows.sort(key = lambda row: (row[index] is None, row[index]), reverse=key.desc)
+    except TypeError:
+      raise NotSubsumed()
+  indexes = []
+  for obj in query.select:
+    if (isinstance(obj, TableRef)): indexes += range(len(entry.header))
+    else: indexes.append(entry.columns[obj.name.upper()])
+  header = [entry.header[i] for i in indexes]
+  return (header, [[str(row[i]) for i in indexes] for row in rows])
+
+# Compiles the WHERE conditions into a function of a row returning True, False or None (unknown).
+# AND has a higher precedence than OR, as in SQL.
+def compileWhere(entry, where):
+  disjuncts = [[]]
+  for c in where:
+    if (c == 'OR'): disjuncts.append([])
+    elif (c != 'AND'): disjuncts[-1].append(compileCondition(entry, c))
+  def predicate(row):
+    result = False
+    for conjuncts in disjuncts:
+      value = True
+      for condition in conjuncts:
+        value = logicalAnd(value, condition(row))
+        if (value == False): break
+      result = logicalOr(result, value)
+      if (result == True): break
+    return result
+  return predicate
+
+# Compiles one condition into a function of a row.
+def compileCondition(entry, condition):
+  targets = [compileTarget(entry, t) for t in condition.targets]
+  if (condition.operator == 'IS NULL'):
+    check = lambda row: targets[0](row) is None
+  elif (condition.operator == 'IS NOT NULL'):
+    check = lambda row: targets[0](row) is not None
+  else:
+    compare = {
+      'gt': lambda a, b: a > b,
+      'lt': lambda a, b: a < b,
+      'eq': lambda a, b: a == b,
+      'ge': lambda a, b: a >= b,
+      'le': lambda a, b: a <= b
+    }[condition.operator]
+    (targetA, targetB) = targets
+    def check(row):
+      (a, b) = (targetA(row), targetB(row))
+      if (a is None or b is None): return None
+      if (isinstance(a, str) != isinstance(b, str)): raise NotSubsumed()
+      try:
+        return compare(a, b)
+      except TypeError:
+        raise NotSubsumed()
+  if (condition.negated):
+    return lambda row: logicalNot(check(row))
+  return check
+
+# Compiles a column or literal into a function of a row.
+def compileTarget(entry, target):
+  if (isinstance(target, ColumnRef)):
+    index = entry.columns[target.name.upper()]
+    return lambda row: row[index]
+  if (target.type == 'number'):
+    if (not target.value.isdecimal()): raise NotSubsumed()
+    value = int(target.value)
+  else:
+    value = target.value if target.value != '' else None # Oracle treats empty strings as NULLs.
+  return lambda row: value
+
+# Three-valued logic (None is unknown).
+def logicalNot(a):
+  return None if a is None else not a
+def logicalAnd(a, b):
+  if (a == False or b == False): return False
+  if (a is None or b is None): return None
+  return True
+def logicalOr(a, b):
+  if (a == True or b == True): return True
+  if (a is None or b is None): return None
+  return False
@@ -0,0 +1,117 @@
+"""
+  suggest.py
+
+  As-you-type suggestions.
+  Every session keeps the automatas and the tokens analyzed so far,
+  so each call only analyzes and matches the tokens added since the previous call.
+"""
+
+import threading
+import time
+import uuid
+from asq import makeAutomatas, tokenize, catalogs
+
+# Seconds of inactivity after which a session is dropped.
+SESSION_TTL = 60
+# Maximum number of the alive sessions.
+MAX_SESSIONS = 10000
+
+# One as-you-type session.
+class SuggestSession:
+  def __init__(self, ID, catalogs):
+    self.ID = ID
+    self.catalogs = catalogs
+    self.catalog = catalogs.current
+    self.automatas = makeAutomatas()
+    self.tokens = []
+    self.text = '' # the consumed part of the query.
+    self.expires = time.monotonic() + SESSION_TTL
+    self.lock = threading.Lock()
+
+  # Consumes the query up to it's last whitespace (the last word may be unfinished),
+  # returns the unfinished word.
+  def feed(self, query):
+    if (not query.startswith(self.text)):
+      # The user has edited the consumed part, start from scratch.
+      self.catalog = self.catalogs.current
+      self.automatas = makeAutomatas()
+      self.tokens = []
+      self.text = ''
+    boundary = max(query.rfind(' '), query.rfind('\t'), query.rfind('\n')) + 1
+    if (boundary > len(self.text)):
+      for token in tokenize(query[len(self.text):boundary], len(self.tokens), self.catalog):
+        for automata in self.automatas: automata.feedToken(token)
+        self.tokens.append(token)
+      self.text = query[:boundary]
+    self.expires = time.monotonic() + SESSION_TTL
+    return query[boundary:].strip().lower()
+
+  # Tables mentioned in the consumed part of the query.
+  def tablesUsed(self):
+    tables = set()
+    for token in self.tokens:
+      obj = self.catalog.dbObjectsLemmas.get(token.lemma)
+      if (obj == None): continue
+      if (isinstance(obj, list)):
+        if (len({o['table'] for o in obj}) == 1): tables.add(obj[0]['table'])
+      elif (obj['type'] == 'table'): tables.add(obj['name'])
+      else: tables.add(obj['table'])
+    return tables
+
+  # The primitives expected next (continuing the started patterns first) and the words for them.
+  def expected(self, prefix=''):
+    continuing = set()
+    starting = set()
+    for automata in self.automatas:
+      continuing |= automata.expectedPrimitives()
+      starting |= automata.startPrimitives()
+    tables = self.tablesUsed()
+    result = []
+    for (primitives, continues) in [(continuing, True), (starting - continuing, False)]:
+      for primitive in sorted(primitives, key = lambda p: p.name):
+        words = self.words(primitive, tables)
+        if (words != None):
+          words = [w for w in words if w.startswith(prefix)]
+          if (len(words) == 0 and prefix): continue
+        result.append({ 'category': primitive.name, 'continues': continues, 'words': words })
+    return result
+
+  # Words which are accepted by the primitive (None if the primitive doesn't have a vocabulary).
+  def words(self, primitive, tables):
+    if (primitive.name == 'table'):
+      return [l for o in self.catalog.dbObjects if o['type'] == 'table' for l in o['lemmas']]
+    if (primitive.name == 'column'):
+      columns = [o for o in self.catalog.dbObjects if o['type'] == 'column']
+      if (len(tables) > 0):
+        columns = [o for o in columns if o['table'] in tables]
+      return list(dict.fromkeys([l for o in columns for l in o['lemmas']]))
+    return primitive.vocabulary
+
+# Storage of the alive sessions, catalogs are the versions of the DB objects (see catalog.py).
+class SuggestSessions:
+  def __init__(self, catalogs=catalogs):
+    self.catalogs = catalogs
+    self.sessions = {}
+    self.lock = threading.Lock()
+
+  # Finds the session by ID or creates a new one.
+  def get(self, ID=None):
+    with self.lock:
+      now = time.monotonic()
+      session = self.sessions.get(ID)
+      if (session != None and session.expires > now):
+        return session
+      if (len(self.sessions) >= MAX_SESSIONS):
+        self.sessions = { k: s for (k, s) in self.sessions.items() if s.expires > now }
+        if (len(self.sessions) >= MAX_SESSIONS):
+          del self.sessions[min(self.sessions, key = lambda k: self.sessions[k].expires)]
+      session = SuggestSession(uuid.uuid4().hex, self.catalogs)
+      self.sessions[session.ID] = session
+      return session
+
+  # Feeds the query to the session and returns the session ID with the suggestions.
+  def suggest(self, query, ID=None):
+    session = self.get(ID)
+    with session.lock:
+      prefix = session.feed(query)
+      return (session.ID, prefix, session.expected(prefix))
@@ -0,0 +1,98 @@
+"""
+  tenants.py
+
+  Tenants — DB schemas served by one process, the tenant of a request is set by the X-Asq-Tenant header.
+  Every tenant has it's own pool of connections, catalog (DB objects, keys and join paths), caches and snapshot
+  with their own memory limits, while the patterns and the analyzer (Mystem and the fast tokenizer) are shared.
+  The default tenant uses the database from db.py and the DB objects from dbObjects.py,
+  the other tenants are described in tenants.json:
+    {
+      "sales": {
+        "dsn": "user/password@host:1521/service",
+        "lexicon": "lexicon-sales.json",
+        "poolSize": 4,
+        "cacheBytes": 16777216,
+        "subsumptionEntries": 64,
+        "subsumptionRows": 2000,
+        "resultSetBytes": 268435456,
+        "snapshotTables": []
+      }
+    }
+  Only dsn and lexicon (a JSON list of the DB objects as in dbObjects.py, relative to this directory) are required.
+"""
+
+import json
+import os
+from db import Database, defaultDatabase, POOL_SIZE
+from asq import catalogs, primitiveWords
+from catalog import CatalogManager
+from cache import ResultCache, MAX_BYTES
+from subsumption import SubsumptionCache, MAX_ENTRIES, MAX_ROWS
+from resultsets import ResultSetStore, MAX_DISK_BYTES
+from snapshot import SQLiteSnapshot, SNAPSHOT_TABLES
+from suggest import SuggestSessions
+from singleflight import SingleFlight
+
+MODULES_PATH = os.path.dirname(os.path.abspath(__file__))
+TENANTS_PATH = os.path.join(MODULES_PATH, 'tenants.json')
+TENANT_HEADER = 'X-Asq-Tenant'
+DEFAULT_TENANT = 'default'
+
+# Raised when the request's tenant is not known.
+class UnknownTenant(Exception):
+  pass
+
+# One schema with it's database, catalog and caches.
+class Tenant:
+  def __init__(self, name, database, catalogs, cacheBytes=MAX_BYTES, subsumptionEntries=MAX_ENTRIES,
+               subsumptionRows=MAX_ROWS, resultSetBytes=MAX_DISK_BYTES, snapshotTables=SNAPSHOT_TABLES):
+    self.name = name
+    self.database = database
+    self.catalogs = catalogs
+    self.resultCache = ResultCache(maxBytes=cacheBytes)
+    self.subsumptionCache = SubsumptionCache(maxEntries=subsumptionEntries, maxRows=subsumptionRows)
+    self.resultSets = ResultSetStore(maxBytes=resultSetBytes)
+    self.snapshot = SQLiteSnapshot(snapshotTables, select=database.SELECT)
+    self.suggestSessions = SuggestSessions(catalogs)
+    # Concurrent identical queries are analyzed once (keyed by the normalized query)
+    # and executed once (keyed by the SQL-code and binds).
+    self.analysisFlights = SingleFlight()
+    self.executionFlights = SingleFlight()
+
+  # Starts the background refreshes of the snapshot and the catalog.
+  def start(self):
+    self.snapshot.start()
+    self.catalogs.start()
+
+  # The tenant's catalog version and caches.
+  def stats(self):
+    return {
+      'catalog': self.catalogs.current.describe(),
+      'cache': self.resultCache.stats(),
+      'snapshot': self.snapshot.stats(),
+      'resultSets': self.resultSets.stats()
+    }
+
+# Makes a tenant from it's settings (see the description of tenants.json).
+def makeTenant(name, settings):
+  database = Database(settings['dsn'], settings.get('poolSize', POOL_SIZE))
+  lexiconPath = os.path.join(MODULES_PATH, settings['lexicon'])
+  if (not os.path.exists(lexiconPath)):
+    raise ValueError(f'Нет файла DB-объектов «{lexiconPath}» для схемы «{name}»!')
+  return Tenant(
+    name, database, CatalogManager(primitiveWords, database.SELECT, lexiconPath),
+    cacheBytes=settings.get('cacheBytes', MAX_BYTES),
+    subsumptionEntries=settings.get('subsumptionEntries', MAX_ENTRIES),
+    subsumptionRows=settings.get('subsumptionRows', MAX_ROWS),
+    resultSetBytes=settings.get('resultSetBytes', MAX_DISK_BYTES),
+    snapshotTables=settings.get('snapshotTables', [])
+  )
+
+# Loads the tenants (only the default one if there is no file).
+def loadTenants(path=TENANTS_PATH):
+  tenants = { DEFAULT_TENANT: Tenant(DEFAULT_TENANT, defaultDatabase, catalogs) }
+  if (os.path.exists(path)):
+    with open(path, encoding='utf-8') as file:
+      for (name, settings) in json.load(file).items():
+        tenants[name] = makeTenant(name, settings)
+  return tenants
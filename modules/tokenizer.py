@@ -0,0 +1,128 @@
+"""
+  tokenizer.py
+
+  In-process tokenizer for the closed vocabulary of the queries.
+  Almost all the words of the queries are names of DB objects, keywords of the patterns,
+  numbers, punctuation and quoted strings, so instead of calling Mystem the text is split here
+  and the words are looked up in a precomputed table (wordform -> lemma and grammar).
+  Mystem is called only for the texts containing words missing from the table.
+
+  The table is generated offline by running Mystem over the domain vocabulary and query logs:
+    python tokenizer.py queries.jsonl queries.txt ...
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+
+WORDFORMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wordforms.json')
+# Words which are not in the vocabulary get into the table if they occur in the logs at least this often.
+MIN_COUNT = 3
+# Number of texts passed to Mystem at once while building the table.
+BATCH_SIZE = 1000
+
+# Tokens as Mystem makes them: numbers, words (possibly hyphenated)
+# and runs of everything else (punctuation together with the whitespaces).
+tokenPattern = re.compile(r'(\d+)|([^\W\d_]+(?:-[^\W\d_]+)*)|([\W_]+)')
+cyrillicPattern = re.compile('[а-яё]', re.IGNORECASE)
+
+# Tokenizer with the table of known wordforms.
+class FastTokenizer:
+  def __init__(self, wordforms=None):
+    self.wordforms = wordforms if wordforms != None else {}
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+  # Loads the table of wordforms (an empty table if there is no file).
+  @staticmethod
+  def load(path=WORDFORMS_PATH):
+    if (not os.path.exists(path)): return FastTokenizer()
+    with open(path, encoding='utf-8') as file:
+      return FastTokenizer(json.load(file))
+
+  # Analyzes the text the same way as Mystem.analyze, returns None if the text has unknown words.
+  def analyze(self, text):
+    analyzed = []
+    for match in tokenPattern.finditer(text):
+      (number, word, other) = match.groups()
+      if (word != None):
+        analysis = self.wordforms.get(word.lower())
+        if (analysis != None):
+          (lemma, grammar) = analysis
+          analyzed.append({ 'text': word, 'analysis': [{ 'lex': lemma, 'gr': grammar }] })
+        elif (cyrillicPattern.search(word)):
+          with self.lock: self.misses += 1
+          return None
+        else:
+          # Mystem doesn't analyze non-Russian words.
+          analyzed.append({ 'text': word, 'analysis': [] })
+      else:
+        analyzed.append({ 'text': number if number != None else other })
+    analyzed.append({ 'text': '\n' })
+    with self.lock: self.hits += 1
+    return analyzed
+
+  # Share of the texts analyzed without Mystem.
+  def stats(self):
+    with self.lock:
+      total = self.hits + self.misses
+      return {
+        'wordforms': len(self.wordforms),
+        'hits': self.hits,
+        'misses': self.misses,
+        'hitRate': self.hits/total if total > 0 else None
+      }
+
+# Builds the table of wordforms from the vocabulary and the texts (analyzed by Mystem).
+def buildWordforms(mystem, vocabulary, texts):
+  # wordform -> { (lemma, grammar): count }
+  analyses = {}
+  counts = {}
+  texts = list(vocabulary) + list(texts)
+  for start in range(0, len(texts), BATCH_SIZE):
+    for token in mystem.analyze('\n'.join(texts[start:start + BATCH_SIZE])):
+      if (len(token.get('analysis', [])) == 0): continue
+      analysis = token['analysis'][0]
+      if (analysis.get('qual') == 'bastard'): continue
+      wordform = token['text'].strip().lower()
+      key = (analysis['lex'], analysis.get('gr', ''))
+      analyses.setdefault(wordform, {})
+      analyses[wordform][key] = analyses[wordform].get(key, 0) + 1
+      counts[wordform] = counts.get(wordform, 0) + 1
+  wordforms = {}
+  for (wordform, variants) in analyses.items():
+    # Mystem's choice depends on the context, the most frequent one is taken.
+    (lemma, grammar) = max(variants, key = lambda key: variants[key])
+    if (lemma in vocabulary or counts[wordform] >= MIN_COUNT):
+      wordforms[wordform] = [lemma, grammar]
+  return wordforms
+
+# Reads the texts of the queries from a JSONL (the query field) or a text file.
+def readTexts(path):
+  with open(path, encoding='utf-8') as file:
+    for line in file:
+      line = line.strip()
+      if (line.startswith('{')):
+        query = json.loads(line).get('query')
+        if (isinstance(query, str)): yield query
+      elif (line != ''):
+        yield line
+
+if __name__ == '__main__':
+  from pymystem3 import Mystem
+  from AbstractRegularExpressions import definedPrimitives
+  from dbObjects import loadDbObjects
+  import patterns
+  vocabulary = { lemma for obj in loadDbObjects()[0] for lemma in obj['lemmas'] }
+  vocabulary |= {
+    word for primitive in definedPrimitives if primitive.vocabulary
+    for word in primitive.vocabulary if word.isalpha()
+  }
+  texts = [text for path in sys.argv[1:] for text in readTexts(path)]
+  wordforms = buildWordforms(Mystem(), vocabulary, texts)
+  with open(WORDFORMS_PATH, 'w', encoding='utf-8') as file:
+    json.dump(wordforms, file, ensure_ascii=False, indent=0, sort_keys=True)
+  print(f'{len(wordforms)} wordforms are written into {WORDFORMS_PATH}')
@@ -0,0 +1,176 @@
+"""
+  translateLog.py
+
+  Offline translation of query logs.
+  Reads queries (JSONL with a query field or plain text, one query per line),
+  translates them on all the cores and writes JSONL with the SQL-code, errors and timings
+  (the queries crashing the parser or the translator are written with the crash status and counted):
+    python translateLog.py queries.jsonl -o translated.jsonl
+  With --previous the result is compared to a previous run and the summary of differences is printed:
+    python translateLog.py queries.jsonl -o new.jsonl --previous old.jsonl --summary diff.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+# Number of examples of each kind of difference put into the summary.
+EXAMPLES = 20
+
+parse = None
+translate = None
+
+# Loads the translator in a worker process.
+def initWorker():
+  global parse, translate
+  from asq import parse, translate
+
+# Result of a query crashing the parser or the translator.
+def crashResult(result, error):
+  result.update({ 'status': 'crash', 'message': f'{type(error).__name__}: {error}' })
+  return result
+
+# Translates one query, item is a tuple of the line number and the query.
+def translateItem(item):
+  (line, query) = item
+  result = { 'line': line, 'query': query, 'timings': {} }
+  start = time.perf_counter()
+  try:
+    parsed = parse(query)
+  except Exception as error:
+    result['timings']['parse'] = (time.perf_counter() - start)*1000
+    return crashResult(result, error)
+  parsedTime = time.perf_counter()
+  result['timings']['parse'] = (parsedTime - start)*1000
+  if (parsed['status'] == 'error'):
+    result.update({ 'status': 'error', 'message': parsed['message'] })
+    return result
+  try:
+    translated = translate(parsed)
+  except Exception as error:
+    result['timings']['translate'] = (time.perf_counter() - parsedTime)*1000
+    return crashResult(result, error)
+  result['timings']['translate'] = (time.perf_counter() - parsedTime)*1000
+  if (translated['status'] == 'error'):
+    result.update({ 'status': 'error', 'message': translated['message'] })
+  else:
+    result.update({ 'status': 'success', 'sql': translated['result'], 'binds': translated['binds'] })
+  return result
+
+# Reads the queries from the file (lazily), field is the query's field in JSONL.
+def readQueries(file, field):
+  for (line, text) in enumerate(file, 1):
+    text = text.strip()
+    if (text == ''): continue
+    if (text.startswith('{')):
+      try:
+        query = json.loads(text).get(field)
+      except ValueError:
+        query = text
+      if (not isinstance(query, str)): continue
+    else:
+      query = text
+    yield (line, query)
+
+# Reads a previous run (query -> result).
+def readPrevious(path):
+  previous = {}
+  with open(path, encoding='utf-8') as file:
+    for text in file:
+      if (text.strip() == ''): continue
+      result = json.loads(text)
+      previous[result['query']] = result
+  return previous
+
+# Percentile of the sorted values.
+def percentile(values, p):
+  if (len(values) == 0): return None
+  return values[min(len(values) - 1, int(len(values)*p))]
+
+# Collects the statistics of the run and it's differences from the previous run.
+class Summary:
+  def __init__(self, previous=None):
+    self.previous = previous
+    self.counts = { 'total': 0, 'success': 0, 'error': 0, 'crash': 0 }
+    self.differences = { 'changed': [], 'newErrors': [], 'newCrashes': [], 'fixed': [], 'new': [] }
+    self.differenceCounts = { kind: 0 for kind in self.differences }
+    self.errors = {}
+    self.crashes = {}
+    self.times = []
+
+  def add(self, result):
+    self.counts['total'] += 1
+    self.counts[result['status']] += 1
+    self.times.append(sum(result['timings'].values()))
+    if (result['status'] == 'error'):
+      self.errors[result['message']] = self.errors.get(result['message'], 0) + 1
+    if (result['status'] == 'crash'):
+      self.crashes[result['message']] = self.crashes.get(result['message'], 0) + 1
+    if (self.previous == None): return
+    old = self.previous.get(result['query'])
+    if (old == None): kind = 'new'
+    elif (old['status'] != 'crash' and result['status'] == 'crash'): kind = 'newCrashes'
+    elif (old['status'] == 'success' and result['status'] == 'error'): kind = 'newErrors'
+    elif (old['status'] != 'success' and result['status'] == 'success'): kind = 'fixed'
+    elif (result['status'] == 'success' and (old['sql'], old['binds']) != (result['sql'], result['binds'])):
+      kind = 'changed'
+    else: return
+    self.differenceCounts[kind] += 1
+    if (len(self.differences[kind]) < EXAMPLES):
+      self.differences[kind].append({ 'query': result['query'], 'old': old, 'new': result })
+
+  def result(self):
+    times = sorted(self.times)
+    summary = {
+      'counts': self.counts,
+      'errors': self.errors,
+      'crashes': self.crashes,
+      'timings': {
+        'p50': percentile(times, 0.5),
+        'p95': percentile(times, 0.95),
+        'p99': percentile(times, 0.99),
+        'max': times[-1] if len(times) > 0 else None
+      }
+    }
+    if (self.previous != None):
+      summary['differences'] = self.differenceCounts
+      summary['examples'] = self.differences
+    return summary
+
+def main():
+  argsParser = argparse.ArgumentParser(description='Translates a log of queries in Russian language to SQL.')
+  argsParser.add_argument('input', help='JSONL or text file with the queries («-» for stdin)')
+  argsParser.add_argument('-o', '--output', default='-', help='JSONL file for the results («-» for stdout)')
+  argsParser.add_argument('--field', default='query', help='field of the query in JSONL')
+  argsParser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='number of processes')
+  argsParser.add_argument('--chunk', type=int, default=64, help='number of queries sent to a process at once')
+  argsParser.add_argument('--unordered', action='store_true', help='write the results as soon as they are ready')
+  argsParser.add_argument('--previous', help='results of a previous run to compare with')
+  argsParser.add_argument('--summary', help='JSON file for the summary (it\'s printed to stderr otherwise)')
+  args = argsParser.parse_args()
+
+  summary = Summary(readPrevious(args.previous) if args.previous else None)
+  inputFile = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+  outputFile = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+  start = time.perf_counter()
+  with multiprocessing.Pool(args.workers, initializer=initWorker) as pool:
+    results = (pool.imap_unordered if args.unordered else pool.imap)(
+      translateItem, readQueries(inputFile, args.field), args.chunk
+    )
+    for result in results:
+      outputFile.write(json.dumps(result, ensure_ascii=False) + '\n')
+      summary.add(result)
+  outputFile.flush()
+
+  result = summary.result()
+  result['seconds'] = time.perf_counter() - start
+  if (args.summary):
+    with open(args.summary, 'w', encoding='utf-8') as file:
+      json.dump(result, file, ensure_ascii=False, indent=2)
+  else:
+    print(json.dumps(result, ensure_ascii=False, indent=2), file=sys.stderr)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,155 @@
+"""
+  warmup.py
+
+  Warm-up of a new worker, the worker reports ready (/health/ready) when it's over.
+  The most frequent recent queries are read from the query logs (JSONL with a query field, such as the slow log,
+  or plain text, one query per line) and parsed and translated with the catalogs of their tenants,
+  which starts Mystem and runs the automatas, the tokenizer and the fuzzy index on the real queries.
+  Then the connections of the pools are opened and (if prepare is set) the SQL-code of the queries
+  is parsed by the database on every connection.
+  The slow log (the default source) has only the slow requests and a sample of the others (see slowlog.py),
+  so the queries counted there are skewed towards the slow ones: point ASQ_WARMUP_LOGS at a log
+  of all the requests to warm up on the really frequent ones.
+  A query or a tenant failing to warm up is counted in errors and skipped.
+  The warm-up stops when the time budget runs out, the settings are taken from the environment:
+    ASQ_WARMUP_LOGS — the logs (separated by os.pathsep, the slow log by default),
+    ASQ_WARMUP_BUDGET — seconds, ASQ_WARMUP_QUERIES — number of the queries, ASQ_WARMUP_PREPARE — parse the SQL-code.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from asq import parse, translate
+from slowlog import LOG_PATH, BACKUP_COUNT
+from tenants import DEFAULT_TENANT
+
+# The logs (the older ones first) and the settings.
+LOG_PATHS = (
+  os.environ['ASQ_WARMUP_LOGS'].split(os.pathsep) if os.environ.get('ASQ_WARMUP_LOGS')
+  else [f'{LOG_PATH}.{i}' for i in range(BACKUP_COUNT, 0, -1)] + [LOG_PATH]
+)
+BUDGET = float(os.environ.get('ASQ_WARMUP_BUDGET', 30))
+QUERIES = int(os.environ.get('ASQ_WARMUP_QUERIES', 200))
+PREPARE = os.environ.get('ASQ_WARMUP_PREPARE', '') not in ['', '0']
+# Only the last lines of the logs are counted.
+RECENT_LINES = 100000
+
+# Reads the most frequent of the recent queries from the logs (the missing ones are skipped),
+# returns a list of (tenant, query) pairs, the most frequent first.
+def readFrequentQueries(paths=LOG_PATHS, limit=QUERIES, recentLines=RECENT_LINES):
+  lines = deque(maxlen=recentLines)
+  for path in paths:
+    if (not os.path.exists(path)): continue
+    with open(path, encoding='utf-8', errors='replace') as file:
+      lines.extend(file)
+  counter = Counter()
+  for text in lines:
+    text = text.strip()
+    if (text == ''): continue
+    if (text.startswith('{')):
+      try:
+        entry = json.loads(text)
+      except ValueError:
+        continue
+      (tenant, query) = (entry.get('tenant') or DEFAULT_TENANT, entry.get('query'))
+      if (not isinstance(query, str)): continue
+    else:
+      (tenant, query) = (DEFAULT_TENANT, text)
+    counter[(tenant, ' '.join(query.split()))] += 1
+  return [item for (item, count) in counter.most_common(limit)]
+
+# Warm-up of the tenants (see the module's description).
+class Warmup:
+  def __init__(self, tenants, paths=LOG_PATHS, budget=BUDGET, limit=QUERIES, prepare=PREPARE):
+    self.tenants = tenants
+    self.paths = paths
+    self.budget = budget
+    self.limit = limit
+    self.prepare = prepare
+    self.ready = threading.Event()
+    self.started = None
+    self.finished = None
+    self.queries = 0
+    self.translated = 0
+    self.errors = 0
+    self.connections = 0
+    self.prepared = 0
+    self.timedOut = False
+    self.lastError = None
+
+  # Runs the warm-up, the worker is ready afterwards even if it has failed.
+  def run(self):
+    self.started = time.time()
+    deadline = time.monotonic() + self.budget
+    try:
+      statements = {}
+      for (name, query) in readFrequentQueries(self.paths, self.limit):
+        if (time.monotonic() > deadline):
+          self.timedOut = True
+          break
+        tenant = self.tenants.get(name)
+        if (tenant == None): continue
+        self.waitForSnapshot(tenant, deadline)
+        self.queries += 1
+        try:
+          parsed = parse(query, tenant.catalogs.current)
+          if (parsed['status'] == 'error'):
+            self.errors += 1
+            continue
+          local = tenant.snapshot.covers([t.name for t in parsed['result'].tables])
+          translated = translate(parsed, 'sqlite' if local else 'oracle')
+        except Exception as error:
+          self.errors += 1
+          self.lastError = str(error)
+          continue
+        if (translated['status'] == 'error'):
+          self.errors += 1
+          continue
+        self.translated += 1
+        if (not local): statements.setdefault(name, []).append(translated['result'])
+      for (name, tenant) in self.tenants.items():
+        if (time.monotonic() > deadline):
+          self.timedOut = True
+          break
+        try:
+          (connections, prepared) = tenant.database.warm(statements.get(name, []) if self.prepare else [], deadline)
+        except Exception as error:
+          self.errors += 1
+          self.lastError = f'{name}: {error}'
+          continue
+        self.connections += connections
+        self.prepared += prepared
+    except Exception as error:
+      self.lastError = str(error)
+    finally:
+      self.finished = time.time()
+      self.ready.set()
+
+  # Waits (until the deadline) for the first copy of the tenant's snapshot,
+  # so the queries are translated for the engine they will be executed by.
+  def waitForSnapshot(self, tenant, deadline):
+    snapshot = tenant.snapshot
+    while (len(snapshot.tables) > 0 and snapshot.refreshed == None and time.monotonic() < deadline):
+      time.sleep(0.05)
+
+  # Runs the warm-up in a background thread.
+  def start(self):
+    threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+  # Whether the warm-up is over and it's results.
+  def stats(self):
+    return {
+      'ready': self.ready.is_set(),
+      'started': self.started,
+      'duration': self.finished - self.started if self.finished != None else None,
+      'budget': self.budget,
+      'queries': self.queries,
+      'translated': self.translated,
+      'errors': self.errors,
+      'connections': self.connections,
+      'prepared': self.prepared,
+      'timedOut': self.timedOut,
+      'lastError': self.lastError
+    }